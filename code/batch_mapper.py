@@ -0,0 +1,356 @@
+#!python
+"""Builds global confidence maps of a recorded run offline on a process pool.
+The run is split into consecutive shards. Each shard composes its updates of
+a map into a per-pixel function clip(a * x + c, lo, hi), and the functions of
+the shards are composed in order, giving the maps of sequential processing"""
+
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+import cv2
+
+import classifiers
+import map_metrics
+import perception
+import replay
+import run_log
+import transformations
+from rover_state import RoverState
+
+# Frames, classified and warped into the top view by single calls
+DEFAULT_BATCH_SIZE = 4
+
+# Limits of global confidence values, see perception.update_global()
+CONF_LIMIT = 255.0
+
+
+class ClampAffine:
+    """Per-pixel map update x -> clip(a * x + c, lo, hi) with the same a > 0
+    for all the pixels. Such updates are monotonic, so their composition is
+    again an update of the same form"""
+
+    def __init__(self, shape):
+        self.factor = 1.0
+        self.offset = np.zeros(shape)
+        self.low = np.full(shape, -np.inf)
+        self.high = np.full(shape, np.inf)
+
+
+    def accumulate(self, values, window, low, high):
+        """Follows the update with x -> clip(x + values, low, high) in the
+        window (x0, y0, x1, y1), like update_global() does"""
+
+        x_0, y_0, x_1, y_1 = window
+
+        self.offset[y_0:y_1, x_0:x_1] += values
+
+        for bound in (self.low, self.high):
+            bound_window = bound[y_0:y_1, x_0:x_1]
+            bound_window += values
+            np.clip(bound_window, low, high, out=bound_window)
+
+
+    def scale(self, factor):
+        """Follows the update with x -> factor * x, like decay_rocks() does"""
+
+        self.factor *= factor
+        self.offset *= factor
+        self.low *= factor
+        self.high *= factor
+
+
+    def then(self, other):
+        """Returns the update, applying self and then other"""
+
+        result = ClampAffine(self.offset.shape)
+
+        result.factor = other.factor * self.factor
+        result.offset = other.factor * self.offset + other.offset
+        result.low = np.clip(
+            other.factor * self.low + other.offset,
+            other.low,
+            other.high)
+        result.high = np.clip(
+            other.factor * self.high + other.offset,
+            other.low,
+            other.high)
+
+        return result
+
+
+    def apply(self, global_map):
+        """Returns the updated global map"""
+
+        return np.clip(
+            self.factor * global_map + self.offset,
+            self.low,
+            self.high)
+
+
+def classify_batch(classes, imgs):
+    """Classifies visible pixels of a batch of frames with a single call per
+    class, like classify_visible() does for one frame. Returns H x W x C
+    scores, which channel c * len(classes) + k is the class k of the frame c"""
+
+    count = len(imgs)
+    pixels = imgs.reshape(count, -1, 3)[:, transformations.TOP_SOURCE_IDX]
+
+    scores = np.zeros((
+        imgs.shape[1] * imgs.shape[2],
+        count * len(classes)))
+
+    for idx, cls in enumerate(classes):
+        scores[transformations.TOP_SOURCE_IDX, idx::len(classes)] = \
+            cls.predict_pixels(pixels.reshape(-1, 3)).reshape(count, -1).T
+
+    return scores.reshape(imgs.shape[1:3] + (-1,))
+
+
+def perspective_batch(scores):
+    """Transforms channels of scores into the top view with a single warp,
+    like perspective_2_top() does for one channel"""
+
+    warped = cv2.warpPerspective(
+        scores,
+        transformations.PERSPECTIVE_2_TOP,
+        (transformations.TOP_WIDTH, transformations.TOP_HEIGHT))
+
+    warped = warped.reshape(warped.shape[:2] + (-1,))
+    warped[transformations.TOP_CENTER_Y:, :] = 0
+
+    return warped
+
+
+def map_frames(records, frames, shape, batch_size=DEFAULT_BATCH_SIZE):
+    """Returns (navi, rocks) ClampAffine updates of the frames, which records
+    are valid and aligned to the ground"""
+
+    updates = (ClampAffine(shape), ClampAffine(shape))
+    classes = (classifiers.NAVI, classifiers.ROCKS)
+
+    mapped = [
+        (record, img) for record, img in zip(records, frames)
+        if replay.is_valid_record(record) and perception.is_aligned_to_ground(
+            record.pitch, record.roll)]
+
+    for start in range(0, len(mapped), batch_size):
+        batch = mapped[start:start + batch_size]
+
+        tops = perspective_batch(classify_batch(
+            classes,
+            np.stack([img for _, img in batch])))
+
+        for idx, (record, _) in enumerate(batch):
+            loc_2_glob = transformations.local_2_global(
+                record.xpos,
+                record.ypos,
+                record.yaw)
+
+            # Both maps of the frame are warped at once in the window of
+            # their joint footprint. Zeros, added outside of the footprint
+            # of one map, leave it unchanged
+            channels = len(classes)
+            local_maps = tops[:, :, idx * channels:(idx + 1) * channels]
+
+            window = transformations.footprint_window(
+                loc_2_glob,
+                np.logical_or(local_maps[:, :, 0], local_maps[:, :, 1]),
+                shape)
+
+            if window is not None:
+                values = transformations.warp_affine_window(
+                    local_maps,
+                    loc_2_glob,
+                    window)
+
+                for channel, update in enumerate(updates):
+                    update.accumulate(
+                        values[:, :, channel],
+                        window,
+                        -CONF_LIMIT,
+                        CONF_LIMIT)
+
+            updates[1].scale(perception.ROCKS_DECAY)
+
+    return updates
+
+
+def read_records(log_path):
+    """Returns all records of robot_log.csv or of a binary run log"""
+
+    if run_log.is_run_log(log_path):
+        log = run_log.RunLog(log_path)
+        return [log.record(idx) for idx in range(len(log))]
+
+    return replay.read_log(log_path)
+
+
+def map_shard(task):
+    """Maps frames [start, stop) of the log in a worker process"""
+
+    log_path, start, stop, shape, batch_size = task
+
+    if run_log.is_run_log(log_path):
+        frames = run_log.RunLog(log_path).frames(start, stop)
+    else:
+        frames = replay.FramePrefetcher(replay.read_log(log_path)[start:stop])
+
+    records, imgs = zip(*frames)
+    return map_frames(records, imgs, shape, batch_size)
+
+
+def build_maps(
+        log_path,
+        processes=None,
+        shape=(200, 200),
+        batch_size=DEFAULT_BATCH_SIZE):
+    """Returns global navigable and rocks confidence maps of the run, mapped
+    in as many shards as processes, cpu_count() by default"""
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    count = len(read_records(log_path))
+    bounds = np.linspace(0, count, processes + 1).astype(int)
+
+    tasks = [
+        (log_path, start, stop, shape, batch_size)
+        for start, stop in zip(bounds[:-1], bounds[1:]) if start < stop]
+
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            updates = pool.map(map_shard, tasks)
+    else:
+        updates = [map_shard(task) for task in tasks]
+
+    navi_update, rocks_update = updates[0]
+    for shard_navi, shard_rocks in updates[1:]:
+        navi_update = navi_update.then(shard_navi)
+        rocks_update = rocks_update.then(shard_rocks)
+
+    return navi_update.apply(np.zeros(shape)), rocks_update.apply(
+        np.zeros(shape))
+
+
+def sequential_maps(records, frames):
+    """Returns global confidence maps of frames, mapped one by one by the
+    functions of perception_step()"""
+
+    rover = RoverState()
+
+    for record, img in zip(records, frames):
+        if not replay.is_valid_record(record) or \
+            not perception.is_aligned_to_ground(record.pitch, record.roll):
+            continue
+
+        loc_2_glob = transformations.local_2_global(
+            record.xpos,
+            record.ypos,
+            record.yaw)
+
+        for cls, global_map in (
+                (classifiers.NAVI, rover.map.global_conf_navi),
+                (classifiers.ROCKS, rover.map.global_conf_rocks)):
+
+            perception.update_global(
+                loc_2_glob,
+                transformations.perspective_2_top(
+                    perception.classify_visible(cls, img)),
+                global_map)
+
+        perception.decay_rocks(rover.map)
+
+    return rover.map.global_conf_navi, rover.map.global_conf_rocks
+
+
+def main():
+    """Builds the maps of the run and reports mapped and fidelity figures"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        'log',
+        type=str,
+        nargs='?',
+        default=replay.DEFAULT_LOG,
+        help='Path to the robot_log.csv or the binary run log of the run')
+
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=None,
+        help='Number of worker processes and shards, all cores by default')
+
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help='Frames, classified and warped by single calls')
+
+    parser.add_argument(
+        '--worldmap',
+        type=str,
+        default='../output/batch_worldmap.png',
+        help='Path to save the worldmap image')
+
+    parser.add_argument(
+        '--compare',
+        action='store_true',
+        help='Also map the frames sequentially and compare the maps')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    navi, rocks = build_maps(
+        args.log,
+        args.processes,
+        batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+
+    records = read_records(args.log)
+
+    rover = RoverState()
+    rover.map.global_conf_navi = navi
+    rover.map.global_conf_rocks = rocks
+    rover.statistics.samples_pos = (
+        np.array([], np.int_),
+        np.array([], np.int_))
+    rover.statistics.samples_to_find = replay.DEFAULT_SAMPLES_TO_FIND
+    rover.time.total = records[-1].timestamp - records[0].timestamp
+
+    perception.update_worldmap(rover.statistics.worldmap, rover.map)
+    rover.statistics.metrics.recount(rover.statistics.worldmap)
+    rover.statistics.samples_index = map_metrics.SampleIndex(
+        rover.statistics.samples_pos,
+        rover.statistics.worldmap)
+
+    map_add, perc_mapped, fidelity = replay.render_worldmap(rover)
+    cv2.imwrite(
+        args.worldmap,
+        cv2.cvtColor(map_add.astype(np.uint8), cv2.COLOR_RGB2BGR))
+
+    print("Frames:   {}".format(len(records)))
+    print("Elapsed:  {:.2f} s, {:.1f} FPS".format(
+        elapsed, len(records) / elapsed))
+    print("Mapped:   {}%".format(perc_mapped))
+    print("Fidelity: {}%".format(fidelity))
+    print("Worldmap: {}".format(args.worldmap))
+
+    if args.compare:
+        start = time.perf_counter()
+        expected_navi, expected_rocks = sequential_maps(
+            records,
+            (img for _, img in replay.open_frames(args.log)))
+        elapsed = time.perf_counter() - start
+
+        print("Sequential: {:.2f} s, {:.1f} FPS".format(
+            elapsed, len(records) / elapsed))
+        print("Max difference: navi {:.3g}, rocks {:.3g}".format(
+            np.max(np.abs(navi - expected_navi)),
+            np.max(np.abs(rocks - expected_rocks))))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ from enum import Enum
 import random
 import numpy as np
 import transformations
+from tiled_map import max_value, read_window
 from behavior_tree_basic import Node, Result
 
 ROCKS_THRESHOLD = 7
@@ -32,9 +33,6 @@ class IsStuck(Node):
         return Result.Success
 
 
-IS_STUCK = IsStuck()
-
-
 class GetUnstuck(Node):
     """Performs random actions to unstuck from the collision"""
 
@@ -83,22 +81,16 @@ class GetUnstuck(Node):
         return Result.Continue
 
 
-GET_UNSTUCK = GetUnstuck()
-
-
 class AreRocksRevealed(Node):
     """Returns true if some rocks are detected in the map"""
 
     def _run(self, rover):
-        if np.max(rover.map.global_conf_rocks) > ROCKS_THRESHOLD:
+        if max_value(rover.map.global_conf_rocks) > ROCKS_THRESHOLD:
             return Result.Success
 
         return Result.Failure
 
 
-ARE_ROCKS_REVEALED = AreRocksRevealed()
-
-
 class IsRockPickable(Node):
     """Returns true if there is a close rock that can be picked"""
 
@@ -109,9 +101,6 @@ class IsRockPickable(Node):
         return Result.Failure
 
 
-IS_ROCK_PICKABLE = IsRockPickable()
-
-
 class IsAnyRockLeft(Node):
     """Returns true if some rock samples are still on the ground"""
 
@@ -124,9 +113,6 @@ class IsAnyRockLeft(Node):
         return Result.Failure
 
 
-IS_ANY_ROCK_LEFT = IsAnyRockLeft()
-
-
 class Goal(Enum):
     """Possible goal values for SetGoal node"""
     Explore = 0
@@ -150,28 +136,31 @@ class SetGoal(Node):
 
 
     def _run(self, rover):
+        # Goals cover the window of the cost map
+        x_0, y_0, x_1, y_1 = rover.decision.cost_window
+        global_conf_rocks = read_window(
+            rover.map.global_conf_rocks,
+            rover.decision.cost_window)
+
         if Goal.Explore == self.__goal:
             sigma = 3
-            value = rover.map.global_conf_rocks / sigma
+            value = global_conf_rocks / sigma
             v_sq = value * value
             goals = 255 * np.exp(-v_sq)
 
         elif Goal.Rock == self.__goal:
-            goals = 255 * (rover.map.global_conf_rocks > ROCKS_THRESHOLD)
+            goals = 255 * (global_conf_rocks > ROCKS_THRESHOLD)
 
         elif Goal.Home == self.__goal:
-            goals = np.zeros((rover.map.global_conf_rocks.shape))
-            goals[int(HOME_POS[1]), int(HOME_POS[0])] = 255
+            goals = np.zeros((global_conf_rocks.shape))
 
-        rover.decision.cost_map += goals
-        np.minimum(255, rover.decision.cost_map, out=rover.decision.cost_map)
+            home_x, home_y = int(HOME_POS[0]), int(HOME_POS[1])
+            if x_0 <= home_x < x_1 and y_0 <= home_y < y_1:
+                goals[home_y - y_0, home_x - x_0] = 255
 
-        return Result.Success
+        rover.decision.planner.set_goals(rover.decision, goals)
 
-
-SET_GOAL_EXPLORE = SetGoal(Goal.Explore)
-SET_GOAL_ROCK = SetGoal(Goal.Rock)
-SET_GOAL_HOME = SetGoal(Goal.Home)
+        return Result.Success
 
 
 def nav_angle(nav_dir):
@@ -197,7 +186,9 @@ class FollowGoal(Node):
         nav_dir_valid = np.linalg.norm(decision.nav_dir) >= 1e-1
         nav_pixels = decision.nav_pixels
 
-        if not nav_dir_valid or nav_pixels < 500:
+        if not nav_dir_valid or \
+            nav_pixels < transformations.scaled_pixels(500):
+
             return Result.Failure
 
         angle_deg = nav_angle(decision.nav_dir)
@@ -211,36 +202,34 @@ class FollowGoal(Node):
         return Result.Success
 
 
-FOLLOW_GOAL = FollowGoal()
-
-
 class SlowlyFollowRock(Node):
     """Slowly approaches very close rock"""
 
     def _run(self, rover):
         r_map = rover.map
 
-        rocks = (r_map.local_rocks > ROCKS_THRESHOLD).ravel()
-        if 0 == np.sum(rocks):
+        rocks = np.flatnonzero(r_map.local_rocks > ROCKS_THRESHOLD)
+        if 0 == len(rocks):
             return Result.Failure
 
-        all_distances = np.linalg.norm(
-            transformations.ROVER_CONF_POINTS,
-            axis=1)
-
-        rock_distances = all_distances[rocks]
+        rock_distances = transformations.ROVER_CONF_DIST[rocks]
         closest_idx = np.argmin(rock_distances)
         closest_rock_dist = rock_distances[closest_idx]
 
-        nav_dir = transformations.ROVER_CONF_DIRS[rocks][closest_idx]
+        nav_dir = transformations.ROVER_CONF_DIRS[rocks[closest_idx]]
+
+        # Only pixels near the rover may be on the way
+        near = transformations.NEAR_IDX
+        closer_pts = transformations.ROVER_CONF_DIST[near] < min(
+            closest_rock_dist - transformations.scaled_pixels(7, 1),
+            transformations.NEAR_DISTANCE)
 
-        closer_pts = all_distances < min(closest_rock_dist - 7, 30)
-        similar_dirs = transformations.ROVER_CONF_DIRS.dot(nav_dir) > 0.99
-        pts_on_the_way = np.logical_and(closer_pts, similar_dirs)
+        similar_dirs = transformations.ROVER_CONF_DIRS[near].dot(nav_dir)
+        pts_on_the_way = near[np.logical_and(closer_pts, similar_dirs > 0.99)]
 
-        if np.sum(pts_on_the_way) > 0:
+        if len(pts_on_the_way) > 0:
             obstacles = np.sum(r_map.local_navi.ravel()[pts_on_the_way] < -10)
-            if obstacles > 20:
+            if obstacles > transformations.scaled_pixels(20):
                 return Result.Failure
 
         angle_deg = nav_angle(nav_dir)
@@ -265,9 +254,6 @@ class SlowlyFollowRock(Node):
         return Result.Success
 
 
-SLOWLY_FOLLOW_ROCK = SlowlyFollowRock()
-
-
 class Rotate(Node):
     """Rotates the rover to target navigable pixels"""
 
@@ -279,7 +265,7 @@ class Rotate(Node):
         nav_pixels = decision.nav_pixels
 
         if nav_dir_valid:
-            if nav_pixels > 2000:
+            if nav_pixels > transformations.scaled_pixels(2000):
                 angle_deg = nav_angle(decision.nav_dir)
                 if not is_valid_nav_angle(angle_deg):
                     control.throttle = 0.0
@@ -296,9 +282,6 @@ class Rotate(Node):
         return Result.Success
 
 
-ROTATE = Rotate()
-
-
 class Stop(Node):
     """Stops the rover"""
 
@@ -327,9 +310,6 @@ class Stop(Node):
         return Result.Success
 
 
-STOP = Stop()
-
-
 class PickRock(Node):
     """Picks a rock sample from the ground"""
 
@@ -344,9 +324,6 @@ class PickRock(Node):
         return Result.Success
 
 
-PICK_ROCK = PickRock()
-
-
 class IsAtHomePoint(Node):
     """Checks if the rover is at home point, which is the middle of the map"""
 
@@ -360,4 +337,24 @@ class IsAtHomePoint(Node):
         return Result.Failure
 
 
-IS_AT_HOME_POINT = IsAtHomePoint()
+class Leaves:
+    """Leaf nodes of one behavior tree. Nodes keep state between frames, such
+    as GetUnstuck stage or Stop timer, so each tree needs its own instances"""
+
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+
+    def __init__(self):
+        self.is_stuck = IsStuck()
+        self.get_unstuck = GetUnstuck()
+        self.are_rocks_revealed = AreRocksRevealed()
+        self.is_rock_pickable = IsRockPickable()
+        self.is_any_rock_left = IsAnyRockLeft()
+        self.set_goal_explore = SetGoal(Goal.Explore)
+        self.set_goal_rock = SetGoal(Goal.Rock)
+        self.set_goal_home = SetGoal(Goal.Home)
+        self.follow_goal = FollowGoal()
+        self.slowly_follow_rock = SlowlyFollowRock()
+        self.rotate = Rotate()
+        self.stop = Stop()
+        self.pick_rock = PickRock()
+        self.is_at_home_point = IsAtHomePoint()
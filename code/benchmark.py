@@ -0,0 +1,511 @@
+#!python
+"""Times each stage of the perception hot path in isolation and the whole
+perception step on calibration images and replay frames, comparing the
+results with a stored baseline"""
+
+import argparse
+import base64
+import collections
+import copy
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# pylint: disable=import-error
+import cv2
+
+import classifiers
+import control
+import perception
+import replay
+import run_log
+import transformations
+from behavior_tree_rover import HOME_POS
+from rover_state import RoverState
+from supporting_functions import decode_image
+from tiled_map import TiledMap, read_window
+
+DEFAULT_BASELINE = '../output/benchmark_baseline.json'
+
+# Stages are only reported as regressions if both the relative and the
+# absolute slowdown of their median time exceed the thresholds
+DEFAULT_TOLERANCE = 0.2
+MIN_REGRESSION_MS = 0.05
+
+
+def calibration_frames():
+    """Returns calibration images as (record, img) frames, pretending that the
+    rover stands in the home position"""
+
+    paths = sorted(glob.glob('../calibration_images/example*.jpg'))
+
+    record = replay.LogRecord(
+        path=None,
+        timestamp=0.0,
+        steer=0.0,
+        throttle=0.0,
+        brake=0.0,
+        speed=0.0,
+        xpos=float(HOME_POS[0]),
+        ypos=float(HOME_POS[1]),
+        pitch=0.0,
+        yaw=0.0,
+        roll=0.0)
+
+    return [
+        (record._replace(path=path), replay.read_frame(path))
+        for path in paths]
+
+
+def replay_frames(log_path, count, warmup):
+    """Returns valid replay frames, evenly picked after the warmup records"""
+
+    if run_log.is_run_log(log_path):
+        # Images are views into the memory-mapped frames, read on access
+        frames = list(run_log.RunLog(log_path).frames())
+    else:
+        frames = [(record, None) for record in replay.read_log(log_path)]
+
+    frames = [
+        (record, img) for record, img in frames
+        if replay.is_valid_record(record)]
+
+    step = max(1, (len(frames) - warmup) // count)
+    picked = frames[warmup::step][:count]
+
+    return [
+        (record, replay.read_frame(record.path) if img is None else img)
+        for record, img in picked]
+
+
+def stage_functions(rover, img):
+    """Returns an ordered dictionary of callables, running each stage of
+    perception_step() in isolation on scratch copies of the rover maps"""
+
+    # pylint: disable=too-many-locals
+
+    r_map = rover.map
+    decision = rover.decision
+    pos = rover.perception.pos
+
+    loc_2_glob = transformations.local_2_global(
+        pos[0], pos[1], rover.perception.yaw_deg)
+
+    glob_2_loc = np.linalg.inv(np.vstack([loc_2_glob, [0.0, 0.0, 1.0]]))[:2, :]
+
+    rocks = classifiers.ROCKS.predict(img)
+    navi = classifiers.NAVI.predict(img)
+    rocks_top = transformations.perspective_2_top(rocks)
+    nav_top = transformations.perspective_2_top(navi)
+
+    scratch_map = RoverState().map
+    scratch_map.global_conf_navi = r_map.global_conf_navi.copy()
+    scratch_map.global_conf_rocks = r_map.global_conf_rocks.copy()
+
+    scratch_decision = copy.deepcopy(decision)
+
+    worldmap = rover.statistics.worldmap.copy()
+    vision_image = rover.statistics.vision_image.copy()
+
+    direction_map = perception.prepare_direction_map(
+        decision, r_map, glob_2_loc)
+
+    def whole_step():
+        rover.perception.img = img
+        perception.perception_step(rover)
+
+    return collections.OrderedDict([
+        ('classify_rocks', lambda: classifiers.ROCKS.predict(img)),
+        ('classify_navi', lambda: classifiers.NAVI.predict(img)),
+        ('classify_visible_rocks',
+         lambda: perception.classify_visible(classifiers.ROCKS, img)),
+        ('classify_visible_navi',
+         lambda: perception.classify_visible(classifiers.NAVI, img)),
+        ('perspective_rocks',
+         lambda: transformations.perspective_2_top(rocks)),
+        ('perspective_navi', lambda: transformations.perspective_2_top(navi)),
+        ('update_global_navi', lambda: perception.update_global(
+            loc_2_glob, nav_top, scratch_map.global_conf_navi)),
+        ('update_global_rocks', lambda: perception.update_global(
+            loc_2_glob, rocks_top, scratch_map.global_conf_rocks)),
+        ('decay_rocks', lambda: perception.decay_rocks(scratch_map)),
+        ('update_worldmap',
+         lambda: perception.update_worldmap(worldmap, scratch_map)),
+        ('update_cost_map', lambda: scratch_decision.planner.update(
+            scratch_decision,
+            read_window(r_map.global_conf_navi, decision.cost_window))),
+        ('prepare_direction_map', lambda: perception.prepare_direction_map(
+            decision, r_map, glob_2_loc)),
+        ('to_local_map', lambda: perception.to_local_map(
+            r_map.global_conf_rocks, glob_2_loc)),
+        ('navi_direction', lambda: control.navi_direction(direction_map)),
+        ('calc_nav_pixels', lambda: perception.calc_nav_pixels(
+            decision.nav_dir, r_map.local_navi)),
+        ('update_vision_image', lambda: perception.update_vision_image(
+            vision_image, direction_map, rocks_top)),
+        ('perception_step', whole_step),
+    ])
+
+
+def update_global_full(loc_2_glob, local_map, global_map):
+    """Reference update of the global map, warping the local map into the
+    whole global map"""
+
+    global_cur = cv2.warpAffine(
+        local_map,
+        loc_2_glob,
+        (global_map.shape[1], global_map.shape[0]))
+
+    global_map += global_cur
+    np.clip(global_map, -255.0, 255.0, out=global_map)
+
+
+def update_global_scaling(frames, sizes, repeat):
+    """Compares full, footprint-bounded and tiled global map updates for
+    growing map sizes, keeping the rover in the middle of the map"""
+
+    results = collections.OrderedDict()
+
+    for size in sizes:
+        full_times = []
+        window_times = []
+        tiled_times = []
+
+        for record, img in frames:
+            offset = 0.5 * (size - 200)
+            loc_2_glob = transformations.local_2_global(
+                record.xpos + offset, record.ypos + offset, record.yaw)
+
+            nav_top = transformations.perspective_2_top(
+                perception.classify_visible(classifiers.NAVI, img))
+
+            full_map = np.zeros((size, size))
+            window_map = np.zeros((size, size))
+            tiled_map = TiledMap()
+
+            full_times.append(1000.0 * time_call(
+                lambda: update_global_full(loc_2_glob, nav_top, full_map),
+                repeat))
+
+            window_times.append(1000.0 * time_call(
+                lambda: perception.update_global(
+                    loc_2_glob, nav_top, window_map),
+                repeat))
+
+            tiled_times.append(1000.0 * time_call(
+                lambda: perception.update_global(
+                    loc_2_glob, nav_top, tiled_map),
+                repeat))
+
+            if not np.array_equal(full_map, window_map):
+                raise AssertionError("Windowed update differs from full one")
+
+            tiled_dense = tiled_map.read((0, 0, size, size))
+            if not np.array_equal(full_map, tiled_dense):
+                raise AssertionError("Tiled update differs from full one")
+
+        results[str(size)] = {
+            'full_ms': float(np.median(full_times)),
+            'window_ms': float(np.median(window_times)),
+            'tiled_ms': float(np.median(tiled_times))}
+
+    return results
+
+
+def decode_opencv(img_string, out=None):
+    """Decodes a telemetry camera frame through OpenCV into RGB array, which
+    is written into out if it is given"""
+
+    jpeg_bytes = np.frombuffer(base64.b64decode(img_string), np.uint8)
+    return cv2.cvtColor(
+        cv2.imdecode(jpeg_bytes, cv2.IMREAD_COLOR),
+        cv2.COLOR_BGR2RGB,
+        dst=out)
+
+
+def allocated_bytes(function):
+    """Returns the peak of memory, allocated by function() through Python
+    and NumPy allocators"""
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak
+
+
+def decode_comparison(frames, repeat):
+    """Compares decoding of base64 JPEG telemetry frames through PIL, as
+    update_rover() does, with decoding through OpenCV into a reused buffer"""
+
+    pil_times = []
+    opencv_times = []
+    pil_bytes = []
+    opencv_bytes = []
+
+    for record, img in frames:
+        if os.path.isfile(record.path):
+            with open(record.path, 'rb') as frame_file:
+                jpeg_bytes = frame_file.read()
+        else:
+            # Frames of binary run logs are stored decoded
+            jpeg_bytes = cv2.imencode(
+                '.jpg',
+                cv2.cvtColor(img, cv2.COLOR_RGB2BGR))[1].tobytes()
+
+        img_string = base64.b64encode(jpeg_bytes).decode()
+        buffer = decode_opencv(img_string)
+
+        def decode_pil():
+            decode_image(base64.b64decode(img_string))
+
+        def decode_buffer():
+            decode_opencv(img_string, buffer)
+
+        if not np.array_equal(
+                decode_image(base64.b64decode(img_string)),
+                decode_opencv(img_string, buffer)):
+            raise AssertionError("OpenCV decoding differs from PIL one")
+
+        pil_times.append(1000.0 * time_call(decode_pil, repeat))
+        opencv_times.append(1000.0 * time_call(decode_buffer, repeat))
+
+        pil_bytes.append(allocated_bytes(decode_pil))
+        opencv_bytes.append(allocated_bytes(decode_buffer))
+
+    return {
+        'pil_ms': float(np.median(pil_times)),
+        'opencv_ms': float(np.median(opencv_times)),
+        'pil_bytes': int(np.median(pil_bytes)),
+        'opencv_bytes': int(np.median(opencv_bytes))}
+
+
+def time_call(function, repeat):
+    """Returns the best time of function() over repeat calls in seconds"""
+
+    best = np.inf
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def run_suite(name, frames, rover, repeat):
+    """Times all stages on each frame, returning a dictionary of
+    per-stage statistics in milliseconds"""
+
+    samples = collections.defaultdict(list)
+
+    for record, img in frames:
+        replay.populate_rover(rover, record, img, record.timestamp)
+        perception.perception_step(rover)
+
+        for stage, function in stage_functions(rover, img).items():
+            samples[stage].append(1000.0 * time_call(function, repeat))
+
+    return collections.OrderedDict(
+        (name + '/' + stage, {
+            'median_ms': float(np.median(times)),
+            'p95_ms': float(np.percentile(times, 95)),
+            'samples': len(times)})
+        for stage, times in samples.items())
+
+
+def warm_up(log_path, count):
+    """Runs the first replay frames through perception to fill the maps
+    with realistic confidence values"""
+
+    return replay.run_replay(replay.open_frames(log_path, count)).rover
+
+
+def compare(results, baseline, tolerance):
+    """Returns names of stages, which became slower than in the baseline"""
+
+    regressions = []
+
+    for stage, result in results.items():
+        if stage not in baseline:
+            continue
+
+        median = result['median_ms']
+        base_median = baseline[stage]['median_ms']
+
+        if median > base_median * (1.0 + tolerance) and \
+            median - base_median > MIN_REGRESSION_MS:
+
+            regressions.append(stage)
+
+    return regressions
+
+
+def print_table(results, baseline):
+    """Prints the stage timings next to the baseline ones"""
+
+    print("{:<36} {:>10} {:>10} {:>10} {:>8}".format(
+        "stage", "median ms", "p95 ms", "base ms", "ratio"))
+
+    for stage, result in results.items():
+        base = baseline.get(stage)
+        base_median = base['median_ms'] if base else np.nan
+
+        print("{:<36} {:>10.3f} {:>10.3f} {:>10.3f} {:>8.2f}".format(
+            stage,
+            result['median_ms'],
+            result['p95_ms'],
+            base_median,
+            result['median_ms'] / base_median))
+
+
+def print_scaling(scaling):
+    """Prints full, windowed and tiled global map update times by map size"""
+
+    print("{:>10} {:>10} {:>10} {:>10} {:>8}".format(
+        "map size", "full ms", "window ms", "tiled ms", "speedup"))
+
+    for size, result in scaling.items():
+        print("{:>10} {:>10.3f} {:>10.3f} {:>10.3f} {:>8.1f}".format(
+            size,
+            result['full_ms'],
+            result['window_ms'],
+            result['tiled_ms'],
+            result['full_ms'] / result['window_ms']))
+
+
+def print_decode(decode):
+    """Prints decoding time and allocations per frame"""
+
+    print("{:>10} {:>10} {:>14}".format("decode", "ms", "allocated KB"))
+    print("{:>10} {:>10.3f} {:>14.1f}".format(
+        "PIL", decode['pil_ms'], decode['pil_bytes'] / 1024.0))
+    print("{:>10} {:>10.3f} {:>14.1f}".format(
+        "OpenCV", decode['opencv_ms'], decode['opencv_bytes'] / 1024.0))
+
+
+def main():
+    """Runs the benchmark suite"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--log',
+        type=str,
+        default=replay.DEFAULT_LOG,
+        help='Path to the robot_log.csv or the binary run log of the '
+             'replay frames')
+
+    parser.add_argument(
+        '--frames',
+        type=int,
+        default=20,
+        help='Number of replay frames to time stages on')
+
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=100,
+        help='Number of replay frames to fill the maps before timing')
+
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Number of calls of each stage per frame')
+
+    parser.add_argument(
+        '--map-sizes',
+        type=int,
+        nargs='*',
+        default=[200, 400, 800, 1600],
+        help='Global map sizes to compare full and windowed map updates on')
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=None,
+        help='Path to save JSON results')
+
+    parser.add_argument(
+        '--baseline',
+        type=str,
+        default=DEFAULT_BASELINE,
+        help='Path to JSON baseline to compare the results with')
+
+    parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        help='Store the results as the new baseline')
+
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help='Relative slowdown of a stage median reported as a regression')
+
+    args = parser.parse_args()
+
+    # Without a baseline no regression could ever be reported
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(
+            "baseline {} does not exist, store one with --save-baseline"
+            .format(args.baseline))
+
+    warm_rover = warm_up(args.log, args.warmup)
+
+    results = collections.OrderedDict()
+    results.update(run_suite(
+        'calibration',
+        calibration_frames(),
+        copy.deepcopy(warm_rover),
+        args.repeat))
+
+    frames = replay_frames(args.log, args.frames, args.warmup)
+    results.update(run_suite('replay', frames, warm_rover, args.repeat))
+
+    report = {
+        'meta': {
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'warmup': args.warmup,
+            'repeat': args.repeat},
+        'stages': results,
+        'update_global_scaling': update_global_scaling(
+            frames, args.map_sizes, args.repeat),
+        'decode': decode_comparison(frames, args.repeat)}
+
+    baseline = {}
+    if not args.save_baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['stages']
+
+    print_table(results, baseline)
+    print_scaling(report['update_global_scaling'])
+    print_decode(report['decode'])
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("Regressions: " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
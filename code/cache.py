@@ -0,0 +1,81 @@
+#!python
+"""Keeps precomputed arrays on disk to shorten the startup time"""
+
+import hashlib
+import os
+import re
+import tempfile
+import numpy as np
+
+CACHE_FOLDER = '../cache'
+
+
+def sources_key(sources):
+    """Returns a hex digest of names, sizes and modification times of the
+    source files, which the cached arrays are derived from"""
+
+    digest = hashlib.sha1()
+
+    for path in sources:
+        stat = os.stat(path)
+        digest.update("{}:{}:{};".format(
+            os.path.basename(path), stat.st_size, stat.st_mtime_ns).encode())
+
+    return digest.hexdigest()
+
+
+def cached_arrays(name, sources, build, folder=CACHE_FOLDER):
+    """Returns a dictionary of arrays produced by build(), loading it from an
+    .npz file if none of the source files changed since it was saved"""
+
+    path = os.path.join(
+        folder,
+        "{}_{}.npz".format(name, sources_key(sources)))
+
+    if os.path.exists(path):
+        with np.load(path) as artifact:
+            return dict(artifact)
+
+    arrays = build()
+    os.makedirs(folder, exist_ok=True)
+    save_atomically(path, lambda file: np.savez(file, **arrays))
+
+    remove_stale(name, path, folder)
+
+    return arrays
+
+
+def save_atomically(path, save):
+    """Calls save() with a file object of a temporary file, unique to the
+    process, and moves the file to the path, so that concurrently started
+    processes never load or replace a partially written file"""
+
+    handle, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.',
+        suffix=os.path.splitext(path)[1])
+
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            save(file)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def remove_stale(name, path, folder=CACHE_FOLDER):
+    """Deletes files, cached under the name with other keys than the one of
+    the path"""
+
+    # Names of other arrays may start with the name, like transformations and
+    # transformations_scale0.5, so the whole file name is matched
+    pattern = re.compile(re.escape(name) + r"_[0-9a-f]{40}\.npz")
+    current = os.path.basename(path)
+
+    for file_name in os.listdir(folder):
+        if file_name != current and pattern.fullmatch(file_name):
+            try:
+                os.remove(os.path.join(folder, file_name))
+            except FileNotFoundError:
+                pass
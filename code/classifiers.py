@@ -1,113 +1,249 @@
 #!python
 """Machine learning classifiers of pixel colors"""
-import glob
+import hashlib
+import os
 import numpy as np
 
-# pylint: disable=import-error
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
-
-from sklearn.utils import shuffle
-from sklearn.naive_bayes import GaussianNB
-from sklearn.mixture import GaussianMixture
+import cache
 import images
 
+LUT_FOLDER = cache.CACHE_FOLDER
+MODEL_FOLDER = cache.CACHE_FOLDER
+MODEL_VERSION = 1
+DEFAULT_LUT_BITS = 6
+
+
+def calibration_hash():
+    """Returns a hex digest of the calibration images and the model format
+    version, identifying a unique set of fitted parameters"""
+
+    digest = hashlib.sha1(str(MODEL_VERSION).encode())
+
+    for img_path, mask in images.calibration_files():
+        for path in (img_path, mask):
+            digest.update(os.path.basename(path).encode())
+
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+
+    return digest.hexdigest()
+
+
+def load_parameters(key, folder=MODEL_FOLDER):
+    """Loads fitted classifier parameters from the cached artifact of the given
+    key, retraining and saving them if the artifact is missing"""
+
+    path = os.path.join(folder, "classifiers_{}.npz".format(key))
+
+    if os.path.exists(path):
+        with np.load(path) as artifact:
+            return dict(artifact)
+
+    # sklearn is only needed when the calibration set changes
+    import training
 
-def training_samples():
-    """Load all available training samples"""
-    masks = glob.glob('../calibration_images/*_mask.png')
+    params = training.fit_parameters()
+    os.makedirs(folder, exist_ok=True)
+    cache.save_atomically(
+        path,
+        lambda file: np.savez_compressed(file, **params))
 
-    result = []
-    for mask in masks:
-        img_path = mask.replace("_mask.png", ".jpg")
-        img = mpimg.imread(img_path)
-        label_img = mpimg.imread(mask)
+    return params
 
-        result.append((img, label_img))
 
-    return result
+def log_sum_exp(values):
+    """Numerically stable ln(sum(exp(values))) along the last axis"""
 
+    max_values = np.max(values, axis=1, keepdims=True)
+    return (max_values + np.log(
+        np.sum(np.exp(values - max_values), axis=1, keepdims=True)))[:, 0]
 
-TRAINING_SAMPLES = training_samples()
 
-NON_EMPTY = np.concatenate([
-    np.logical_or(
-        y[:, :, 0] != 0,
-        np.logical_or(
-            y[:, :, 1] != 0,
-            y[:, :, 2] != 0)).ravel() for _, y in TRAINING_SAMPLES])
+def mixture_score_samples(params, prefix, input_x):
+    """Returns ln p(x) of a Gaussian mixture with full covariances, matching
+    sklearn GaussianMixture.score_samples()"""
 
-TRAINING_X = np.concatenate([
-    x.reshape(-1, 3) for x, _ in TRAINING_SAMPLES])
+    weights = params[prefix + "_weights"]
+    means = params[prefix + "_means"]
+    precisions_chol = params[prefix + "_precisions_cholesky"]
 
-TRAINING_ROCKS = np.concatenate([
-    (y[:, :, 0] != 0).reshape(-1) for _, y in TRAINING_SAMPLES])
+    n_features = input_x.shape[1]
+    log_prob = np.empty((input_x.shape[0], len(weights)))
 
-TRAINING_NAVI = np.concatenate([
-    (y[:, :, 1] != 0).reshape(-1) for _, y in TRAINING_SAMPLES])
+    for idx, (mean, prec_chol) in enumerate(zip(means, precisions_chol)):
+        y_value = input_x.dot(prec_chol) - mean.dot(prec_chol)
+        log_det = np.sum(np.log(np.diag(prec_chol)))
 
-TRAINING_X, TRAINING_ROCKS, TRAINING_NAVI = shuffle(
-    TRAINING_X[NON_EMPTY],
-    TRAINING_ROCKS[NON_EMPTY],
-    TRAINING_NAVI[NON_EMPTY],
-    random_state=0)
+        log_prob[:, idx] = (
+            -0.5 * (n_features * np.log(2 * np.pi)
+                    + np.sum(np.square(y_value), axis=1))
+            + log_det)
+
+    return log_sum_exp(log_prob + np.log(weights))
 
 
 class ClassifierNavi:
     """Naive Bayesian classifier to determine if pixels are navigatable"""
 
-    # pylint: disable=too-few-public-methods
+    def __init__(self, params):
+        """Construct the navigatable pixels classifier from fitted
+        parameters"""
+
+        self.__theta = params["navi_theta"]
+        self.__var = params["navi_var"]
+
+        self.__log_norm = (
+            np.log(params["navi_class_prior"])
+            - 0.5 * np.sum(np.log(2.0 * np.pi * self.__var), axis=1))
 
-    def __init__(self):
-        """Construct the navigatable pixels classifier"""
-        self.__cls = GaussianNB()
-        self.__cls.fit(TRAINING_X, TRAINING_NAVI)
 
     def predict(self, img):
         """Returns ln p(color | navigatable) - ln p(color | obstacle)"""
-        scores = self.__cls.predict_log_proba(img.reshape(-1, 3))
-        return (scores[:, 1] - scores[:, 0]).reshape(img.shape[:2])
+        return self.predict_pixels(img.reshape(-1, 3)).reshape(img.shape[:2])
+
+
+    def predict_pixels(self, pixels):
+        """Returns scores of predict() for an array of N x 3 colors"""
+
+        input_x = pixels.astype(np.float64)
+
+        scores = np.empty((input_x.shape[0], 2))
+        for idx in range(2):
+            scores[:, idx] = self.__log_norm[idx] - 0.5 * np.sum(
+                np.square(input_x - self.__theta[idx]) / self.__var[idx],
+                axis=1)
+
+        return scores[:, 1] - scores[:, 0]
 
 
 class ClassifierRocks:
     """Gaussian Expected Maximization classifier to determine if pixels are
     rocks"""
 
-    # pylint: disable=too-few-public-methods
+    def __init__(self, params):
+        """Construct the rock pixels classifier from fitted parameters"""
+        self.__params = params
+
+
+    def predict(self, img):
+        """Returns ln p(color | rock) - ln p(color | not rock)"""
+        return self.predict_pixels(img.reshape(-1, 3)).reshape(img.shape[:2])
+
+
+    def predict_pixels(self, pixels):
+        """Returns scores of predict() for an array of N x 3 colors"""
+        input_x = pixels.astype(np.float64)
+
+        return (
+            mixture_score_samples(self.__params, "rocks", input_x)
+            - mixture_score_samples(self.__params, "not_rocks", input_x))
+
+
+class ClassifierLut:
+    """Quantized RGB lookup table, answering predict() of a slower classifier
+    with a single fancy-indexing gather"""
+
+    def __init__(self, cls, name, bits=DEFAULT_LUT_BITS, folder=LUT_FOLDER):
+        """Load the lookup table of cls from the folder or build and save it if
+        it is missing. bits is the number of bits per color channel"""
 
-    def __init__(self):
-        """Construct the rock pixels classifier"""
-        self.__cls = GaussianMixture(random_state=0).fit(
-            TRAINING_X[TRAINING_ROCKS])
+        if not 1 <= bits <= 8:
+            raise ValueError("bits must be in the range [1, 8]")
 
-        means_init = np.array([[0.0, 0.0, 0.0], [255.0, 255.0, 255.0]])
+        self.__cls = cls
+        self.__shift = 8 - bits
+        self.bits = bits
 
-        self.__not_cls = GaussianMixture(
-            2,
-            random_state=0,
-            means_init=means_init)
+        path = os.path.join(folder, "lut_{}_{}.npy".format(name, bits))
 
-        self.__not_cls.fit(TRAINING_X[~TRAINING_ROCKS])
+        if os.path.exists(path):
+            self.__table = np.load(path)
+        else:
+            self.__table = build_lut(cls, bits)
+            os.makedirs(folder, exist_ok=True)
+            cache.save_atomically(
+                path,
+                lambda file: np.save(file, self.__table))
 
 
     def predict(self, img):
-        """Returns ln p(color | rock) - ln p(color | not rock)"""
-        input_x = img.reshape(-1, 3)
+        """Returns the score of the wrapped classifier, quantized to the bin of
+        each pixel color. Falls back to the wrapped classifier if img is not
+        8-bit"""
+
+        if img.dtype != np.uint8:
+            return self.__cls.predict(img)
+
+        quantized = img >> self.__shift
+        return self.__table[
+            quantized[:, :, 0],
+            quantized[:, :, 1],
+            quantized[:, :, 2]]
+
+
+    def predict_pixels(self, pixels):
+        """Returns scores of predict() for an array of N x 3 colors"""
+
+        if pixels.dtype != np.uint8:
+            return self.__cls.predict_pixels(pixels)
 
-        score_diff = (
-            self.__cls.score_samples(input_x)
-            - self.__not_cls.score_samples(input_x))
+        quantized = pixels >> self.__shift
+        return self.__table[
+            quantized[:, 0],
+            quantized[:, 1],
+            quantized[:, 2]]
 
-        return score_diff.reshape(img.shape[:2])
 
+def build_lut(cls, bits):
+    """Evaluates cls in the centers of all color bins with the given number of
+    bits per channel"""
 
-ROCKS = ClassifierRocks()
-NAVI = ClassifierNavi()
+    bins = 1 << bits
+    step = 256 // bins
+    centers = np.arange(bins) * step + 0.5 * (step - 1)
+
+    green, blue = np.meshgrid(centers, centers, indexing='ij')
+    table = np.empty((bins, bins, bins))
+
+    # One red slice at a time to keep memory bounded for 8 bits per channel
+    for red_idx, red in enumerate(centers):
+        img = np.dstack((np.full_like(green, red), green, blue))
+        table[red_idx] = cls.predict(img)
+
+    return table
+
+
+MODEL_KEY = calibration_hash()
+MODEL_PARAMS = load_parameters(MODEL_KEY)
+
+ROCKS_EXACT = ClassifierRocks(MODEL_PARAMS)
+NAVI_EXACT = ClassifierNavi(MODEL_PARAMS)
+
+ROCKS = ROCKS_EXACT
+NAVI = NAVI_EXACT
+
+
+def use_lookup_tables(bits=DEFAULT_LUT_BITS):
+    """Switches ROCKS and NAVI into the quantized lookup table mode. bits=None
+    switches them back to the exact classifiers"""
+
+    # pylint: disable=global-statement
+    global ROCKS, NAVI
+
+    if bits is None:
+        ROCKS = ROCKS_EXACT
+        NAVI = NAVI_EXACT
+    else:
+        ROCKS = ClassifierLut(ROCKS_EXACT, "rocks_" + MODEL_KEY, bits)
+        NAVI = ClassifierLut(NAVI_EXACT, "navi_" + MODEL_KEY, bits)
 
 
 def main():
     """Shows results of what the module does if run as a separate application"""
 
+    # pylint: disable=import-error
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(12, 6))
     plt.subplot(221)
     plt.imshow(images.ROCK1)
@@ -1,8 +1,6 @@
 #!python
 """Routines to calculate some aspects of the robot control"""
 
-# pylint: disable=import-error
-import matplotlib.pyplot as plt
 import numpy as np
 import transformations
 import images
@@ -15,25 +13,29 @@ def navi_direction(navi_top_view):
 
     values = navi_top_view.reshape(-1)
 
-    dirs = transformations.ROVER_CONF_DIRS
-    angles = np.arctan2(dirs[:, 1], dirs[:, 0])
-
     # Ignore walls
     weights = np.copy(values)
     weights[weights < 0] = 0
 
-    hist, bin_edges = np.histogram(angles, 72, weights=weights)
+    hist = np.bincount(
+        transformations.ANGLE_BIN_IDX,
+        weights=weights,
+        minlength=transformations.ANGLE_BINS)
+
     hist_idx = np.argmax(hist)
 
+    bin_edges = transformations.ANGLE_BIN_EDGES
     angle = 0.5 * (bin_edges[hist_idx] + bin_edges[hist_idx + 1])
-    result = np.array([np.cos(angle), np.sin(angle)])
 
-    return result
+    return transformations.bin_direction(angle)
 
 
 def main():
     """Shows results of what the module does if run as a separate application"""
 
+    # pylint: disable=import-error
+    import matplotlib.pyplot as plt
+
     img = images.ROCK1
     img_top = transformations.perspective_2_top(img)
     img_navi = classifiers.NAVI.predict(img_top)
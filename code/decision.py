@@ -3,189 +3,184 @@
 
 from behavior_tree_basic import UntilFail, Not, Sequence, Selection
 
-from behavior_tree_rover import \
-    IS_STUCK, \
-    GET_UNSTUCK, \
-    ARE_ROCKS_REVEALED, \
-    IS_ROCK_PICKABLE, \
-    IS_ANY_ROCK_LEFT, \
-    SLOWLY_FOLLOW_ROCK, \
-    SET_GOAL_EXPLORE, \
-    SET_GOAL_ROCK, \
-    SET_GOAL_HOME, \
-    FOLLOW_GOAL, \
-    ROTATE, \
-    STOP, \
-    PICK_ROCK, \
-    IS_AT_HOME_POINT
+from behavior_tree_rover import Leaves
+
+
+class TreeNodes(Leaves):
+    """Leaves and subtrees, shared by several branches of one behavior tree"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        super().__init__()
+        self.loop_unstuck = loop_unstuck(self)
+        self.follow_goal_or_rotate = follow_goal_or_rotate(self)
 
 
 def create_behavior_tree():
-    """Create a Behavior Tree to control complex rover behavior"""
+    """Create a Behavior Tree to control complex rover behavior. Each call
+    returns new node instances, so that trees of several rovers do not share
+    their state"""
+
+    nodes = TreeNodes()
 
     sequence = Selection("Root")
-    sequence.append(take_all())
-    sequence.append(follow_home())
+    sequence.append(take_all(nodes))
+    sequence.append(follow_home(nodes))
 
     return sequence
 
 
-def loop_unstuck():
+def loop_unstuck(nodes):
     """Creates unstuck behavior"""
 
     sequence = Sequence("Unstuck")
-    sequence.append(IS_STUCK)
-    sequence.append(GET_UNSTUCK)
+    sequence.append(nodes.is_stuck)
+    sequence.append(nodes.get_unstuck)
 
     return UntilFail(sequence)
 
 
-LOOP_UNSTUCK = loop_unstuck()
-
-
-def follow_goal_or_rotate():
+def follow_goal_or_rotate(nodes):
     """Follows the goal and if no navigable pixels are available,
     turns around"""
 
     result = Selection("Follow Goal or Rotate")
-    result.append(FOLLOW_GOAL)
-    result.append(rotate_to_goal())
+    result.append(nodes.follow_goal)
+    result.append(rotate_to_goal(nodes))
     return result
 
 
-def rotate_to_goal():
+def rotate_to_goal(nodes):
     """Rotates the rover in the direction of goal"""
 
     result = Sequence("Rotate To Goal")
-    result.append(STOP)
-    result.append(ROTATE)
+    result.append(nodes.stop)
+    result.append(nodes.rotate)
 
     return result
 
 
-FOLLOW_GOAL_OR_ROTATE = follow_goal_or_rotate()
-
-
-def take_all():
+def take_all(nodes):
     """Create a subtree to search and collect rock samples"""
     sequence = Sequence("Take All Rocks")
 
-    sequence.append(IS_ANY_ROCK_LEFT)
-    sequence.append(explore_unstuck_take())
+    sequence.append(nodes.is_any_rock_left)
+    sequence.append(explore_unstuck_take(nodes))
 
     return sequence
 
 
-def explore_unstuck_take():
+def explore_unstuck_take(nodes):
     """Create a subtree to select between map exploration, unstucking and taking
     rocks"""
 
     result = Selection("Explore, Unstuck, Take")
-    result.append(LOOP_UNSTUCK)
-    result.append(take())
-    result.append(loop_explorer())
+    result.append(nodes.loop_unstuck)
+    result.append(take(nodes))
+    result.append(loop_explorer(nodes))
 
     return result
 
 
-def loop_explorer():
+def loop_explorer(nodes):
     """Create a subtree to explore the map until any rock is found"""
 
     sequence = Sequence("Explore")
 
-    sequence.append(Not(ARE_ROCKS_REVEALED))
-    sequence.append(SET_GOAL_EXPLORE)
-    sequence.append(FOLLOW_GOAL_OR_ROTATE)
+    sequence.append(Not(nodes.are_rocks_revealed))
+    sequence.append(nodes.set_goal_explore)
+    sequence.append(nodes.follow_goal_or_rotate)
 
     return sequence
 
 
-def take():
+def take(nodes):
     """Create a subtree to approach and take a rock"""
 
     result = Selection("Take Rock")
-    result.append(follow_rock_loop())
-    result.append(pick_up_rock())
+    result.append(follow_rock_loop(nodes))
+    result.append(pick_up_rock(nodes))
 
     return result
 
 
-def pick_up_rock():
+def pick_up_rock(nodes):
     """Picks up a rock if it is possible to do so"""
 
     result = Sequence("Pick Up Rock")
 
-    result.append(IS_ROCK_PICKABLE)
-    result.append(STOP)
-    result.append(PICK_ROCK)
+    result.append(nodes.is_rock_pickable)
+    result.append(nodes.stop)
+    result.append(nodes.pick_rock)
 
     return result
 
 
-def follow_rock_loop():
+def follow_rock_loop(nodes):
     """Create a subtree to run the loop, approaching a rock"""
 
     sequence = Sequence("Follow Rock Loop")
 
-    sequence.append(ARE_ROCKS_REVEALED)
-    sequence.append(Not(IS_ROCK_PICKABLE))
-    sequence.append(approach_or_follow_rock())
+    sequence.append(nodes.are_rocks_revealed)
+    sequence.append(Not(nodes.is_rock_pickable))
+    sequence.append(approach_or_follow_rock(nodes))
 
     return sequence
 
 
-def approach_or_follow_rock():
+def approach_or_follow_rock(nodes):
     """Makes a decision whether to approach or follow the rock"""
 
     selection = Selection("Approach or Follow Rock")
-    selection.append(SLOWLY_FOLLOW_ROCK)
-    selection.append(follow_rock())
+    selection.append(nodes.slowly_follow_rock)
+    selection.append(follow_rock(nodes))
 
     return selection
 
 
-def follow_rock():
+def follow_rock(nodes):
     """Follows the distant rock"""
 
     sequence = Sequence("Follow Rock")
 
-    sequence.append(SET_GOAL_ROCK)
-    sequence.append(FOLLOW_GOAL_OR_ROTATE)
+    sequence.append(nodes.set_goal_rock)
+    sequence.append(nodes.follow_goal_or_rotate)
 
     return sequence
 
 
-def follow_home():
+def follow_home(nodes):
     """Create a subtree to return home and get unstuck if the rover is stuck
     along the way"""
 
     result = Selection("Follow Home")
-    result.append(LOOP_UNSTUCK)
-    result.append(follow_home_loop())
+    result.append(nodes.loop_unstuck)
+    result.append(follow_home_loop(nodes))
 
     return result
 
 
-def follow_home_loop():
+def follow_home_loop(nodes):
     """Create a subtree to run the loop, returning home"""
 
     sequence = Sequence("Follow Home Loop")
 
-    sequence.append(Not(IS_STUCK))
-    sequence.append(Not(IS_ANY_ROCK_LEFT))
-    sequence.append(SET_GOAL_HOME)
-    sequence.append(FOLLOW_GOAL_OR_ROTATE)
-    sequence.append(stay_home_forever())
+    sequence.append(Not(nodes.is_stuck))
+    sequence.append(Not(nodes.is_any_rock_left))
+    sequence.append(nodes.set_goal_home)
+    sequence.append(nodes.follow_goal_or_rotate)
+    sequence.append(stay_home_forever(nodes))
 
     return sequence
 
 
-def stay_home_forever():
+def stay_home_forever(nodes):
     """If rover reaches the destination point, stay there forever"""
 
     sequence = Sequence("Stay Home Forever")
-    sequence.append(IS_AT_HOME_POINT)
-    sequence.append(STOP)
+    sequence.append(nodes.is_at_home_point)
+    sequence.append(nodes.stop)
 
     return UntilFail(sequence)
 
@@ -194,8 +189,9 @@ ROOT = create_behavior_tree()
 print(ROOT.dump())
 
 
-def decision_step(rover):
+def decision_step(rover, tree=ROOT):
     """Run decision, determining throttle, brake and steer commands based on
-    the output of the perception_step() function"""
-    ROOT.run(rover)
+    the output of the perception_step() function. Each rover needs its own
+    tree from create_behavior_tree()"""
+    tree.run(rover)
     return rover
@@ -5,191 +5,253 @@ import argparse
 import os
 import shutil
 import time
-from datetime import datetime
 
 #pylint: disable=import-error
 import eventlet
 import eventlet.wsgi
 import numpy as np
 import socketio
-from flask import Flask
+from flask import Flask, Response
 
-from decision import decision_step
+import classifiers
+import planners
+import precision
+from instrumentation import Instrumentation
+from decision import decision_step, create_behavior_tree
 
 # Import functions for perception and decision making
-from perception import perception_step
-from supporting_functions import update_rover, create_output_images
-from images import GROUND_TRUTH_3D
-from transformations import TOP_WIDTH, TOP_HEIGHT
+from perception import perception_step, use_scale
+from supporting_functions import update_rover, InsetCache
+from rover_state import RoverState
+from inset_renderer import InsetRenderer
+from recorder import FrameRecorder
+from scheduler import StageScheduler, parse_rates
 
 # Initialize socketio server and Flask application
 # (learn more at: https://python-socketio.readthedocs.io/en/latest/)
 SIO = socketio.Server()
+APP = Flask(__name__)
 
-# pylint: disable=too-few-public-methods
+# Stage timers and frame counters, served by /metrics endpoint
+METRICS = Instrumentation()
 
-class Perception():
-    """The class retains perception rover parameters"""
+# Options of rovers, set by command line arguments
+ROVER_OPTIONS = (None, precision.DEFAULT_PRECISION, 'value_iteration')
+INSET_RATE = None
+ASYNC_INSETS = False
 
-    def __init__(self):
-        self.img = None  # Current camera image
-        self.pos = None  # Current position (x, y)
-        self.yaw_deg = None  # Current yaw angle
-        self.pitch_deg = None  # Current pitch angle
-        self.roll_deg = None  # Current roll angle
-        self.vel = None  # Current velocity
-        self.near_sample = 0  # Will be set to telemetry data["near_sample"]
+# Latency budget of a telemetry frame in seconds and stage rates, see
+# scheduler.StageScheduler
+FRAME_BUDGET = None
+STAGE_RATES = {}
 
+IMAGE_FOLDER = ''
+PORT = 4567
 
-class Control():
-    """The class retains control rover parameters"""
+# Writes camera frames and robot_log.csv into IMAGE_FOLDER if it is set
+RECORDER = None
 
-    def __init__(self):
-        self.steer = 0  # Current steering angle
-        self.throttle = 0  # Current throttle value
-        self.brake = 0  # Current brake value
-        self.picking_up = False # Is the stone being picked up
-        self.send_pickup = False  # Set to True to trigger rock pickup
 
+class Session:
+    """Rover state, behavior tree and inset rendering of one simulator
+    connection"""
 
-class Decision():
-    """The class retains rover parameters for decision making"""
+    # pylint: disable=too-many-instance-attributes
 
-    def __init__(self):
-        self.nav_dir = None  # Angles of navigable terrain pixels
-        self.nav_pixels = None  # Number of navigatable pixels
-        self.mode = 'forward'  # Current mode (can be forward or stop)
-        self.cost_map = np.zeros((200, 200)).astype(np.float)
-        self.stuck_pos = None
-        self.stuck_time = None
+    def __init__(self, sid, records=False):
+        self.sid = sid
+        self.rover = RoverState(*ROVER_OPTIONS)
+        self.tree = create_behavior_tree()
 
+        # Renders insets only when they change, at most at the given rate
+        self.inset_cache = InsetCache(INSET_RATE)
 
-class Map():
-    """The class retains map data"""
+        # Renders insets on a background thread if set, otherwise they are
+        # rendered before each control reply
+        self.insets = None
+        if ASYNC_INSETS:
+            self.insets = InsetRenderer(
+                self.inset_cache.output_images,
+                METRICS)
 
-    def __init__(self):
-        self.global_conf_rocks = np.zeros((200, 200)).astype(np.float)
-        self.global_conf_navi = np.zeros((200, 200)).astype(np.float)
-        self.global_conf_cur = np.zeros((200, 200)).astype(np.float)
+        # Runs stages of each frame, shedding insets, cost map and vision
+        # image updates, which do not fit into FRAME_BUDGET
+        self.scheduler = StageScheduler(FRAME_BUDGET, STAGE_RATES, METRICS)
 
-        self.local_rocks = np.zeros((TOP_HEIGHT, TOP_WIDTH), dtype=np.float)
-        self.local_navi = np.zeros((TOP_HEIGHT, TOP_WIDTH), dtype=np.float)
+        # Insets of the last reply, sent again if rendering is shed
+        self.inset_strings = ('', '')
 
+        # Only one session at a time writes frames to RECORDER
+        self.records = records
 
-class Time():
-    """Timing information"""
+        # Variables to track frames per second (FPS)
+        self.frame_counter = 0
+        self.second_counter = time.time()
+        self.fps = 0
 
-    def __init__(self):
-        self.start = None  # To record the start time of navigation
-        self.total = None  # To record total duration of naviagation
+        self.__trace = ''
 
 
-class Statistics():
-    """The class retains statistics parameters for decision making"""
+    def count_frame(self):
+        """Does a rough calculation of frames per second (FPS)"""
 
-    def __init__(self):
-        self.samples_pos = None  # To store the actual sample positions
-        self.samples_to_find = 0  # To store the initial count of samples
-        self.samples_collected = 0  # To count the number of samples collected
+        self.frame_counter += 1
+        if (time.time() - self.second_counter) > 1:
+            self.fps = self.frame_counter
+            self.frame_counter = 0
+            self.second_counter = time.time()
 
-        self.vision_image = np.zeros((160, 320, 3), dtype=np.float)
-        self.worldmap = np.zeros((200, 200, 3), dtype=np.float)
-        self.ground_truth = GROUND_TRUTH_3D  # Ground truth worldmap
 
+    def print_trace(self):
+        """Prints the behavior tree trace whenever it changes"""
 
-class RoverState():
-    """The class retains all rover parameters"""
+        trace = self.tree.trace()
+        if trace != self.__trace:
+            print(self.rover.time.total, trace)
+            self.__trace = trace
 
-    def __init__(self):
-        self.perception = Perception()
-        self.control = Control()
-        self.decision = Decision()
-        self.map = Map()
-        self.time = Time()
-        self.statistics = Statistics()
 
+    def close(self):
+        """Stops background rendering of the session"""
 
-# Initialize our rover
-ROVER = RoverState()
+        if self.insets is not None:
+            self.insets.close()
 
-# Variables to track frames per second (FPS)
-# Intitialize frame counter
-FRAME_COUNTER = 0
-# Initalize second counter
-SECOND_COUNTER = time.time()
-FPS = None
-IMAGE_FOLDER = ''
+
+# Sessions of connected simulators by socket.io sid
+SESSIONS = {}
+
+
+def get_session(sid):
+    """Returns the session of the sid, starting it on the first call"""
+
+    session = SESSIONS.get(sid)
+
+    if session is None:
+        records = RECORDER is not None and not any(
+            other.records for other in SESSIONS.values())
+
+        session = Session(sid, records)
+        SESSIONS[sid] = session
+
+    return session
 
 
 @SIO.on('telemetry')
-def telemetry(_, data):
+def telemetry(sid, data):
     """Defines telemetry function for what to do with incoming data"""
 
-    # pylint: disable=global-statement
+    session = get_session(sid)
+    session.count_frame()
 
-    global FRAME_COUNTER, SECOND_COUNTER, FPS
-    FRAME_COUNTER += 1
-    # Do a rough calculation of frames per second (FPS)
-    if (time.time() - SECOND_COUNTER) > 1:
-        FPS = FRAME_COUNTER
-        FRAME_COUNTER = 0
-        SECOND_COUNTER = time.time()
-    #print("Current FPS: {}".format(FPS))
+    METRICS.set_gauge('sessions', len(SESSIONS))
+    METRICS.set_gauge('fps', sum(
+        other.fps for other in SESSIONS.values()))
 
     if data:
-        global ROVER
-        # Initialize / update rover with current telemetry
-        ROVER, image = update_rover(ROVER, data)
+        try:
+            with METRICS.timer('telemetry'):
+                process_telemetry(session, data)
+        except Exception:
+            METRICS.count('dropped')
+            raise
+    else:
+        METRICS.count('manual')
+        SIO.emit('manual', data={}, room=sid)
+
 
-        if np.isfinite(ROVER.perception.vel):
+def process_telemetry(session, data):
+    """Runs perception and decision steps on the telemetry and replies with
+    commands to the rover of the session. The control command is sent even
+    if the frame overruns its budget"""
 
-            # Execute the perception and decision steps to update the rover's
-            # state
-            ROVER = perception_step(ROVER)
-            ROVER = decision_step(ROVER)
+    scheduler = session.scheduler
+    scheduler.begin_frame()
 
-            # Create output images to send to server
-            out_image_string1, out_image_string2 = create_output_images(ROVER)
+    # Initialize / update rover with current telemetry
+    with METRICS.timer('update_rover'):
+        rover, jpeg_bytes = update_rover(session.rover, data)
 
-            # The action step!  Send commands to the ROVER!
+    if np.isfinite(rover.perception.vel):
+        METRICS.count('processed')
 
-            # Don't send both of these, they both trigger the simulator
-            # to send back new telemetry so we must only send one
-            # back in respose to the current telemetry data.
+        # Execute the perception and decision steps to update the rover's
+        # state
+        with METRICS.timer('perception_step'):
+            rover = perception_step(rover, scheduler)
 
-            # If in a state where want to pickup a rock send pickup command
-            if ROVER.control.send_pickup and not ROVER.control.picking_up:
-                send_pickup()
-                # Reset ROVER flags
-                ROVER.control.send_pickup = False
-            else:
-                # Send commands to the ROVER!
+        scheduler.run(
+            'decision_step',
+            lambda: decision_step(rover, session.tree),
+            critical=True)
 
-                commands = (
-                    ROVER.control.throttle,
-                    ROVER.control.brake,
-                    ROVER.control.steer)
+        session.rover = rover
+        session.print_trace()
 
-                send_control(commands, out_image_string1, out_image_string2)
+        # Create output images to send to server
+        if session.insets is None:
+            def render_insets():
+                session.inset_strings = \
+                    session.inset_cache.output_images(rover)
 
-        # In case of invalid telemetry, send null commands
+            scheduler.run('create_output_images', render_insets)
         else:
+            # The freshest insets, finished in the background
+            session.inset_strings = session.insets.latest()
+
+        out_image_string1, out_image_string2 = session.inset_strings
 
-            # Send zeros for throttle, brake and steer and empty images
-            send_control((0, 0, 0), '', '')
+        # The action step!  Send commands to the rover!
 
-        # To save camera images from autonomous driving, specify a path
-        # Example: $ python drive_rover.py image_folder_path
-        # Conditional to save image frame if folder was specified
+        # Don't send both of these, they both trigger the simulator
+        # to send back new telemetry so we must only send one
+        # back in respose to the current telemetry data.
+
+        # If in a state where want to pickup a rock send pickup command
+        if rover.control.send_pickup and not rover.control.picking_up:
+            send_pickup(session.sid)
+            # Reset rover flags
+            rover.control.send_pickup = False
+        else:
+            # Send commands to the rover!
 
-        global IMAGE_FOLDER
-        if IMAGE_FOLDER != '':
-            timestamp = datetime.utcnow().strftime('%Y_%m_%d_%H_%M_%S_%f')[:-3]
-            image_filename = os.path.join(IMAGE_FOLDER, timestamp)
-            image.save('{}.jpg'.format(image_filename))
+            commands = (
+                rover.control.throttle,
+                rover.control.brake,
+                rover.control.steer)
 
+            send_control(
+                commands,
+                out_image_string1,
+                out_image_string2,
+                session.sid)
+
+        # Render insets of this frame after the reply is sent
+        if session.insets is not None:
+            with METRICS.timer('submit_insets'):
+                session.insets.submit(rover)
+
+        export_inset_metrics()
+
+    # In case of invalid telemetry, send null commands
     else:
-        SIO.emit('manual', data={}, skip_sid=True)
+        METRICS.count('invalid')
+
+        # Send zeros for throttle, brake and steer and empty images
+        send_control((0, 0, 0), '', '', session.sid)
+
+    scheduler.end_frame()
+
+    # To save camera images from autonomous driving, specify a path
+    # Example: $ python drive_rover.py image_folder_path
+    # Queue image frame for the recorder if folder was specified
+
+    if session.records:
+        with METRICS.timer('record'):
+            RECORDER.record(jpeg_bytes, data)
+
+        METRICS.set_gauge('frames_recorded', RECORDER.written)
+        METRICS.set_gauge('frames_dropped', RECORDER.dropped)
 
 
 @SIO.on('connect')
@@ -197,17 +259,51 @@ def connect(sid, _):
     """Connects to simulator"""
 
     print("connect ", sid)
-    send_control((0, 0, 0), '', '')
+    get_session(sid)
+
+    send_control((0, 0, 0), '', '', sid)
     sample_data = {}
 
     SIO.emit(
         "get_samples",
         sample_data,
-        skip_sid=True)
+        room=sid)
+
+
+@SIO.on('disconnect')
+def disconnect(sid):
+    """Drops the session of the disconnected simulator"""
+
+    print("disconnect ", sid)
+
+    session = SESSIONS.pop(sid, None)
+    if session is not None:
+        session.close()
 
+    METRICS.set_gauge('sessions', len(SESSIONS))
 
-def send_control(commands, image_string1, image_string2):
-    """Sends commands to the Rover"""
+
+def export_inset_metrics():
+    """Exports inset counters and the time spent on drawing and encoding
+    insets of all sessions, comparable with the sum of telemetry stage
+    durations"""
+
+    caches = [session.inset_cache for session in SESSIONS.values()]
+
+    METRICS.set_gauge('insets_rendered', sum(
+        cache.rendered for cache in caches))
+    METRICS.set_gauge('insets_reused', sum(
+        cache.reused for cache in caches))
+    METRICS.set_gauge('insets_skipped', sum(
+        cache.skipped for cache in caches))
+    METRICS.set_gauge('inset_render_seconds', sum(
+        cache.render_seconds for cache in caches))
+    METRICS.set_gauge('inset_encode_seconds', sum(
+        cache.encode_seconds for cache in caches))
+
+
+def send_control(commands, image_string1, image_string2, sid):
+    """Sends commands to the Rover of the session"""
 
     # Define commands to be sent to the rover
     data = {
@@ -219,28 +315,44 @@ def send_control(commands, image_string1, image_string2):
     }
 
     # Send commands via socketIO server
-    SIO.emit(
-        "data",
-        data,
-        skip_sid=True)
+    with METRICS.timer('emit'):
+        SIO.emit(
+            "data",
+            data,
+            room=sid)
 
     eventlet.sleep(0)
 
 
-def send_pickup():
-    """Sends the "pickup" command to the Rover"""
+def send_pickup(sid):
+    """Sends the "pickup" command to the Rover of the session"""
 
     print("Picking up")
     pickup = {}
 
-    SIO.emit(
-        "pickup",
-        pickup,
-        skip_sid=True)
+    with METRICS.timer('emit'):
+        SIO.emit(
+            "pickup",
+            pickup,
+            room=sid)
 
     eventlet.sleep(0)
 
 
+@APP.route('/metrics')
+def metrics():
+    """Serves stage timers and frame counters in Prometheus text format"""
+
+    return Response(
+        METRICS.prometheus_text(),
+        mimetype='text/plain; version=0.0.4')
+
+
+def create_app():
+    """Wraps Flask application with socketio's middleware"""
+    return socketio.Middleware(SIO, APP)
+
+
 def main():
     """The method is called upon the module launch"""
 
@@ -251,12 +363,96 @@ def main():
         type=str,
         nargs='?',
         default='',
-        help='Path to image folder, where the images from the run are saved.'
+        help='Path to folder, where the images and robot_log.csv of the run '
+             'are saved for replay.'
+    )
+
+    parser.add_argument(
+        '--lut-bits',
+        type=int,
+        default=None,
+        help='Classify colors with lookup tables of the given number of bits '
+             'per channel instead of the exact classifiers.'
+    )
+
+    parser.add_argument(
+        '--planner',
+        type=str,
+        default='value_iteration',
+        choices=sorted(planners.PLANNERS),
+        help='Planner, filling the cost map towards the goals.'
+    )
+
+    parser.add_argument(
+        '--tile-size',
+        type=int,
+        default=None,
+        help='Keep global maps in sparse tiles of the given size instead of '
+             'dense 200x200 arrays. The cost map grows with explored tiles, '
+             'the worldmap covers the 200x200 ground truth.'
+    )
+
+    parser.add_argument(
+        '--precision',
+        type=str,
+        default=precision.DEFAULT_PRECISION,
+        choices=sorted(precision.PRECISIONS),
+        help='Storage precision of maps and images.'
+    )
+
+    parser.add_argument(
+        '--async-insets',
+        action='store_true',
+        help='Render inset images on a background thread and send the '
+             'freshest finished ones, not delaying control replies.'
+    )
+
+    parser.add_argument(
+        '--inset-rate',
+        type=float,
+        default=None,
+        help='Refresh inset images at most the given number of times per '
+             'second, reusing the previous ones in between.'
+    )
+
+    parser.add_argument(
+        '--budget-ms',
+        type=float,
+        default=None,
+        help='Latency budget of a telemetry frame. Inset rendering, cost map '
+             'and vision image updates, which do not fit into it, are shed.'
+    )
+
+    parser.add_argument(
+        '--rates',
+        type=str,
+        default='',
+        help='Comma-separated stage rates, like update_cost_map=3 for every '
+             'third frame or create_output_images=2hz.'
+    )
+
+    parser.add_argument(
+        '--scale',
+        type=float,
+        default=1.0,
+        help='Perception scale of camera images and the local top view '
+             'relative to the simulator camera.'
     )
     args = parser.parse_args()
 
+    if args.lut_bits is not None:
+        classifiers.use_lookup_tables(args.lut_bits)
+
+    use_scale(args.scale)
+
     # pylint: disable=global-statement
-    global IMAGE_FOLDER
+    global IMAGE_FOLDER, ROVER_OPTIONS, INSET_RATE, ASYNC_INSETS, RECORDER
+    global FRAME_BUDGET, STAGE_RATES
+    ROVER_OPTIONS = (args.tile_size, args.precision, args.planner)
+    INSET_RATE = args.inset_rate
+    ASYNC_INSETS = args.async_insets
+    FRAME_BUDGET = None if args.budget_ms is None else args.budget_ms / 1000.0
+    STAGE_RATES = parse_rates(args.rates)
     IMAGE_FOLDER = args.image_folder
 
     # os.system('rm -rf IMG_stream/*')
@@ -267,15 +463,19 @@ def main():
         else:
             shutil.rmtree(IMAGE_FOLDER)
             os.makedirs(IMAGE_FOLDER)
+        RECORDER = FrameRecorder(IMAGE_FOLDER)
         print("Recording this run ...")
     else:
         print("NOT recording this run ...")
 
-    # wrap Flask application with socketio's middleware
-    app = socketio.Middleware(SIO, Flask(__name__))
-
     # deploy as an eventlet WSGI server
-    eventlet.wsgi.server(eventlet.listen(('', 4567)), app)
+    try:
+        eventlet.wsgi.server(eventlet.listen(('', PORT)), create_app())
+    finally:
+        if RECORDER is not None:
+            RECORDER.close()
+            print("Recorded {} frames, dropped {}".format(
+                RECORDER.written, RECORDER.dropped))
 
 
 if __name__ == '__main__':
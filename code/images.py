@@ -1,20 +1,78 @@
 #!python
-"""Keeps calibration images loaded in memory for convenience"""
+"""Keeps calibration images and the ground truth map at hand for convenience"""
 
-#pylint: disable=import-error
-import matplotlib.image as mpimg
+import glob
+import os
 import numpy as np
 
-GRID = mpimg.imread('../calibration_images/example_grid1.jpg')
-HEIGHT, WIDTH = GRID.shape[:2]
+import cache
 
-ROCK1 = mpimg.imread('../calibration_images/example_rock1.jpg')
-ROCK1_LABEL = mpimg.imread('../calibration_images/example_rock1_mask.png')
+CALIBRATION_MASKS = '../calibration_images/*_mask.png'
 
-ROCK2 = mpimg.imread('../calibration_images/example_rock2.jpg')
-ROCK2_LABEL = mpimg.imread('../calibration_images/example_rock2_mask.png')
 
-GROUND_TRUTH = mpimg.imread('../calibration_images/map_bw.png')
+def calibration_files():
+    """Returns sorted (image, mask) path pairs of all color training samples"""
 
-GROUND_TRUTH_3D = np.dstack(
-    (GROUND_TRUTH * 0, GROUND_TRUTH * 255, GROUND_TRUTH * 0)).astype(np.float)
+    masks = sorted(glob.glob(CALIBRATION_MASKS))
+    return [(mask.replace("_mask.png", ".jpg"), mask) for mask in masks]
+
+
+CALIBRATION_FOLDER = '../calibration_images'
+
+# Calibration images, which are only read on the first access, since just
+# the demos and tests need them
+LAZY_IMAGES = {
+    'GRID': 'example_grid1.jpg',
+    'ROCK1': 'example_rock1.jpg',
+    'ROCK1_LABEL': 'example_rock1_mask.png',
+    'ROCK2': 'example_rock2.jpg',
+    'ROCK2_LABEL': 'example_rock2_mask.png',
+}
+
+GRID_PATH = os.path.join(CALIBRATION_FOLDER, LAZY_IMAGES['GRID'])
+GROUND_TRUTH_PATH = os.path.join(CALIBRATION_FOLDER, 'map_bw.png')
+
+
+def read_image(path):
+    """Decodes an image the same way matplotlib does"""
+
+    #pylint: disable=import-error
+    import matplotlib.image as mpimg
+
+    return mpimg.imread(path)
+
+
+def prepare_ground_truth():
+    """Decodes the camera frame size and the ground truth map"""
+
+    ground_truth = read_image(GROUND_TRUTH_PATH)
+
+    return {
+        'frame_shape': np.array(read_image(GRID_PATH).shape[:2]),
+        'ground_truth': ground_truth,
+        'ground_truth_3d': np.dstack(
+            (ground_truth * 0,
+             ground_truth * 255,
+             ground_truth * 0)).astype(np.float)}
+
+
+GROUND_TRUTH_ARRAYS = cache.cached_arrays(
+    'images',
+    [GRID_PATH, GROUND_TRUTH_PATH, __file__],
+    prepare_ground_truth)
+
+HEIGHT, WIDTH = (int(size) for size in GROUND_TRUTH_ARRAYS['frame_shape'])
+GROUND_TRUTH = GROUND_TRUTH_ARRAYS['ground_truth']
+GROUND_TRUTH_3D = GROUND_TRUTH_ARRAYS['ground_truth_3d']
+
+
+def __getattr__(name):
+    """Reads lazy calibration images on the first access"""
+
+    if name not in LAZY_IMAGES:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name))
+
+    img = read_image(os.path.join(CALIBRATION_FOLDER, LAZY_IMAGES[name]))
+    globals()[name] = img
+    return img
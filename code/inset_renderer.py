@@ -0,0 +1,129 @@
+#!python
+"""Renders inset images on a background thread, so that control replies to
+the simulator are not delayed by drawing and encoding"""
+
+import copy
+import threading
+import time
+import traceback
+
+from supporting_functions import create_output_images
+
+
+def snapshot(rover):
+    """Returns a copy of the rover state, which create_output_images() reads,
+    so that the next frames may update the rover while it is being rendered"""
+
+    state = copy.copy(rover)
+
+    state.statistics = copy.copy(rover.statistics)
+    state.statistics.worldmap = rover.statistics.worldmap.copy()
+    state.statistics.vision_image = rover.statistics.vision_image.copy()
+    state.statistics.metrics = copy.copy(rover.statistics.metrics)
+    state.statistics.samples_index = copy.copy(
+        rover.statistics.samples_index)
+
+    state.time = copy.copy(rover.time)
+
+    return state
+
+
+class InsetRenderer:
+    """Renders the most recently submitted rover snapshot on a worker thread.
+    Snapshots, submitted while the worker is busy, replace each other, so
+    the worker never falls behind the telemetry"""
+
+    def __init__(self, render=create_output_images, metrics=None):
+        """render(rover) returns a pair of encoded inset strings. If set,
+        metrics receives render durations as create_output_images stage"""
+
+        self.__render = render
+        self.__metrics = metrics
+
+        self.__condition = threading.Condition()
+        self.__pending = None
+        self.__busy = False
+        self.__closed = False
+        self.__latest = ('', '')
+
+        self.rendered = 0
+        self.superseded = 0
+
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+
+    def submit(self, rover):
+        """Queues a snapshot of the rover state for rendering"""
+
+        state = snapshot(rover)
+
+        with self.__condition:
+            if self.__pending is not None:
+                self.superseded += 1
+
+            self.__pending = state
+            self.__condition.notify_all()
+
+
+    def latest(self):
+        """Returns the most recently rendered pair of inset strings"""
+
+        with self.__condition:
+            return self.__latest
+
+
+    def flush(self, timeout=None):
+        """Waits until all the submitted snapshots are rendered. Returns false
+        on timeout"""
+
+        with self.__condition:
+            return self.__condition.wait_for(
+                lambda: self.__pending is None and not self.__busy,
+                timeout)
+
+
+    def close(self):
+        """Stops the worker thread after the current rendering"""
+
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+        self.__thread.join()
+
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(
+                    lambda: self.__pending is not None or self.__closed)
+
+                if self.__closed:
+                    return
+
+                state = self.__pending
+                self.__pending = None
+                self.__busy = True
+
+            start = time.perf_counter()
+
+            # Keep the worker alive and the previous insets on failures
+            try:
+                strings = self.__render(state)
+            except Exception: # pylint: disable=broad-except
+                traceback.print_exc()
+                strings = None
+
+            if self.__metrics is not None:
+                self.__metrics.observe(
+                    'create_output_images',
+                    time.perf_counter() - start)
+
+            with self.__condition:
+                if strings is not None:
+                    self.__latest = strings
+                    self.rendered += 1
+
+                self.__busy = False
+                self.__condition.notify_all()
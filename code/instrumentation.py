@@ -0,0 +1,181 @@
+#!python
+"""Lightweight timers and rolling histograms of the telemetry loop stages,
+exported in Prometheus text format"""
+
+import collections
+import threading
+import time
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+DEFAULT_WINDOW = 1000
+
+
+class RollingHistogram:
+    """Keeps the most recent durations to estimate quantiles, plus the total
+    count and sum of all observed durations"""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.__values = np.zeros(window)
+        self.__idx = 0
+        self.count = 0
+        self.total = 0.0
+
+
+    def observe(self, value):
+        """Adds a new duration in seconds"""
+
+        self.__values[self.__idx] = value
+        self.__idx = (self.__idx + 1) % len(self.__values)
+        self.count += 1
+        self.total += value
+
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Returns quantiles of the durations in the rolling window"""
+
+        if self.count == 0:
+            return [np.nan] * len(quantiles)
+
+        recent = self.__values[:min(self.count, len(self.__values))]
+        return list(np.quantile(recent, quantiles))
+
+
+    def copy(self):
+        """Returns an independent copy of the histogram"""
+
+        result = RollingHistogram(len(self.__values))
+        result.__values[:] = self.__values
+        result.__idx = self.__idx
+        result.count = self.count
+        result.total = self.total
+        return result
+
+
+class Instrumentation:
+    """Collects stage timers and frame counters"""
+
+    def __init__(self, prefix='rover', window=DEFAULT_WINDOW):
+        self.__prefix = prefix
+        self.__window = window
+        self.__lock = threading.Lock()
+        self.__histograms = collections.OrderedDict()
+        self.__counters = collections.OrderedDict()
+        self.__gauges = collections.OrderedDict()
+
+
+    def observe(self, stage, seconds):
+        """Adds a duration of the stage"""
+
+        with self.__lock:
+            if stage not in self.__histograms:
+                self.__histograms[stage] = RollingHistogram(self.__window)
+
+            self.__histograms[stage].observe(seconds)
+
+
+    def count(self, name, value=1):
+        """Increments the frame counter of the given name"""
+
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+
+    def set_gauge(self, name, value):
+        """Sets the current value of a gauge"""
+
+        with self.__lock:
+            self.__gauges[name] = value
+
+
+    def histogram(self, stage):
+        """Returns a copy of the histogram of the stage or None if it was
+        never timed"""
+
+        with self.__lock:
+            histogram = self.__histograms.get(stage)
+            return None if histogram is None else histogram.copy()
+
+
+    def counter(self, name):
+        """Returns the value of the frame counter"""
+
+        with self.__lock:
+            return self.__counters.get(name, 0)
+
+
+    def timer(self, stage):
+        """Returns a context manager, timing its body as the stage"""
+        return StageTimer(self, stage)
+
+
+    def prometheus_text(self):
+        """Formats all metrics in Prometheus text exposition format"""
+
+        stage_metric = self.__prefix + '_stage_seconds'
+        frames_metric = self.__prefix + '_frames_total'
+
+        lines = [
+            '# HELP {} Duration of telemetry loop stages'.format(stage_metric),
+            '# TYPE {} summary'.format(stage_metric)]
+
+        with self.__lock:
+            for stage, histogram in self.__histograms.items():
+                for quantile, value in zip(
+                        QUANTILES, histogram.quantiles(QUANTILES)):
+
+                    lines.append('{}{{stage="{}",quantile="{}"}} {}'.format(
+                        stage_metric, stage, quantile, format_value(value)))
+
+                lines.append('{}_sum{{stage="{}"}} {}'.format(
+                    stage_metric, stage, format_value(histogram.total)))
+
+                lines.append('{}_count{{stage="{}"}} {}'.format(
+                    stage_metric, stage, histogram.count))
+
+            lines.append(
+                '# HELP {} Telemetry frames by outcome'.format(frames_metric))
+            lines.append('# TYPE {} counter'.format(frames_metric))
+
+            for name, value in self.__counters.items():
+                lines.append('{}{{outcome="{}"}} {}'.format(
+                    frames_metric, name, value))
+
+            for name, value in self.__gauges.items():
+                gauge_metric = self.__prefix + '_' + name
+                lines.append('# TYPE {} gauge'.format(gauge_metric))
+                lines.append('{} {}'.format(gauge_metric, format_value(value)))
+
+        return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    """Context manager, adding the duration of its body to instrumentation"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, instrumentation, stage):
+        self.__instrumentation = instrumentation
+        self.__stage = stage
+        self.__start = None
+
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *_):
+        self.__instrumentation.observe(
+            self.__stage,
+            time.perf_counter() - self.__start)
+
+
+def format_value(value):
+    """Formats a float the way Prometheus expects it"""
+
+    if value is None or np.isnan(value):
+        return 'NaN'
+
+    return repr(float(value))
@@ -0,0 +1,119 @@
+#!python
+"""Compares lookup table classifiers against the exact ones: score error,
+classification agreement and speedup for each number of bits per channel"""
+
+import argparse
+import glob
+import time
+
+import numpy as np
+
+# pylint: disable=import-error
+import matplotlib.image as mpimg
+
+import classifiers
+
+
+def load_calibration_images():
+    """Loads all color calibration images as 8-bit RGB arrays"""
+
+    paths = sorted(glob.glob('../calibration_images/example*.jpg'))
+    return [mpimg.imread(path) for path in paths]
+
+
+def time_predict(cls, imgs, repeat):
+    """Returns the best average time of cls.predict() over imgs in seconds"""
+
+    best = np.inf
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+
+        for img in imgs:
+            cls.predict(img)
+
+        best = min(best, (time.perf_counter() - start) / len(imgs))
+
+    return best
+
+
+def compare(exact, lut, imgs):
+    """Returns max and mean absolute score errors and the fraction of pixels
+    with the same sign of the score"""
+
+    max_error = 0.0
+    abs_errors = []
+    agreement = []
+
+    for img in imgs:
+        expected = exact.predict(img)
+        given = lut.predict(img)
+
+        error = np.abs(given - expected)
+        max_error = max(max_error, np.max(error))
+        abs_errors.append(error.ravel())
+        agreement.append(((given > 0) == (expected > 0)).ravel())
+
+    return (
+        max_error,
+        np.mean(np.concatenate(abs_errors)),
+        np.mean(np.concatenate(agreement)))
+
+
+def main():
+    """Prints the comparison table for the requested bit depths"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        'bits',
+        type=int,
+        nargs='*',
+        default=[4, 5, 6, 7, 8],
+        help='Bits per color channel to evaluate')
+
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Number of timing repetitions')
+
+    args = parser.parse_args()
+
+    imgs = load_calibration_images()
+
+    exact = {
+        "rocks": classifiers.ROCKS_EXACT,
+        "navi": classifiers.NAVI_EXACT}
+
+    exact_times = {
+        name: time_predict(cls, imgs, args.repeat)
+        for name, cls in exact.items()}
+
+    print("{:>5} {:>5} {:>10} {:>10} {:>9} {:>10} {:>8}".format(
+        "name", "bits", "max err", "mean err", "agree %", "time ms",
+        "speedup"))
+
+    for bits in args.bits:
+        for name, cls in exact.items():
+            # Tables of other calibrations must not be reused
+            lut = classifiers.ClassifierLut(
+                cls,
+                name + "_" + classifiers.MODEL_KEY,
+                bits)
+            max_error, mean_error, agreement = compare(cls, lut, imgs)
+            lut_time = time_predict(lut, imgs, args.repeat)
+
+            print("{:>5} {:>5} {:>10.4f} {:>10.4f} {:>9.3f} {:>10.3f} "
+                  "{:>8.1f}".format(
+                      name,
+                      bits,
+                      max_error,
+                      mean_error,
+                      100.0 * agreement,
+                      1000.0 * lut_time,
+                      exact_times[name] / lut_time))
+
+
+if __name__ == '__main__':
+    main()
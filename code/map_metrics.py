@@ -0,0 +1,231 @@
+#!python
+"""Keeps mapped percentage, fidelity and located samples of the worldmap up
+to date from the windows, which update_global() has touched, instead of
+recounting the whole map every frame"""
+
+import numpy as np
+
+# Samples are located by rocks, detected closer than this number of pixels
+SAMPLE_RADIUS = 3
+
+
+def map_percentages(good_nav_pix, tot_nav_pix, tot_map_pix):
+    """Returns mapped percentage and fidelity out of the numbers of navigable
+    map pixels, which are true, all navigable map pixels and ground truth
+    pixels"""
+
+    # Calculate the percentage of ground truth map that has been successfully
+    # #found
+    perc_mapped = round(100 * float(good_nav_pix) / tot_map_pix, 1)
+
+    # Calculate the number of good map pixel detections divided by total pixels
+    # found to be navigable terrain
+    if tot_nav_pix > 0:
+        fidelity = round(100 * float(good_nav_pix) / tot_nav_pix, 1)
+    else:
+        fidelity = 0
+
+    return perc_mapped, fidelity
+
+
+def clip_window(window, shape):
+    """Returns the window (x0, y0, x1, y1) clipped to the map shape or None
+    if it lies outside of the map"""
+
+    if window is None:
+        return None
+
+    x_0, y_0, x_1, y_1 = window
+    height, width = shape[:2]
+
+    x_0, x_1 = max(x_0, 0), min(x_1, width)
+    y_0, y_1 = max(y_0, 0), min(y_1, height)
+
+    if x_0 >= x_1 or y_0 >= y_1:
+        return None
+
+    return x_0, y_0, x_1, y_1
+
+
+class MapMetrics:
+    """Counts navigable worldmap pixels and those of them, which are in the
+    ground truth. A pixel is navigable if the navigable channel of the
+    worldmap is positive, like in plot_worldmap(). Rocks decay only scales
+    the maps, so pixels can change only in the windows of update_global().
+    In check mode, every update is verified against the full recount"""
+
+    def __init__(self, ground_truth, check=False):
+        self.__truth = ground_truth[:, :, 1] > 0
+        self.__navigable = np.zeros(self.__truth.shape, bool)
+
+        self.tot_map_pix = int(np.count_nonzero(self.__truth))
+        self.tot_nav_pix = 0
+        self.good_nav_pix = 0
+
+        self.check = check
+
+
+    def update(self, worldmap, window):
+        """Recounts pixels of the window (x0, y0, x1, y1) of the updated
+        worldmap. None windows are ignored"""
+
+        window = clip_window(window, self.__truth.shape)
+
+        if window is not None:
+            x_0, y_0, x_1, y_1 = window
+            region = (slice(y_0, y_1), slice(x_0, x_1))
+
+            before = self.__navigable[region]
+            after = worldmap[y_0:y_1, x_0:x_1, 2] > 0
+            truth = self.__truth[region]
+
+            self.tot_nav_pix += int(
+                np.count_nonzero(after) - np.count_nonzero(before))
+
+            self.good_nav_pix += int(
+                np.count_nonzero(after & truth) -
+                np.count_nonzero(before & truth))
+
+            self.__navigable[region] = after
+
+        if self.check:
+            self.verify(worldmap)
+
+
+    def recount(self, worldmap):
+        """Counts all the pixels of the worldmap, which has been replaced
+        rather than updated in windows"""
+
+        height, width = self.__truth.shape
+        self.update(worldmap, (0, 0, width, height))
+
+
+    def verify(self, worldmap):
+        """Raises AssertionError if the counts differ from the full recount
+        of the worldmap"""
+
+        navigable = worldmap[:, :, 2] > 0
+
+        expected = (
+            int(np.count_nonzero(navigable)),
+            int(np.count_nonzero(navigable & self.__truth)))
+
+        actual = (self.tot_nav_pix, self.good_nav_pix)
+
+        if actual != expected:
+            raise AssertionError(
+                "Incremental navigable and true pixel counts {} differ "
+                "from the full recount {}".format(actual, expected))
+
+
+    def statistics(self):
+        """Returns mapped percentage and fidelity"""
+
+        return map_percentages(
+            self.good_nav_pix,
+            self.tot_nav_pix,
+            self.tot_map_pix)
+
+
+class SampleIndex:
+    """Counts rock pixels of the worldmap near each known sample position.
+    Pixels near the samples are listed once, so an update costs time of the
+    changed rock pixels rather than of the map size times sample count"""
+
+    def __init__(self, samples_pos, worldmap):
+        self.samples_pos = tuple(
+            np.asarray(pos, np.int_) for pos in samples_pos)
+        samples_x, samples_y = self.samples_pos
+
+        offsets = np.arange(-SAMPLE_RADIUS, SAMPLE_RADIUS + 1)
+        offsets_y, offsets_x = [
+            axis.ravel()
+            for axis in np.meshgrid(offsets, offsets, indexing='ij')]
+
+        near = offsets_x ** 2 + offsets_y ** 2 < SAMPLE_RADIUS ** 2
+
+        pixels_x = samples_x[:, np.newaxis] + offsets_x[near]
+        pixels_y = samples_y[:, np.newaxis] + offsets_y[near]
+        samples = np.repeat(
+            np.arange(len(samples_x))[:, np.newaxis],
+            pixels_x.shape[1],
+            axis=1)
+
+        height, width = worldmap.shape[:2]
+        inside = (pixels_x >= 0) & (pixels_x < width) & \
+            (pixels_y >= 0) & (pixels_y < height)
+
+        # Flat indices of pixels near samples, sorted to be searched, and the
+        # samples they are near to
+        pixels = (pixels_y * width + pixels_x)[inside]
+        order = np.argsort(pixels, kind='stable')
+        self.__pixels = pixels[order]
+        self.__samples = samples[inside][order]
+
+        self.__rocks = np.zeros((height, width), bool)
+        self.counts = np.zeros(len(samples_x), np.int_)
+
+        self.update(worldmap, (0, 0, width, height))
+
+
+    def update(self, worldmap, window):
+        """Folds rock detections of the window (x0, y0, x1, y1) of the updated
+        worldmap into the counts. None windows are ignored"""
+
+        window = clip_window(window, self.__rocks.shape)
+        if window is None:
+            return
+
+        x_0, y_0, x_1, y_1 = window
+        region = (slice(y_0, y_1), slice(x_0, x_1))
+
+        rocks = worldmap[y_0:y_1, x_0:x_1, 1] > 0
+        rows, cols = np.nonzero(rocks != self.__rocks[region])
+
+        if len(rows) == 0:
+            return
+
+        self.__rocks[region] = rocks
+
+        # Row-major nonzero() yields sorted flat indices
+        changed = (rows + y_0) * self.__rocks.shape[1] + cols + x_0
+        deltas = np.where(rocks[rows, cols], 1, -1)
+
+        hits = np.isin(self.__pixels, changed)
+        if not hits.any():
+            return
+
+        # Counts are replaced rather than changed in place, so that shallow
+        # copies of the index keep their counts
+        self.counts = self.counts + np.bincount(
+            self.__samples[hits],
+            deltas[np.searchsorted(changed, self.__pixels[hits])],
+            len(self.counts)).astype(np.int_)
+
+
+    def located(self):
+        """Returns a boolean mask of samples, near which rocks are detected"""
+        return self.counts > 0
+
+
+def main():
+    """Shows results of what the module does if run as a separate application"""
+
+    # pylint: disable=import-outside-toplevel
+    from images import GROUND_TRUTH_3D
+
+    metrics = MapMetrics(GROUND_TRUTH_3D, check=True)
+    worldmap = np.zeros(GROUND_TRUTH_3D.shape)
+
+    worldmap[90:110, 80:120, 2] = 255
+    metrics.update(worldmap, (80, 90, 120, 110))
+
+    print("Mapped: {}%, Fidelity: {}%".format(*metrics.statistics()))
+
+    worldmap[100:102, 100:102, 1] = 255
+    index = SampleIndex(([101, 150], [100, 150]), worldmap)
+    print("Located samples: {}".format(index.located()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!python
+"""Streams a mapping video of a replayed run: each frame shows the camera
+image, the top view of the classification and the worldmap. Frames are
+encoded on a background thread while the next ones are perceived, and only a
+fixed number of frame buffers is ever allocated"""
+
+import argparse
+import queue
+import threading
+import time
+import traceback
+
+import numpy as np
+import cv2
+
+import replay
+from rover_state import RoverState
+from supporting_functions import create_output_map
+
+DEFAULT_VIDEO = '../output/replay_mapping.mp4'
+
+# The simulator records at about 25 FPS, a faster video is easier to watch
+DEFAULT_FPS = 60
+
+# Frame buffers, being composed or waiting for the encoder
+DEFAULT_DEPTH = 8
+
+
+def frame_size(img_shape, map_shape=(200, 200)):
+    """Returns (width, height) of video frames with the camera image and the
+    top view above the worldmap"""
+
+    return 2 * img_shape[1], img_shape[0] + map_shape[0]
+
+
+def compose_frame(rover, out):
+    """Draws the camera image, the classified top view of vision_image and
+    the worldmap with the ground truth overlay into BGR out frame"""
+
+    img = rover.perception.img
+    height, width = img.shape[:2]
+
+    cv2.cvtColor(img, cv2.COLOR_RGB2BGR, dst=out[:height, :width])
+
+    # The top view is coarser than the camera image at reduced perception
+    # scales, see transformations.use_scale()
+    vision_image = rover.statistics.vision_image.astype(np.uint8)
+    if vision_image.shape[:2] != (height, width):
+        vision_image = cv2.resize(
+            vision_image,
+            (width, height),
+            interpolation=cv2.INTER_NEAREST)
+
+    cv2.cvtColor(vision_image, cv2.COLOR_RGB2BGR, dst=out[:height, width:])
+
+    map_add = create_output_map(rover)[0]
+    map_height, map_width = map_add.shape[:2]
+
+    cv2.cvtColor(
+        map_add.astype(np.uint8),
+        cv2.COLOR_RGB2BGR,
+        dst=out[height:height + map_height, :map_width])
+
+    out[height:, map_width:] = 0
+
+
+class VideoStream:
+    """Writes frames into a cv2.VideoWriter on a worker thread. Frames are
+    composed into buffers from a fixed pool, so memory does not grow with
+    the run length; if the encoder falls behind, buffer() waits for it"""
+
+    def __init__(self, path, fps, size, depth=DEFAULT_DEPTH):
+        self.__writer = cv2.VideoWriter(
+            path,
+            cv2.VideoWriter_fourcc(*'mp4v'),
+            fps,
+            size)
+
+        if not self.__writer.isOpened():
+            raise IOError("Cannot open video " + path)
+
+        width, height = size
+
+        self.__free = queue.Queue()
+        for _ in range(depth):
+            self.__free.put(np.zeros((height, width, 3), np.uint8))
+
+        self.__filled = queue.Queue()
+
+        self.written = 0
+        self.encode_seconds = 0.0
+        self.wait_seconds = 0.0
+
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+
+    def buffer(self):
+        """Returns a free frame buffer to compose the next frame into"""
+
+        start = time.perf_counter()
+        frame = self.__free.get()
+        self.wait_seconds += time.perf_counter() - start
+
+        return frame
+
+
+    def push(self, frame):
+        """Queues a composed buffer for encoding"""
+        self.__filled.put(frame)
+
+
+    def close(self):
+        """Encodes the queued frames and finishes the video file"""
+
+        self.__filled.put(None)
+        self.__thread.join()
+        self.__writer.release()
+
+
+    def __run(self):
+        while True:
+            frame = self.__filled.get()
+            if frame is None:
+                return
+
+            start = time.perf_counter()
+
+            # Keep the worker alive and the buffer in the pool on failures
+            try:
+                self.__writer.write(frame)
+                self.written += 1
+            except Exception: # pylint: disable=broad-except
+                traceback.print_exc()
+
+            self.encode_seconds += time.perf_counter() - start
+            self.__free.put(frame)
+
+
+def write_video(
+        frames,
+        path,
+        fps=DEFAULT_FPS,
+        rover=None,
+        depth=DEFAULT_DEPTH):
+    """Replays (record, img) frames, streaming a mapping video frame per
+    valid record through depth buffers. Returns the replay result and the
+    stream with its statistics"""
+
+    streams = []
+
+    def on_frame(_, frame_rover):
+        if not streams:
+            streams.append(VideoStream(
+                path,
+                fps,
+                frame_size(frame_rover.perception.img.shape),
+                depth))
+
+        frame = streams[0].buffer()
+        compose_frame(frame_rover, frame)
+        streams[0].push(frame)
+
+    result = replay.run_replay(frames, rover, on_frame=on_frame)
+
+    for stream in streams:
+        stream.close()
+
+    return result, streams[0] if streams else None
+
+
+def main():
+    """Streams the mapping video of the log and prints the throughput"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        'log',
+        type=str,
+        nargs='?',
+        default=replay.DEFAULT_LOG,
+        help='Path to the robot_log.csv or the binary run log of the run')
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=DEFAULT_VIDEO,
+        help='Path to the video file')
+
+    parser.add_argument(
+        '--fps',
+        type=float,
+        default=DEFAULT_FPS,
+        help='Frame rate of the video')
+
+    args = parser.parse_args()
+
+    rover = RoverState()
+    rover.statistics.samples_to_find = replay.DEFAULT_SAMPLES_TO_FIND
+
+    start = time.perf_counter()
+    result, stream = write_video(
+        replay.open_frames(args.log),
+        args.output,
+        args.fps,
+        rover)
+    elapsed = time.perf_counter() - start
+
+    print("Frames:   {} written".format(stream.written if stream else 0))
+    print("FPS:      {:.1f}".format(len(result.latencies) / elapsed))
+
+    if stream is not None:
+        print("Encoding: {:.2f} s, waited for encoder {:.2f} s".format(
+            stream.encode_seconds,
+            stream.wait_seconds))
+
+    print("Video:    {}".format(args.output))
+
+
+if __name__ == '__main__':
+    main()
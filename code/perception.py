@@ -4,12 +4,14 @@
 import numpy as np
 import cv2
 
-# pylint: disable=import-error
-import matplotlib.pyplot as plt
-
 import transformations
 import classifiers
 import control
+import planners
+import precision
+from map_metrics import clip_window
+from scheduler import UNSCHEDULED
+from tiled_map import TiledMap, read_window
 
 
 def prepare_forward_mask():
@@ -29,74 +31,195 @@ def prepare_forward_mask():
 FORWARD_MASK = prepare_forward_mask()
 
 
-def perception_step(rover):
-    """Perform perception steps to update rover"""
+def use_scale(scale=1.0):
+    """Switches perception to the scale of camera images and the local top
+    view, see transformations.use_scale(), and regenerates FORWARD_MASK.
+    Rovers, created before the call, keep local maps of the previous size"""
+
+    # pylint: disable=global-statement
+    global FORWARD_MASK
+
+    transformations.use_scale(scale)
+    FORWARD_MASK = prepare_forward_mask()
+
+
+ROCKS_DECAY = 0.9999
+
+# Accumulated decay, applied to integer rocks maps at once. Confidences below
+# 0.5 / (1 - INTEGER_DECAY_STEP) are left as they are by rounding
+INTEGER_DECAY_STEP = 0.9
+
+
+def perception_step(rover, stages=UNSCHEDULED):
+    """Perform perception steps to update rover. The steps run as stages of
+    the scheduler, see scheduler.StageScheduler, which may defer or shed
+    cost map and vision image updates"""
 
     perception = rover.perception
 
-    aligned_to_ground = (
-        abs(transformations.warp_angle180(perception.pitch_deg) < 0.5
-            and transformations.warp_angle180(perception.roll_deg)) < 0.5)
+    aligned_to_ground = is_aligned_to_ground(
+        perception.pitch_deg,
+        perception.roll_deg)
 
-    img = perception.img
+    img = transformations.scale_camera_image(perception.img)
 
     loc_2_glob = transformations.local_2_global(
         perception.pos[0],
         perception.pos[1],
         perception.yaw_deg)
 
-    rocks = classifiers.ROCKS.predict(img)
-    rocks_top = transformations.perspective_2_top(rocks)
-
-    navi = classifiers.NAVI.predict(img)
-    nav_top = transformations.perspective_2_top(navi)
+    work_dtype = precision.work_dtype(rover.precision)
 
     r_map = rover.map
     statistics = rover.statistics
+    decision = rover.decision
 
-    if aligned_to_ground:
-        update_global(loc_2_glob, r_map, nav_top, r_map.global_conf_navi)
-        update_global(loc_2_glob, r_map, rocks_top, r_map.global_conf_rocks)
+    tops = {}
 
-        # Slowly forget rocks map to make the rover re-explore the map rather
-        # than get stuck after the exploration somewhere. Note that only
-        # rocks map is being forgotten, since it is used for exploration. We
-        # should not forget navigable map, as mapping percent is one of the
-        # passing criteria for this project
-        r_map.global_conf_rocks *= 0.9999
+    def classify():
+        rocks = classify_visible(classifiers.ROCKS, img, work_dtype)
+        tops['rocks'] = transformations.perspective_2_top(rocks)
 
-        rocks_mask = r_map.global_conf_rocks > 0
+        navi = classify_visible(classifiers.NAVI, img, work_dtype)
+        tops['navi'] = transformations.perspective_2_top(navi)
 
-        statistics.worldmap[:, :, 0] = np.maximum(
-            255 * rocks_mask,
-            -r_map.global_conf_navi * (r_map.global_conf_navi < 0))
+    def update_maps():
+        windows = (
+            update_global(loc_2_glob, tops['navi'], r_map.global_conf_navi),
+            update_global(loc_2_glob, tops['rocks'], r_map.global_conf_rocks))
 
-        statistics.worldmap[:, :, 1] = 255 * rocks_mask
+        decay_rocks(r_map)
+        update_worldmap(statistics.worldmap, r_map, windows)
 
-        statistics.worldmap[:, :, 2] = np.maximum(
-            255 * rocks_mask,
-            r_map.global_conf_navi * (r_map.global_conf_navi > 0))
+        for window in windows:
+            statistics.metrics.update(statistics.worldmap, window)
 
-    decision = rover.decision
+        if statistics.samples_index is not None:
+            statistics.samples_index.update(statistics.worldmap, windows[1])
+
+    def update_cost_map():
+        if isinstance(r_map.global_conf_navi, TiledMap):
+            planners.fit_cost_window(
+                decision,
+                r_map.global_conf_navi.bounds())
+
+        decision.planner.update(
+            decision,
+            read_window(r_map.global_conf_navi, decision.cost_window))
 
-    update_cost_map(decision, r_map.global_conf_navi)
-    update_stuck_state(rover)
+    def choose_direction():
+        update_stuck_state(rover)
 
-    glob_2_loc = np.linalg.inv(np.vstack([loc_2_glob, [0.0, 0.0, 1.0]]))[:2, :]
+        glob_2_loc = np.linalg.inv(
+            np.vstack([loc_2_glob, [0.0, 0.0, 1.0]]))[:2, :]
 
-    direction_map = prepare_direction_map(decision, r_map, glob_2_loc)
-    r_map.local_rocks = to_local_map(r_map.global_conf_rocks, glob_2_loc)
-    r_map.local_navi = to_local_map(r_map.global_conf_navi, glob_2_loc)
+        tops['direction'] = prepare_direction_map(decision, r_map, glob_2_loc)
+        r_map.local_rocks = to_local_map(r_map.global_conf_rocks, glob_2_loc)
+        r_map.local_navi = to_local_map(r_map.global_conf_navi, glob_2_loc)
 
-    choose_best_direction(decision, direction_map, r_map.local_navi)
+        choose_best_direction(decision, tops['direction'], r_map.local_navi)
 
-    statistics.vision_image[:, :, 0] = -direction_map * (direction_map < 0)
-    statistics.vision_image[:, :, 1] = 255 * (rocks_top > 0)
-    statistics.vision_image[:, :, 2] = direction_map * (direction_map > 0)
+    stages.run('classify', classify, critical=True)
+
+    # Shed map updates would lose observations for good, while the other
+    # stages are redone out of the maps on the next run
+    if aligned_to_ground:
+        stages.run('update_maps', update_maps, critical=True)
+
+    stages.run('update_cost_map', update_cost_map)
+    stages.run('choose_direction', choose_direction, critical=True)
+
+    stages.run('update_vision_image', lambda: update_vision_image(
+        statistics.vision_image,
+        tops['direction'],
+        tops['rocks']))
 
     return rover
 
 
+def is_aligned_to_ground(pitch_deg, roll_deg):
+    """Returns true if the camera pose allows to update global maps"""
+
+    return (
+        abs(transformations.warp_angle180(pitch_deg) < 0.5
+            and transformations.warp_angle180(roll_deg)) < 0.5)
+
+
+def classify_visible(cls, img, dtype=np.float64):
+    """Classifies only the pixels, which land in the retained half of the top
+    view. Other scores are left zero, since perspective_2_top() drops them"""
+
+    scores = np.zeros(img.shape[:2], dtype)
+
+    pixels = img.reshape(-1, 3).take(transformations.TOP_SOURCE_IDX, axis=0)
+    scores.put(transformations.TOP_SOURCE_IDX, cls.predict_pixels(pixels))
+
+    return scores
+
+
+def decay_rocks(r_map):
+    """Slowly forget rocks map to make the rover re-explore the map rather
+    than get stuck after the exploration somewhere. Note that only rocks map is
+    being forgotten, since it is used for exploration. We should not forget
+    navigable map, as mapping percent is one of the passing criteria for this
+    project. Integer maps would round such a small decay away, so it is
+    accumulated and applied once it becomes noticeable"""
+
+    r_map.rocks_decay *= ROCKS_DECAY
+
+    if precision.is_integer(r_map.global_conf_rocks) and \
+        r_map.rocks_decay > INTEGER_DECAY_STEP:
+        return
+
+    if isinstance(r_map.global_conf_rocks, TiledMap):
+        r_map.global_conf_rocks *= r_map.rocks_decay
+    else:
+        precision.scale(r_map.global_conf_rocks, r_map.rocks_decay)
+
+    r_map.rocks_decay = 1.0
+
+
+def update_worldmap(worldmap, r_map, windows=None):
+    """Composes the worldmap of obstacles, rocks and navigable terrain out of
+    global confidence maps. If windows (x0, y0, x1, y1) of update_global() are
+    given, only they are composed, since rocks decay keeps signs of the rest
+    of the maps. None windows are skipped"""
+
+    if windows is None:
+        windows = [(0, 0, worldmap.shape[1], worldmap.shape[0])]
+
+    for window in windows:
+        window = clip_window(window, worldmap.shape)
+        if window is None:
+            continue
+
+        x_0, y_0, x_1, y_1 = window
+        region = worldmap[y_0:y_1, x_0:x_1]
+
+        global_conf_rocks = read_window(r_map.global_conf_rocks, window)
+        global_conf_navi = read_window(r_map.global_conf_navi, window)
+
+        rocks_mask = global_conf_rocks > 0
+
+        region[:, :, 0] = np.maximum(
+            255 * rocks_mask,
+            -global_conf_navi * (global_conf_navi < 0))
+
+        region[:, :, 1] = 255 * rocks_mask
+
+        region[:, :, 2] = np.maximum(
+            255 * rocks_mask,
+            global_conf_navi * (global_conf_navi > 0))
+
+
+def update_vision_image(vision_image, direction_map, rocks_top):
+    """Composes the debug image of the direction map and visible rocks"""
+
+    vision_image[:, :, 0] = -direction_map * (direction_map < 0)
+    vision_image[:, :, 1] = 255 * (rocks_top > 0)
+    vision_image[:, :, 2] = direction_map * (direction_map > 0)
+
+
 def choose_best_direction(decision, direction_map, nav_top):
     """Find best direction for the rover motion"""
 
@@ -107,17 +230,18 @@ def choose_best_direction(decision, direction_map, nav_top):
 def calc_nav_pixels(nav_dir, nav_top):
     """Calculates number of pixels along the selected direction"""
 
-    similar_dirs = (transformations.ROVER_CONF_DIRS.dot(nav_dir) > 0.8).ravel()
-    navigatable = (nav_top > 0).ravel()
-
-    return np.sum(similar_dirs * navigatable)
+    similar_dirs = transformations.ray_pixels(nav_dir)
+    return np.count_nonzero(nav_top.ravel()[similar_dirs] > 0)
 
 
 def prepare_direction_map(decision, r_map, glob_2_loc):
     """Prepares a local direction map out of cost_map and navigable map to
     make decisions about steering directions to reach a distant goal"""
 
-    direction_map = to_local_map(decision.cost_map, glob_2_loc)
+    direction_map = to_local_map(
+        decision.cost_map,
+        glob_2_loc,
+        decision.cost_window[:2])
     navi_map = to_local_map(r_map.global_conf_navi, glob_2_loc)
 
     navigable = navi_map > 0
@@ -130,8 +254,22 @@ def prepare_direction_map(decision, r_map, glob_2_loc):
     return direction_map
 
 
-def to_local_map(global_map, glob_2_loc):
-    """Returns a patch of the cost map in local coordinates"""
+def to_local_map(global_map, glob_2_loc, origin=(0, 0)):
+    """Returns a patch of the cost map in local coordinates. A dense map may
+    be a patch of global coordinates with the top left corner at origin"""
+
+    if isinstance(global_map, TiledMap):
+        return global_map.to_local(
+            glob_2_loc,
+            transformations.TOP_WIDTH,
+            transformations.TOP_HEIGHT)
+
+    if tuple(origin) != (0, 0):
+        return transformations.warp_affine_window(
+            global_map,
+            glob_2_loc,
+            (0, 0, transformations.TOP_WIDTH, transformations.TOP_HEIGHT),
+            origin=origin)
 
     local_cost_map = cv2.warpAffine(
         global_map,
@@ -141,34 +279,32 @@ def to_local_map(global_map, glob_2_loc):
     return local_cost_map
 
 
-def update_cost_map(decision, global_navi_map):
-    """Recalculate the state of the cost_map, using value iteration algorithm"""
-    decision.cost_map *= global_navi_map > -1.0
-
-    kernel = np.array([
-        [0.0125, 0.0125, 0.0125],
-        [0.0125, 0.9000, 0.0125],
-        [0.0125, 0.0125, 0.0125]])
-
-    decision.cost_map = cv2.filter2D(decision.cost_map, -1, kernel) * 0.99
-    np.maximum(decision.cost_map, 0.1, out=decision.cost_map)
+def update_global(loc_2_glob, local_map, global_map):
+    """Updates global confidence map from local map. Only the window, covered
+    by the local map footprint, is warped, accumulated and clipped. Returns
+    the window (x0, y0, x1, y1) or None if nothing has changed"""
 
+    if isinstance(global_map, TiledMap):
+        return global_map.update_global(loc_2_glob, local_map)
 
-def update_global(loc_2_glob, r_map, local_map, global_map):
-    """Updates global confidence map from local map"""
-
-    r_map.global_conf_cur.fill(0)
-
-    cv2.warpAffine(
-        local_map,
+    window = transformations.footprint_window(
         loc_2_glob,
-        (r_map.global_conf_cur.shape[1], r_map.global_conf_cur.shape[0]),
-        r_map.global_conf_cur)
+        local_map,
+        global_map.shape)
 
-    global_map += r_map.global_conf_cur
+    if window is None:
+        return None
+
+    x_0, y_0, x_1, y_1 = window
 
     # Clipping to prevent the map from being overconfident
-    np.clip(global_map, -255.0, 255.0, out=global_map)
+    precision.accumulate(
+        global_map[y_0:y_1, x_0:x_1],
+        transformations.warp_affine_window(local_map, loc_2_glob, window),
+        -255.0,
+        255.0)
+
+    return window
 
 
 def update_stuck_state(rover):
@@ -186,6 +322,9 @@ def update_stuck_state(rover):
 def main():
     """Shows results of what the module does if run as a separate application"""
 
+    # pylint: disable=import-error
+    import matplotlib.pyplot as plt
+
     plt.imshow(FORWARD_MASK, cmap="gray")
     plt.show()
     return
@@ -0,0 +1,537 @@
+#!python
+"""Planners, filling decision.cost_map with values that grow towards the
+goals, so that prepare_direction_map() can steer the rover to them"""
+
+import collections
+import heapq
+import math
+
+import numpy as np
+import cv2
+
+INF = float('inf')
+
+# Goal values at or above the threshold are goal cells for D* Lite
+GOAL_THRESHOLD = 128.0
+
+# Cost map cells, which confidence is at or below the threshold, are obstacles
+OBSTACLE_THRESHOLD = -1.0
+
+MIN_COST = 0.1
+MAX_COST = 255.0
+
+# Frames, during which D* Lite defers removals of goal cells, so that goals,
+# which exploration removes a few cells per frame, are repaired in batches
+DEFAULT_GOAL_INTERVAL = 10
+
+# Lookahead values, which D* Lite recalculates per frame, so that repairs are
+# spread over frames and take no longer than a value iteration sweep
+DEFAULT_BUDGET = 60
+
+# Changed cells, above which D* Lite reseeds the grid rather than repairs it
+DEFAULT_RESEED_CHANGES = 2000
+
+
+def update_cost_map(decision, global_navi_map):
+    """Recalculate the state of the cost_map, using value iteration algorithm"""
+    decision.cost_map *= global_navi_map > OBSTACLE_THRESHOLD
+
+    kernel = np.array([
+        [0.0125, 0.0125, 0.0125],
+        [0.0125, 0.9000, 0.0125],
+        [0.0125, 0.0125, 0.0125]])
+
+    decision.cost_map = cv2.filter2D(decision.cost_map, -1, kernel) * 0.99
+    np.maximum(decision.cost_map, MIN_COST, out=decision.cost_map)
+
+
+class ValueIterationPlanner:
+    """Accumulates goals in the cost map and blurs them over the navigable
+    terrain with one value iteration sweep per frame"""
+
+    # pylint: disable=no-self-use
+
+    def set_goals(self, decision, goals):
+        """Adds goal values to the cost map"""
+
+        decision.cost_map += goals
+        np.minimum(MAX_COST, decision.cost_map, out=decision.cost_map)
+
+
+    def update(self, decision, global_navi_map):
+        """Runs a value iteration sweep"""
+        update_cost_map(decision, global_navi_map)
+
+
+    def resize(self, decision, offset):
+        """Costs are kept in decision.cost_map, so there is nothing to move"""
+
+        # pylint: disable=unused-argument
+
+
+class DStarLitePlanner:
+    """Incremental D* Lite search from all goal cells over the 8-connected
+    navigability grid. Since the whole cost map is needed around the moving
+    rover rather than a single path, the heuristic is zero and the search
+    runs until all cells are consistent. Only cells affected by changed
+    obstacles or goals are repaired, and only cost map cells, which distances
+    have changed, are refreshed.
+
+    Repairs are spread over frames: seeding changed cells and expanding
+    queued ones share a budget of recalculated lookahead values per update,
+    so that the planner takes no more time per frame than a value iteration
+    sweep. Change sets larger than reseed_changes, such as switched goals,
+    are not repaired cell by cell; the grid is reseeded from the goals with
+    numpy instead"""
+
+    def __init__(
+            self,
+            shape=(200, 200),
+            decay=0.98,
+            budget=DEFAULT_BUDGET,
+            goal_interval=DEFAULT_GOAL_INTERVAL,
+            reseed_changes=DEFAULT_RESEED_CHANGES):
+        """decay is the cost map attenuation per meter of the path to the
+        closest goal. budget limits lookahead values, recalculated per update
+        while seeding and expanding cells, deferring the rest of the repair to
+        the next frames. None removes the limit. Goal cells, which are only
+        removed, are applied once in goal_interval calls of set_goals(); added
+        goal cells are applied immediately. More than reseed_changes pending
+        cells reseed the grid; None reseeds it only for a new cost map"""
+
+        self.__decay = decay
+        self.__budget = budget
+        self.__goal_interval = goal_interval
+        self.__goals_deferred = 0
+        self.__reseed_changes = reseed_changes
+
+        # Target obstacles and goals, and the grid, to which they are applied
+        # cell by cell
+        self.__blocked_map = np.zeros(shape, np.bool_)
+        self.__goal_map = np.zeros(shape, np.bool_)
+        self.__allocate(shape)
+
+        self.__blocked = self.__padded(self.__blocked_map, True).tolist()
+        self.__goals = [False] * len(self.__blocked)
+        self.__g = [INF] * len(self.__blocked)
+        self.__rhs = [INF] * len(self.__blocked)
+        self.__queue = []
+
+        # Cells, which flags or neighbours have changed, waiting to be seeded
+        # into the queue, and whether there are too many of them
+        self.__pending = collections.OrderedDict()
+        self.__reseed_needed = False
+
+        # Cells, which distances changed since the cost map was refreshed,
+        # and the cost map, which has been refreshed
+        self.__dirty = []
+        self.__cost_map = None
+
+        # Lookahead values, recalculated in the current update
+        self.__work = 0
+
+        self.expansions = 0
+
+
+    def __allocate(self, shape):
+        """Sets the padded grid geometry of the shape"""
+
+        # The grid is surrounded by a ring of obstacles, so that neighbours
+        # of all the inner cells exist
+        self.__shape = shape
+        self.__stride = shape[1] + 2
+
+        stride = self.__stride
+        self.__neighbours = [
+            (-stride - 1, math.sqrt(2.0)), (-stride, 1.0),
+            (-stride + 1, math.sqrt(2.0)), (-1, 1.0), (1, 1.0),
+            (stride - 1, math.sqrt(2.0)), (stride, 1.0),
+            (stride + 1, math.sqrt(2.0))]
+
+
+    def __padded(self, mask, fill):
+        """Returns the mask, surrounded by the ring of fill values, raveled"""
+
+        padded = np.full(
+            (self.__shape[0] + 2, self.__shape[1] + 2),
+            fill,
+            mask.dtype)
+
+        padded[1:-1, 1:-1] = mask
+        return padded.ravel()
+
+
+    @staticmethod
+    def __changes(mask, previous):
+        """Returns raveled indices of the cells, which differ from the
+        previous mask. Comparing uint8 views is many times faster than
+        boolean arrays"""
+
+        return np.flatnonzero(mask.view(np.uint8) != previous.view(np.uint8))
+
+
+    def __mark_pending(self, changes):
+        """Schedules seeding of the cells at raveled indices, or reseeding of
+        the whole grid if there are too many of them"""
+
+        if self.__reseed_needed:
+            return
+
+        if self.__reseed_changes is not None and \
+            len(self.__pending) + changes.size > self.__reseed_changes:
+
+            self.__reseed_needed = True
+            self.__pending.clear()
+            return
+
+        rows, cols = np.divmod(changes, self.__shape[1])
+        for cell in ((rows + 1) * self.__stride + cols + 1).tolist():
+            self.__pending[cell] = None
+
+
+    def __update_vertex(self, cell):
+        """Recalculates the one-step lookahead value of the cell and queues it
+        if it is inconsistent"""
+
+        if self.__blocked[cell]:
+            rhs = INF
+        elif self.__goals[cell]:
+            rhs = 0.0
+        else:
+            g_values = self.__g
+            blocked = self.__blocked
+            rhs = INF
+
+            for offset, cost in self.__neighbours:
+                neighbour = cell + offset
+                if not blocked[neighbour]:
+                    value = g_values[neighbour] + cost
+                    if value < rhs:
+                        rhs = value
+
+        self.__rhs[cell] = rhs
+        self.__work += 1
+
+        g_value = self.__g[cell]
+        if g_value != rhs:
+            heapq.heappush(self.__queue, (min(g_value, rhs), cell))
+
+
+    def __update_neighbourhood(self, cell):
+        """Updates the cell together with its neighbours"""
+
+        self.__update_vertex(cell)
+
+        for offset, _ in self.__neighbours:
+            neighbour = cell + offset
+            if not self.__blocked[neighbour]:
+                self.__update_vertex(neighbour)
+
+
+    def __seed(self):
+        """Applies target obstacles and goals to pending cells and queues
+        them"""
+
+        pending = self.__pending
+        budget = self.__budget
+        stride = self.__stride
+
+        while pending and (budget is None or self.__work < budget):
+            cell, _ = pending.popitem(last=False)
+
+            row, col = divmod(cell, stride)
+            blocked = bool(self.__blocked_map[row - 1, col - 1])
+            self.__goals[cell] = bool(self.__goal_map[row - 1, col - 1])
+
+            if blocked != self.__blocked[cell]:
+                self.__blocked[cell] = blocked
+                self.__update_neighbourhood(cell)
+            else:
+                self.__update_vertex(cell)
+
+
+    def __compute(self):
+        """Expands inconsistent cells in the order of their keys"""
+
+        queue = self.__queue
+        g_values = self.__g
+        rhs_values = self.__rhs
+        blocked = self.__blocked
+        goals = self.__goals
+        budget = self.__budget
+
+        while queue and (budget is None or self.__work < budget):
+            key, cell = heapq.heappop(queue)
+
+            g_value = g_values[cell]
+            rhs = rhs_values[cell]
+
+            # Skip stale queue entries
+            if g_value == rhs or min(g_value, rhs) != key:
+                continue
+
+            self.expansions += 1
+            self.__work += 1
+            self.__dirty.append(cell)
+
+            if g_value > rhs:
+                g_values[cell] = rhs
+
+                # Lowered distance can only lower lookahead values of the
+                # neighbours, so they need no full recalculation
+                for offset, cost in self.__neighbours:
+                    neighbour = cell + offset
+                    value = rhs + cost
+
+                    if value < rhs_values[neighbour] and \
+                        not blocked[neighbour] and not goals[neighbour]:
+
+                        rhs_values[neighbour] = value
+                        self.__work += 1
+                        heapq.heappush(
+                            queue,
+                            (min(g_values[neighbour], value), neighbour))
+            else:
+                g_values[cell] = INF
+                self.__update_vertex(cell)
+
+                # Only neighbours, which lookahead values came through the
+                # cell, are recalculated
+                for offset, cost in self.__neighbours:
+                    neighbour = cell + offset
+
+                    if rhs_values[neighbour] == g_value + cost and \
+                        not blocked[neighbour] and not goals[neighbour]:
+
+                        self.__update_vertex(neighbour)
+
+
+    def __reseed(self, decision):
+        """Restarts the search from the target goals, marking goal cells and
+        queueing their neighbours with numpy rather than cell by cell"""
+
+        blocked = self.__padded(self.__blocked_map, True)
+        goals = self.__padded(self.__goal_map, False)
+        seeds = goals & ~blocked
+
+        g_values = np.where(seeds, 0.0, INF)
+
+        self.__blocked = blocked.tolist()
+        self.__goals = goals.tolist()
+        self.__g = g_values.tolist()
+        self.__rhs = list(self.__g)
+        self.__queue = []
+        self.__dirty = []
+
+        # Only free cells next to goals have changed lookahead values
+        frontier = cv2.dilate(
+            seeds.reshape(-1, self.__stride).astype(np.uint8),
+            np.ones((3, 3), np.uint8)).ravel() > 0
+
+        frontier &= ~goals & ~blocked
+
+        self.__pending = collections.OrderedDict.fromkeys(
+            np.flatnonzero(frontier).tolist())
+
+        self.__reseed_needed = False
+
+        costs = np.where(
+            self.__goal_map & ~self.__blocked_map,
+            MAX_COST,
+            MIN_COST)
+
+        if decision.cost_map.shape == costs.shape:
+            decision.cost_map[...] = costs
+        else:
+            decision.cost_map = costs.astype(decision.cost_map.dtype)
+
+        self.__cost_map = decision.cost_map
+
+
+    def resize(self, decision, offset):
+        """Moves the grid into decision.cost_map, which has grown so that the
+        previous cost map starts at offset (x, y). Distances and repairs in
+        progress are kept, and cells around the previous grid are seeded"""
+
+        x_0, y_0 = offset
+        old_height, old_width = self.__shape
+        old_stride = self.__stride
+        height, width = decision.cost_map.shape
+
+        def moved(values, fill):
+            """Returns the padded grid of values, moved to the offset"""
+
+            grid = np.full((height + 2, width + 2), fill)
+            grid[y_0 + 1:y_0 + old_height + 1, x_0 + 1:x_0 + old_width + 1] = \
+                np.reshape(values, (-1, old_stride))[1:-1, 1:-1]
+
+            return grid
+
+        def moved_cell(cell):
+            """Returns the index of the cell in the moved grid"""
+
+            row, col = divmod(cell, old_stride)
+            return (row + y_0) * (width + 2) + col + x_0
+
+        blocked_map = np.zeros((height, width), np.bool_)
+        blocked_map[y_0:y_0 + old_height, x_0:x_0 + old_width] = \
+            self.__blocked_map
+        self.__blocked_map = blocked_map
+
+        goal_map = np.zeros((height, width), np.bool_)
+        goal_map[y_0:y_0 + old_height, x_0:x_0 + old_width] = self.__goal_map
+        self.__goal_map = goal_map
+
+        # The previous ring of obstacles is free now, and only the border of
+        # the grown grid is blocked
+        blocked = moved(self.__blocked, False)
+        blocked[[0, -1], :] = True
+        blocked[:, [0, -1]] = True
+
+        ring = np.zeros(blocked.shape, np.bool_)
+        ring[y_0:y_0 + old_height + 2, x_0:x_0 + old_width + 2] = True
+        ring[y_0 + 1:y_0 + old_height + 1, x_0 + 1:x_0 + old_width + 1] = False
+        ring &= ~blocked
+
+        self.__blocked = blocked.ravel().tolist()
+        self.__goals = moved(self.__goals, False).ravel().tolist()
+        self.__g = moved(self.__g, INF).ravel().tolist()
+        self.__rhs = moved(self.__rhs, INF).ravel().tolist()
+
+        # Keys are kept, so the moved queue is still a heap
+        self.__queue = [(key, moved_cell(cell)) for key, cell in self.__queue]
+        self.__dirty = [moved_cell(cell) for cell in self.__dirty]
+        self.__pending = collections.OrderedDict.fromkeys(
+            moved_cell(cell) for cell in self.__pending)
+
+        self.__allocate((height, width))
+
+        if not self.__reseed_needed:
+            for cell in np.flatnonzero(ring).tolist():
+                self.__pending[cell] = None
+
+        # Grown cells are not reached by the search yet
+        costs = decision.cost_map[y_0:y_0 + old_height, x_0:x_0 + old_width]
+        costs = costs.copy()
+        decision.cost_map[...] = MIN_COST
+        decision.cost_map[y_0:y_0 + old_height, x_0:x_0 + old_width] = costs
+        self.__cost_map = decision.cost_map
+
+
+    def distances(self, window=None):
+        """Returns path lengths from each cell of the window (x0, y0, x1, y1),
+        the whole map by default, to the closest goal"""
+
+        if window is None:
+            window = (0, 0, self.__shape[1], self.__shape[0])
+
+        x_0, y_0, x_1, y_1 = window
+        stride = self.__stride
+
+        # Copy only the rows of the window out of the padded list
+        return np.array([
+            self.__g[row * stride + x_0 + 1:row * stride + x_1 + 1]
+            for row in range(y_0 + 1, y_1 + 1)]).reshape(
+                y_1 - y_0,
+                x_1 - x_0)
+
+
+    def set_goals(self, decision, goals):
+        """Replaces goal cells by the cells with goal values at or above
+        GOAL_THRESHOLD. Only the changed cells are seeded"""
+
+        # pylint: disable=unused-argument
+
+        goal_map = goals >= GOAL_THRESHOLD
+        changes = self.__changes(goal_map, self.__goal_map)
+
+        if not changes.size:
+            return
+
+        # Removed goals only raise distances, so they may wait for a batch
+        # unless the goals are switched
+        if not goal_map.ravel()[changes].any() and \
+            self.__goals_deferred + 1 < self.__goal_interval:
+
+            self.__goals_deferred += 1
+            return
+
+        self.__goals_deferred = 0
+        self.__goal_map = goal_map
+        self.__mark_pending(changes)
+
+
+    def update(self, decision, global_navi_map):
+        """Repairs distances around changed obstacles and goals within the
+        budget and refreshes cost map cells, which distances have changed"""
+
+        blocked_map = global_navi_map <= OBSTACLE_THRESHOLD
+        changes = self.__changes(blocked_map, self.__blocked_map)
+
+        if changes.size:
+            self.__blocked_map = blocked_map
+            self.__mark_pending(changes)
+
+        if self.__reseed_needed or decision.cost_map is not self.__cost_map:
+            self.__reseed(decision)
+
+        self.__work = 0
+        self.__seed()
+        self.__compute()
+
+        if not self.__dirty:
+            return
+
+        cells = np.array(self.__dirty)
+        g_values = self.__g
+        distances = np.array([g_values[cell] for cell in self.__dirty])
+        self.__dirty = []
+
+        rows, cols = np.divmod(cells, self.__stride)
+        costs = MAX_COST * np.power(self.__decay, distances)
+        decision.cost_map[rows - 1, cols - 1] = np.maximum(costs, MIN_COST)
+
+
+# Factories of planners by their names, taking the cost map shape
+PLANNERS = {
+    'value_iteration': lambda shape: ValueIterationPlanner(),
+    'dstar_lite': DStarLitePlanner,
+}
+
+
+def create_planner(name, shape=(200, 200)):
+    """Creates a planner by its name in PLANNERS"""
+    return PLANNERS[name](shape)
+
+
+def fit_cost_window(decision, window):
+    """Extends the cost map of the decision to cover the window (x0, y0, x1,
+    y1) of global map coordinates too. Costs of the previous window are kept,
+    and the planner moves its state into the new cost map. None windows are
+    ignored"""
+
+    if window is None:
+        return
+
+    x_0, y_0, x_1, y_1 = decision.cost_window
+
+    grown = (
+        min(x_0, window[0]),
+        min(y_0, window[1]),
+        max(x_1, window[2]),
+        max(y_1, window[3]))
+
+    if grown == decision.cost_window:
+        return
+
+    cost_map = np.zeros(
+        (grown[3] - grown[1], grown[2] - grown[0]),
+        decision.cost_map.dtype)
+
+    cost_map[
+        y_0 - grown[1]:y_1 - grown[1],
+        x_0 - grown[0]:x_1 - grown[0]] = decision.cost_map
+
+    decision.cost_map = cost_map
+    decision.cost_window = grown
+    decision.planner.resize(decision, (x_0 - grown[0], y_0 - grown[1]))
@@ -0,0 +1,53 @@
+#!python
+"""Storage precision modes of maps and images. Confidence maps are clipped
+to +-255 anyway, so float32 or saturating int16 storage is enough for them"""
+
+import numpy as np
+
+# Mode name -> (dtype of maps and images, dtype of scores, warps and cost map)
+PRECISIONS = {
+    'float64': (np.float64, np.float64),
+    'float32': (np.float32, np.float32),
+    'int16': (np.int16, np.float32),
+}
+
+DEFAULT_PRECISION = 'float64'
+
+
+def storage_dtype(precision):
+    """Returns dtype of the maps and images in the precision mode"""
+    return PRECISIONS[precision][0]
+
+
+def work_dtype(precision):
+    """Returns dtype of the scores, warps and the cost map in the precision
+    mode"""
+    return PRECISIONS[precision][1]
+
+
+def is_integer(array):
+    """Returns true if the map or image stores integers"""
+    return np.issubdtype(array.dtype, np.integer)
+
+
+def accumulate(target, values, low=-255.0, high=255.0):
+    """Adds values to the target in place and clips the sums. Integer targets
+    receive rounded values and saturate instead of overflowing"""
+
+    if is_integer(target):
+        np.copyto(
+            target,
+            np.clip(target + np.rint(values), low, high),
+            casting='unsafe')
+    else:
+        target += values
+        np.clip(target, low, high, out=target)
+
+
+def scale(target, factor):
+    """Multiplies the target by factor in place, rounding integer targets"""
+
+    if is_integer(target):
+        np.copyto(target, np.rint(target * factor), casting='unsafe')
+    else:
+        target *= factor
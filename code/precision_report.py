@@ -0,0 +1,128 @@
+#!python
+"""Replays a recorded run in each precision mode and compares mapped
+percentage, fidelity, chosen directions, speed and state memory against
+float64"""
+
+import argparse
+import math
+
+import numpy as np
+
+import precision
+import replay
+from rover_state import RoverState
+from tiled_map import TiledMap
+
+
+def state_nbytes(rover):
+    """Returns the memory, occupied by maps and images of the rover"""
+
+    arrays = [
+        rover.map.global_conf_rocks,
+        rover.map.global_conf_navi,
+        rover.map.local_rocks,
+        rover.map.local_navi,
+        rover.decision.cost_map,
+        rover.statistics.vision_image,
+        rover.statistics.worldmap,
+        rover.statistics.ground_truth]
+
+    return sum(
+        array.nbytes for array in arrays
+        if isinstance(array, (np.ndarray, TiledMap)))
+
+
+def run_mode(records, precision_mode, tile_size):
+    """Replays records in the precision mode, returning the summary and the
+    nav_dir angle of each frame in degrees"""
+
+    rover = RoverState(tile_size, precision_mode)
+    rover.statistics.samples_to_find = replay.DEFAULT_SAMPLES_TO_FIND
+
+    angles = []
+
+    def on_frame(_, frame_rover):
+        nav_dir = frame_rover.decision.nav_dir
+        angles.append(math.degrees(math.atan2(nav_dir[1], nav_dir[0])))
+
+    result = replay.run_replay(
+        replay.FramePrefetcher(records),
+        rover,
+        on_frame=on_frame)
+
+    _, perc_mapped, fidelity = replay.render_worldmap(result.rover)
+
+    return {
+        'mapped': perc_mapped,
+        'fidelity': fidelity,
+        'fps': len(result.latencies) / result.elapsed,
+        'nbytes': state_nbytes(result.rover),
+    }, np.array(angles)
+
+
+def angle_errors(angles, reference):
+    """Returns absolute differences of angles in degrees, wrapped to 180"""
+    return np.abs((angles - reference + 180.0) % 360.0 - 180.0)
+
+
+def main():
+    """Prints the accuracy report"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        'log',
+        type=str,
+        nargs='?',
+        default=replay.DEFAULT_LOG,
+        help='Path to the robot_log.csv of the recorded run')
+
+    parser.add_argument(
+        '--tile-size',
+        type=int,
+        default=None,
+        help='Keep global maps in sparse tiles of the given size. The cost '
+             'map grows with explored tiles, the worldmap covers the 200x200 '
+             'ground truth')
+
+    parser.add_argument(
+        '--max-angle',
+        type=float,
+        default=5.0,
+        help='Directions within the angle in degrees count as agreeing')
+
+    args = parser.parse_args()
+
+    records = replay.read_log(args.log)
+
+    reference, reference_angles = run_mode(
+        records,
+        precision.DEFAULT_PRECISION,
+        args.tile_size)
+
+    print("{:<8} {:>7} {:>9} {:>7} {:>9} {:>10} {:>10} {:>7}".format(
+        "mode", "mapped", "fidelity", "FPS", "state KB",
+        "dir p50", "dir p95", "agree"))
+
+    for precision_mode in sorted(precision.PRECISIONS):
+        if precision_mode == precision.DEFAULT_PRECISION:
+            summary, angles = reference, reference_angles
+        else:
+            summary, angles = run_mode(records, precision_mode, args.tile_size)
+
+        errors = angle_errors(angles, reference_angles)
+
+        print("{:<8} {:>6.1f}% {:>8.1f}% {:>7.1f} {:>9d} {:>9.2f}d "
+              "{:>9.2f}d {:>6.1f}%".format(
+                  precision_mode,
+                  summary['mapped'],
+                  summary['fidelity'],
+                  summary['fps'],
+                  summary['nbytes'] // 1024,
+                  np.median(errors),
+                  np.percentile(errors, 95),
+                  100.0 * np.mean(errors <= args.max_angle)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!python
+"""Records camera frames and telemetry of a run on a background thread in
+the layout of test_dataset: IMG/ folder with frames and robot_log.csv index,
+so that recorded runs can be replayed"""
+
+import argparse
+import os
+import queue
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import replay
+from supporting_functions import convert_to_float
+
+LOG_NAME = 'robot_log.csv'
+IMAGE_SUBFOLDER = 'IMG'
+
+LOG_COLUMNS = [
+    'Path',
+    'SteerAngle',
+    'Throttle',
+    'Brake',
+    'Speed',
+    'X_Position',
+    'Y_Position',
+    'Pitch',
+    'Yaw',
+    'Roll']
+
+# Frames, waiting to be written, before new ones are dropped
+DEFAULT_DEPTH = 256
+
+# Frames, written and indexed before the log is flushed
+DEFAULT_BATCH_SIZE = 16
+
+
+def frame_name(utc_time, sequence=0):
+    """Returns a frame file name, which encodes the recording time the way
+    replay.parse_timestamp() expects it. The time has millisecond resolution,
+    so the sequence number of the frame keeps names of close frames apart"""
+
+    return 'robocam_{}_{:06d}.jpg'.format(
+        utc_time.strftime('%Y_%m_%d_%H_%M_%S_%f')[:-3],
+        sequence)
+
+
+def log_row(path, data):
+    """Formats simulator telemetry fields into a robot_log.csv row"""
+
+    xpos, ypos = [convert_to_float(pos.strip())
+                  for pos in data["position"].split(';')]
+
+    values = [
+        convert_to_float(data["steering_angle"]),
+        convert_to_float(data["throttle"]),
+        convert_to_float(data.get("brake", "0")),
+        convert_to_float(data["speed"]),
+        xpos,
+        ypos,
+        convert_to_float(data["pitch"]),
+        convert_to_float(data["yaw"]),
+        convert_to_float(data["roll"])]
+
+    return ';'.join([path] + [repr(float(value)) for value in values])
+
+
+class FrameRecorder:
+    """Writes JPEG frames, as received from the simulator, and their log rows
+    in batches on a worker thread. If the worker falls behind, new frames are
+    dropped rather than delaying the telemetry handler. Frames, which fail to
+    be written, are counted as dropped too"""
+
+    def __init__(
+            self,
+            folder,
+            depth=DEFAULT_DEPTH,
+            batch_size=DEFAULT_BATCH_SIZE):
+
+        self.folder = folder
+        self.__batch_size = batch_size
+
+        os.makedirs(os.path.join(folder, IMAGE_SUBFOLDER), exist_ok=True)
+
+        self.__log = open(os.path.join(folder, LOG_NAME), 'w', newline='')
+        self.__log.write(';'.join(LOG_COLUMNS) + '\n')
+
+        self.__queue = queue.Queue(maxsize=depth)
+
+        self.recorded = 0
+        self.written = 0
+        self.__queue_drops = 0
+        self.__failed = 0
+        self.__sequence = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+
+    def record(self, jpeg_bytes, data, utc_time=None):
+        """Queues a frame with its telemetry fields, received at utc_time or
+        now. Returns false if the frame is dropped because the queue is full"""
+
+        if utc_time is None:
+            utc_time = datetime.utcnow()
+
+        item = (utc_time, jpeg_bytes, data)
+
+        try:
+            self.__queue.put_nowait(item)
+        except queue.Full:
+            self.__queue_drops += 1
+            return False
+
+        self.recorded += 1
+        return True
+
+
+    @property
+    def dropped(self):
+        """Frames, which did not fit into the queue or failed to be written"""
+        return self.__queue_drops + self.__failed
+
+
+    def close(self):
+        """Writes the queued frames, stops the worker and closes the log"""
+
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__log.close()
+
+
+    def __run(self):
+        while True:
+            batch = [self.__queue.get()]
+
+            while batch[-1] is not None and len(batch) < self.__batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+
+            start = time.perf_counter()
+            self.__write(batch)
+            self.write_seconds += time.perf_counter() - start
+
+            if stop:
+                return
+
+
+    def __write(self, batch):
+        # Keep the worker alive on failures, losing only the frames, which
+        # failed
+        # pylint: disable=broad-except
+
+        rows = []
+
+        for utc_time, jpeg_bytes, data in batch:
+            path = os.path.join(
+                self.folder,
+                IMAGE_SUBFOLDER,
+                frame_name(utc_time, self.__sequence))
+
+            self.__sequence += 1
+
+            try:
+                row = log_row(path, data)
+
+                with open(path, 'wb') as frame_file:
+                    frame_file.write(jpeg_bytes)
+            except Exception:
+                traceback.print_exc()
+                self.__failed += 1
+                continue
+
+            rows.append(row)
+
+        try:
+            self.__log.write(''.join(row + '\n' for row in rows))
+            self.__log.flush()
+        except Exception:
+            traceback.print_exc()
+            self.__failed += len(rows)
+            return
+
+        self.written += len(rows)
+        self.batches += 1
+
+
+def main():
+    """Re-records test_dataset frames through the recorder and reports how
+    long the telemetry handler would wait for it"""
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('folder', type=str, help='Output folder.')
+    parser.add_argument('--log', type=str, default=replay.DEFAULT_LOG)
+    args = parser.parse_args()
+
+    recorder = FrameRecorder(args.folder)
+    spent = 0.0
+
+    for record in replay.read_log(args.log):
+        with open(record.path, 'rb') as frame_file:
+            jpeg_bytes = frame_file.read()
+
+        data = {
+            'steering_angle': str(record.steer),
+            'throttle': str(record.throttle),
+            'brake': str(record.brake),
+            'speed': str(record.speed),
+            'position': '{};{}'.format(record.xpos, record.ypos),
+            'pitch': str(record.pitch),
+            'yaw': str(record.yaw),
+            'roll': str(record.roll)}
+
+        start = time.perf_counter()
+        recorder.record(
+            jpeg_bytes,
+            data,
+            datetime.fromtimestamp(record.timestamp))
+        spent += time.perf_counter() - start
+
+    recorder.close()
+
+    print("Recorded {} frames in {} batches, dropped {}".format(
+        recorder.written, recorder.batches, recorder.dropped))
+    print("Handler time {:.1f} us per frame, writer time {:.1f} us".format(
+        1e6 * spent / max(recorder.recorded, 1),
+        1e6 * recorder.write_seconds / max(recorder.written, 1)))
+
+
+if __name__ == '__main__':
+    main()
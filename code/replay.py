@@ -0,0 +1,438 @@
+#!python
+"""Replays a recorded run through perception and decision steps without the
+simulator, reporting throughput, per-frame latency and the final worldmap"""
+
+import argparse
+import collections
+import csv
+import functools
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import cv2
+
+import classifiers
+import planners
+import precision
+import run_log
+from decision import decision_step
+from map_metrics import SampleIndex
+from perception import perception_step, use_scale
+from rover_state import RoverState
+from scheduler import UNSCHEDULED, StageScheduler, parse_rates
+from supporting_functions import create_output_map, output_statistics
+
+DEFAULT_LOG = '../test_dataset/robot_log.csv'
+DEFAULT_WORLDMAP = '../output/replay_worldmap.png'
+
+# The number of rock samples in the simulator world
+DEFAULT_SAMPLES_TO_FIND = 6
+
+# Used for frames, which file names carry no recording timestamp
+DEFAULT_FRAME_PERIOD = 1.0 / 15.0
+
+TIMESTAMP_PATTERN = re.compile(r'(\d{4}(?:_\d{2}){5}_\d{3})')
+
+LogRecord = collections.namedtuple('LogRecord', [
+    'path',
+    'timestamp',
+    'steer',
+    'throttle',
+    'brake',
+    'speed',
+    'xpos',
+    'ypos',
+    'pitch',
+    'yaw',
+    'roll'])
+
+
+def parse_timestamp(path):
+    """Returns recording time in seconds, encoded into the frame file name, or
+    None if the name has no timestamp"""
+
+    match = TIMESTAMP_PATTERN.search(os.path.basename(path))
+    if match is None:
+        return None
+
+    stamp = datetime.strptime(match.group(1), '%Y_%m_%d_%H_%M_%S_%f')
+    return stamp.timestamp()
+
+
+def resolve_frame_path(path, log_folder):
+    """Finds a frame file, listed in a log, either relative to the current
+    folder or to the folder of the log"""
+
+    if os.path.exists(path):
+        return path
+
+    return os.path.join(log_folder, 'IMG', os.path.basename(path))
+
+
+def parse_field(text):
+    """Converts a log field to float independent of decimal convention,
+    returning NaN for corrupted values"""
+
+    try:
+        return float(text.replace(',', '.'))
+    except ValueError:
+        return np.nan
+
+
+def read_log(log_path):
+    """Reads ';'-separated robot log into a list of LogRecord"""
+
+    log_folder = os.path.dirname(log_path)
+    records = []
+
+    with open(log_path, newline='') as log_file:
+        for row in csv.DictReader(log_file, delimiter=';'):
+            timestamp = parse_timestamp(row['Path'])
+            if timestamp is None:
+                timestamp = (
+                    records[-1].timestamp + DEFAULT_FRAME_PERIOD
+                    if records else 0.0)
+
+            records.append(LogRecord(
+                path=resolve_frame_path(row['Path'], log_folder),
+                timestamp=timestamp,
+                steer=parse_field(row['SteerAngle']),
+                throttle=parse_field(row['Throttle']),
+                brake=parse_field(row['Brake']),
+                speed=parse_field(row['Speed']),
+                xpos=parse_field(row['X_Position']),
+                ypos=parse_field(row['Y_Position']),
+                pitch=parse_field(row['Pitch']),
+                yaw=parse_field(row['Yaw']),
+                roll=parse_field(row['Roll'])))
+
+    return records
+
+
+def read_frame(path):
+    """Decodes a camera frame into RGB array, like the simulator images"""
+
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise IOError("Cannot read frame " + path)
+
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+class FramePrefetcher:
+    """Decodes frames of the log records on a background thread, yielding
+    (record, img) pairs in the original order"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, records, depth=32):
+        self.__records = records
+        self.__queue = queue.Queue(maxsize=depth)
+        self.__thread = threading.Thread(target=self.__decode, daemon=True)
+        self.__thread.start()
+
+
+    def __decode(self):
+        for record in self.__records:
+            # Any failure is passed on to the reader, which would otherwise
+            # wait for the frames forever
+            try:
+                self.__queue.put((record, read_frame(record.path)))
+            except Exception as error: # pylint: disable=broad-except
+                self.__queue.put((record, error))
+                return
+
+        self.__queue.put(None)
+
+
+    def __iter__(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+
+            record, img = item
+            if isinstance(img, Exception):
+                raise img
+
+            yield record, img
+
+
+def open_frames(log_path, count=None):
+    """Returns the first count or all (record, img) frames of a robot_log.csv
+    with JPEG files or of a binary run log, recorded at the path"""
+
+    if run_log.is_run_log(log_path):
+        return run_log.RunLog(log_path).frames(0, count)
+
+    return FramePrefetcher(read_log(log_path)[:count])
+
+
+def convert_log(log_path, output):
+    """Converts robot_log.csv with JPEG files into a binary run log"""
+
+    records = read_log(log_path)
+    run_log.write_run_log(output, FramePrefetcher(records), len(records))
+
+
+def is_valid_record(record):
+    """Returns true if speed and pose of the record are not corrupted"""
+
+    return np.all(np.isfinite([
+        record.speed,
+        record.xpos,
+        record.ypos,
+        record.pitch,
+        record.yaw,
+        record.roll]))
+
+
+def populate_rover(rover, record, img, start_time):
+    """Writes a log record into rover the way update_rover() does with the
+    simulator telemetry"""
+
+    if rover.time.start is None:
+        rover.time.start = start_time
+        rover.statistics.samples_pos = (
+            np.array([], np.int_),
+            np.array([], np.int_))
+        rover.statistics.samples_index = SampleIndex(
+            rover.statistics.samples_pos,
+            rover.statistics.worldmap)
+
+    rover.time.total = record.timestamp - rover.time.start
+
+    rover.perception.vel = record.speed
+    rover.perception.pos = [record.xpos, record.ypos]
+    rover.perception.yaw_deg = record.yaw
+    rover.perception.pitch_deg = record.pitch
+    rover.perception.roll_deg = record.roll
+    rover.perception.near_sample = 0
+    rover.perception.img = img
+
+    rover.control.throttle = record.throttle
+    rover.control.steer = record.steer
+    rover.control.picking_up = 0
+
+
+ReplayResult = collections.namedtuple('ReplayResult', [
+    'rover',
+    'latencies',
+    'elapsed',
+    'invalid'])
+
+
+def run_replay(
+        frames,
+        rover=None,
+        realtime=False,
+        on_frame=None,
+        scheduler=None):
+    """Runs (record, img) frames through perception and decision steps.
+    If realtime is set, frames are paced to the original timestamps. If set,
+    on_frame(record, rover) is called after each valid frame and scheduler,
+    a scheduler.StageScheduler, runs the stages of each frame"""
+
+    if rover is None:
+        rover = RoverState()
+        rover.statistics.samples_to_find = DEFAULT_SAMPLES_TO_FIND
+
+    stages = UNSCHEDULED if scheduler is None else scheduler
+
+    latencies = []
+    invalid = 0
+    wall_start = time.perf_counter()
+    first_timestamp = None
+
+    for record, img in frames:
+        if first_timestamp is None:
+            first_timestamp = record.timestamp
+
+        if realtime:
+            delay = (record.timestamp - first_timestamp) - (
+                time.perf_counter() - wall_start)
+
+            if delay > 0:
+                time.sleep(delay)
+
+        start = time.perf_counter()
+
+        # Like telemetry() does with invalid data, skip corrupted records
+        if is_valid_record(record):
+            stages.begin_frame(start)
+            populate_rover(rover, record, img, first_timestamp)
+            rover = perception_step(rover, stages)
+
+            stages.run(
+                'decision_step',
+                functools.partial(decision_step, rover),
+                critical=True)
+
+            stages.end_frame()
+
+            if on_frame is not None:
+                on_frame(record, rover)
+        else:
+            invalid += 1
+
+        latencies.append(time.perf_counter() - start)
+
+    return ReplayResult(
+        rover,
+        np.array(latencies),
+        time.perf_counter() - wall_start,
+        invalid)
+
+
+def render_worldmap(rover):
+    """Returns the worldmap inset with statistics, mapped percentage and
+    fidelity of the rover map"""
+
+    map_add, _, samples_located = create_output_map(rover)
+    output_statistics(map_add, rover, samples_located)
+    perc_mapped, fidelity = rover.statistics.metrics.statistics()
+
+    return map_add, perc_mapped, fidelity
+
+
+def main():
+    """Replays the log and prints the report"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        'log',
+        type=str,
+        nargs='?',
+        default=DEFAULT_LOG,
+        help='Path to the robot_log.csv or the binary run log of the '
+             'recorded run')
+
+    parser.add_argument(
+        '--realtime',
+        action='store_true',
+        help='Pace frames to the original timestamps')
+
+    parser.add_argument(
+        '--worldmap',
+        type=str,
+        default=DEFAULT_WORLDMAP,
+        help='Path to save the final worldmap image')
+
+    parser.add_argument(
+        '--lut-bits',
+        type=int,
+        default=None,
+        help='Classify colors with lookup tables of the given number of bits')
+
+    parser.add_argument(
+        '--planner',
+        type=str,
+        default='value_iteration',
+        choices=sorted(planners.PLANNERS),
+        help='Planner, filling the cost map towards the goals')
+
+    parser.add_argument(
+        '--tile-size',
+        type=int,
+        default=None,
+        help='Keep global maps in sparse tiles of the given size. The cost '
+             'map grows with explored tiles, the worldmap covers the 200x200 '
+             'ground truth')
+
+    parser.add_argument(
+        '--precision',
+        type=str,
+        default=precision.DEFAULT_PRECISION,
+        choices=sorted(precision.PRECISIONS),
+        help='Storage precision of maps and images')
+
+    parser.add_argument(
+        '--convert',
+        type=str,
+        default=None,
+        help='Convert robot_log.csv into a binary run log at the given path '
+             'instead of replaying it')
+
+    parser.add_argument(
+        '--check-metrics',
+        action='store_true',
+        help='Verify incremental mapped and fidelity counts against the full '
+             'recount every frame')
+
+    parser.add_argument(
+        '--budget-ms',
+        type=float,
+        default=None,
+        help='Latency budget of a frame; non-critical stages, which do not '
+             'fit into it, are shed')
+
+    parser.add_argument(
+        '--rates',
+        type=str,
+        default=None,
+        help='Comma-separated stage rates, like update_cost_map=3 for every '
+             'third frame or update_vision_image=2hz')
+
+    parser.add_argument(
+        '--scale',
+        type=float,
+        default=1.0,
+        help='Perception scale of camera images and the local top view '
+             'relative to the simulator camera')
+
+    args = parser.parse_args()
+
+    if args.convert is not None:
+        convert_log(args.log, args.convert)
+        print("Run log: {}".format(args.convert))
+        return
+
+    if args.lut_bits is not None:
+        classifiers.use_lookup_tables(args.lut_bits)
+
+    use_scale(args.scale)
+
+    rover = RoverState(args.tile_size, args.precision, args.planner)
+    rover.statistics.samples_to_find = DEFAULT_SAMPLES_TO_FIND
+    rover.statistics.metrics.check = args.check_metrics
+
+    scheduler = None
+    if args.budget_ms is not None or args.rates is not None:
+        scheduler = StageScheduler(
+            None if args.budget_ms is None else args.budget_ms / 1000.0,
+            parse_rates(args.rates or ''))
+
+    result = run_replay(
+        open_frames(args.log),
+        rover,
+        realtime=args.realtime,
+        scheduler=scheduler)
+
+    map_add, perc_mapped, fidelity = render_worldmap(result.rover)
+    cv2.imwrite(
+        args.worldmap,
+        cv2.cvtColor(map_add.astype(np.uint8), cv2.COLOR_RGB2BGR))
+
+    latencies_ms = 1000.0 * result.latencies
+
+    print("Frames:   {} ({} invalid)".format(
+        len(latencies_ms), result.invalid))
+    print("FPS:      {:.1f}".format(len(latencies_ms) / result.elapsed))
+    print("Latency:  p50 {:.2f} ms, p95 {:.2f} ms, p99 {:.2f} ms, "
+          "max {:.2f} ms".format(*np.percentile(latencies_ms, [50, 95, 99, 100])))
+    print("Mapped:   {}%".format(perc_mapped))
+    print("Fidelity: {}%".format(fidelity))
+    print("Worldmap: {}".format(args.worldmap))
+
+    if scheduler is not None:
+        print('\n'.join(scheduler.report()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!python
+"""State of the rover, shared by perception, decision and output routines"""
+
+import numpy as np
+
+import planners
+import precision
+import transformations
+from images import GROUND_TRUTH_3D
+from map_metrics import MapMetrics
+from tiled_map import TiledMap
+
+# pylint: disable=too-few-public-methods
+
+class Perception():
+    """The class retains perception rover parameters"""
+
+    def __init__(self):
+        self.img = None  # Current camera image
+        self.pos = None  # Current position (x, y)
+        self.yaw_deg = None  # Current yaw angle
+        self.pitch_deg = None  # Current pitch angle
+        self.roll_deg = None  # Current roll angle
+        self.vel = None  # Current velocity
+        self.near_sample = 0  # Will be set to telemetry data["near_sample"]
+
+
+class Control():
+    """The class retains control rover parameters"""
+
+    def __init__(self):
+        self.steer = 0  # Current steering angle
+        self.throttle = 0  # Current throttle value
+        self.brake = 0  # Current brake value
+        self.picking_up = False # Is the stone being picked up
+        self.send_pickup = False  # Set to True to trigger rock pickup
+
+
+class Decision():
+    """The class retains rover parameters for decision making"""
+
+    def __init__(self, dtype=np.float64, planner='value_iteration'):
+        self.nav_dir = None  # Angles of navigable terrain pixels
+        self.nav_pixels = None  # Number of navigatable pixels
+        self.mode = 'forward'  # Current mode (can be forward or stop)
+        self.cost_map = np.zeros((200, 200), dtype)
+
+        # Window (x0, y0, x1, y1) of global map coordinates, covered by
+        # cost_map. It grows with the explored tiles of tiled maps
+        self.cost_window = (0, 0, 200, 200)
+
+        # Fills cost_map
+        self.planner_name = planner
+        self.planner = planners.create_planner(planner, self.cost_map.shape)
+        self.stuck_pos = None
+        self.stuck_time = None
+
+
+class Map():
+    """The class retains map data. If tile_size is set, global maps are
+    sparse TiledMap instances, not limited to the simulator world size. The
+    cost map follows their explored tiles, while the worldmap and its
+    statistics stay in the 200x200 region of the ground truth"""
+
+    def __init__(self, tile_size=None, dtype=np.float64):
+        if tile_size is None:
+            self.global_conf_rocks = np.zeros((200, 200), dtype)
+            self.global_conf_navi = np.zeros((200, 200), dtype)
+        else:
+            self.global_conf_rocks = TiledMap(tile_size, dtype)
+            self.global_conf_navi = TiledMap(tile_size, dtype)
+
+        # Local maps have the top view size of the perception scale
+        top_shape = (transformations.TOP_HEIGHT, transformations.TOP_WIDTH)
+        self.local_rocks = np.zeros(top_shape, dtype)
+        self.local_navi = np.zeros(top_shape, dtype)
+
+        self.rocks_decay = 1.0  # Decay of rocks map, not applied yet
+
+
+class Time():
+    """Timing information"""
+
+    def __init__(self):
+        self.start = None  # To record the start time of navigation
+        self.total = None  # To record total duration of naviagation
+
+
+class Statistics():
+    """The class retains statistics parameters for decision making"""
+
+    def __init__(self, dtype=np.float64):
+        self.samples_pos = None  # To store the actual sample positions
+        self.samples_index = None  # Rock detections near samples_pos
+        self.samples_to_find = 0  # To store the initial count of samples
+        self.samples_collected = 0  # To count the number of samples collected
+
+        self.vision_image = np.zeros(
+            (transformations.TOP_HEIGHT, transformations.TOP_WIDTH, 3),
+            dtype)
+        self.worldmap = np.zeros((200, 200, 3), dtype)
+
+        # Ground truth worldmap
+        self.ground_truth = GROUND_TRUTH_3D.astype(dtype, copy=False)
+
+        # Mapped percentage and fidelity of worldmap
+        self.metrics = MapMetrics(self.ground_truth)
+
+
+class RoverState():
+    """The class retains all rover parameters. Maps and images are stored
+    with the dtype of the precision mode, see precision.PRECISIONS. Global
+    maps are tiled if tile_size is set. planner is a name in
+    planners.PLANNERS"""
+
+    def __init__(
+            self,
+            tile_size=None,
+            precision_mode=precision.DEFAULT_PRECISION,
+            planner='value_iteration'):
+        storage_dtype = precision.storage_dtype(precision_mode)
+        work_dtype = precision.work_dtype(precision_mode)
+
+        self.precision = precision_mode
+        self.perception = Perception()
+        self.control = Control()
+        self.decision = Decision(work_dtype, planner)
+        self.map = Map(tile_size, storage_dtype)
+        self.time = Time()
+        self.statistics = Statistics(storage_dtype)
@@ -0,0 +1,122 @@
+#!python
+"""Binary run log: a folder with a memory-mapped array of all camera frames
+and one array per telemetry column, so that replays read frames without
+parsing text and decoding JPEG files"""
+
+import collections
+import os
+
+import numpy as np
+
+FRAMES_NAME = 'frames.npy'
+
+# Telemetry columns in the order of replay.LogRecord fields after path.
+# Timestamps must not decrease, serving as the index to seek frames
+COLUMNS = [
+    'timestamp',
+    'steer',
+    'throttle',
+    'brake',
+    'speed',
+    'xpos',
+    'ypos',
+    'pitch',
+    'yaw',
+    'roll']
+
+RunRecord = collections.namedtuple('RunRecord', ['path'] + COLUMNS)
+
+
+def is_run_log(path):
+    """Returns true if the path refers to a binary run log"""
+    return os.path.isfile(os.path.join(path, FRAMES_NAME))
+
+
+def write_run_log(output, frames, count):
+    """Writes count (record, img) frames into a binary run log folder. Records
+    need attributes, named after COLUMNS; images must be of the same shape"""
+
+    # The shape of the frame array is taken from the first frame
+    if count < 1:
+        raise ValueError("A run log needs at least one frame")
+
+    os.makedirs(output, exist_ok=True)
+
+    columns = {name: np.empty(count, np.float64) for name in COLUMNS}
+    frame_array = None
+    written = 0
+
+    for idx, (record, img) in enumerate(frames):
+        if idx >= count:
+            break
+
+        if frame_array is None:
+            frame_array = np.lib.format.open_memmap(
+                os.path.join(output, FRAMES_NAME),
+                mode='w+',
+                dtype=np.uint8,
+                shape=(count,) + img.shape)
+
+        frame_array[idx] = img
+
+        for name in COLUMNS:
+            columns[name][idx] = getattr(record, name)
+
+        written = idx + 1
+
+    if written != count:
+        raise ValueError("Expected {} frames, got {}".format(count, written))
+
+    if np.any(np.diff(columns['timestamp']) < 0):
+        raise ValueError("Frame timestamps must not decrease")
+
+    frame_array.flush()
+
+    for name, values in columns.items():
+        np.save(os.path.join(output, name + '.npy'), values)
+
+
+class RunLog:
+    """Reads a binary run log. Frames are views into the memory-mapped array,
+    loaded from disk on access"""
+
+    def __init__(self, path):
+        self.path = path
+        self.frame_array = np.load(
+            os.path.join(path, FRAMES_NAME),
+            mmap_mode='r')
+
+        self.columns = {
+            name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+            for name in COLUMNS}
+
+
+    def __len__(self):
+        return len(self.frame_array)
+
+
+    def record(self, idx):
+        """Returns telemetry of the frame as a record, compatible with
+        replay.LogRecord"""
+
+        return RunRecord(
+            '{}#{}'.format(self.path, idx),
+            *[float(self.columns[name][idx]) for name in COLUMNS])
+
+
+    def seek(self, timestamp):
+        """Returns index of the first frame, recorded not before timestamp"""
+
+        return int(np.searchsorted(
+            self.columns['timestamp'],
+            timestamp,
+            side='left'))
+
+
+    def frames(self, start=0, stop=None):
+        """Yields (record, img) pairs of frames in [start, stop) range"""
+
+        stop = len(self) if stop is None else min(stop, len(self))
+
+        for idx in range(start, stop):
+            yield self.record(idx), self.frame_array[idx]
@@ -0,0 +1,116 @@
+#!python
+"""Replays a recorded run at each perception scale and compares mapped
+percentage, fidelity, chosen directions, steering commands and speed against
+the full resolution"""
+
+import argparse
+import math
+
+import numpy as np
+
+import perception
+import precision_report
+import replay
+from rover_state import RoverState
+
+DEFAULT_SCALES = '1.0,0.75,0.5,0.25'
+
+
+def run_scale(records, scale):
+    """Replays records at the perception scale, returning the summary, the
+    nav_dir angle and the steering command of each frame in degrees"""
+
+    perception.use_scale(scale)
+
+    rover = RoverState()
+    rover.statistics.samples_to_find = replay.DEFAULT_SAMPLES_TO_FIND
+
+    angles = []
+    steers = []
+
+    def on_frame(_, frame_rover):
+        nav_dir = frame_rover.decision.nav_dir
+        angles.append(math.degrees(math.atan2(nav_dir[1], nav_dir[0])))
+        steers.append(float(frame_rover.control.steer))
+
+    try:
+        result = replay.run_replay(
+            replay.FramePrefetcher(records),
+            rover,
+            on_frame=on_frame)
+    finally:
+        perception.use_scale(1.0)
+
+    _, perc_mapped, fidelity = replay.render_worldmap(result.rover)
+
+    return {
+        'mapped': perc_mapped,
+        'fidelity': fidelity,
+        'fps': len(result.latencies) / result.elapsed,
+    }, np.array(angles), np.array(steers)
+
+
+def main():
+    """Prints the throughput and accuracy report"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        'log',
+        type=str,
+        nargs='?',
+        default=replay.DEFAULT_LOG,
+        help='Path to the robot_log.csv of the recorded run')
+
+    parser.add_argument(
+        '--scales',
+        type=str,
+        default=DEFAULT_SCALES,
+        help='Comma-separated perception scales, compared with 1.0')
+
+    parser.add_argument(
+        '--max-angle',
+        type=float,
+        default=5.0,
+        help='Directions and steering commands within the angle in degrees '
+             'count as agreeing')
+
+    args = parser.parse_args()
+
+    records = replay.read_log(args.log)
+
+    reference, reference_angles, reference_steers = run_scale(records, 1.0)
+
+    print("{:<6} {:>7} {:>9} {:>7} {:>8} {:>10} {:>10} {:>7} {:>7}".format(
+        "scale", "mapped", "fidelity", "FPS", "speedup",
+        "dir p50", "dir p95", "agree", "steer"))
+
+    for scale in [float(scale) for scale in args.scales.split(',')]:
+        if scale == 1.0:
+            summary, angles, steers = \
+                reference, reference_angles, reference_steers
+        else:
+            summary, angles, steers = run_scale(records, scale)
+
+        errors = precision_report.angle_errors(angles, reference_angles)
+
+        print("{:<6g} {:>6.1f}% {:>8.1f}% {:>7.1f} {:>7.2f}x {:>9.2f}d "
+              "{:>9.2f}d {:>6.1f}% {:>6.1f}%".format(
+                  scale,
+                  summary['mapped'],
+                  summary['fidelity'],
+                  summary['fps'],
+                  summary['fps'] / reference['fps'],
+                  np.median(errors),
+                  np.percentile(errors, 95),
+                  100.0 * np.mean(errors <= args.max_angle),
+                  100.0 * np.mean(np.isclose(
+                      steers,
+                      reference_steers,
+                      rtol=0.0,
+                      atol=args.max_angle,
+                      equal_nan=True))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!python
+"""Runs stages of a telemetry frame at their own rates within a per-frame
+latency budget. Critical stages, which the control command depends on, run
+every frame. Others run when they are due by their rates and, if a budget
+is set, when their estimated duration fits into the time left after the
+critical stages; otherwise they are shed and stay due for the next frame.
+A stage, shed in too many frames in a row, runs regardless of the budget"""
+
+import collections
+import time
+
+# Weight of the latest duration in the running estimate of a stage duration
+ESTIMATE_WEIGHT = 0.2
+
+# Minimum frames and seconds between runs of a stage
+Rate = collections.namedtuple('Rate', ['frames', 'seconds'])
+
+EVERY_FRAME = Rate(1, 0.0)
+
+# Frames in a row, in which a stage may be shed before it is run anyway
+DEFAULT_MAX_SHED = 10
+
+
+def parse_rates(text):
+    """Parses comma-separated stage=rate items, where a rate is either a
+    number of frames, like update_cost_map=3, or a frequency, like
+    create_output_images=2hz. Returns a dictionary of Rate by stage names"""
+
+    rates = {}
+
+    for item in text.split(','):
+        if not item.strip():
+            continue
+
+        name, value = (part.strip() for part in item.split('='))
+
+        if value.lower().endswith('hz'):
+            rates[name] = Rate(1, 1.0 / float(value[:-2]))
+        else:
+            rates[name] = Rate(int(value), 0.0)
+
+    return rates
+
+
+class Unscheduled:
+    """Runs every stage every frame, the way the telemetry loop does without
+    a scheduler"""
+
+    # pylint: disable=no-self-use, unused-argument
+
+    def begin_frame(self, start=None):
+        """Does nothing, frames have no deadlines"""
+
+
+    def run(self, name, function, critical=False):
+        """Runs the stage function and returns True"""
+
+        function()
+        return True
+
+
+    def end_frame(self):
+        """Returns True, frames have no deadlines"""
+        return True
+
+
+UNSCHEDULED = Unscheduled()
+
+
+class StageScheduler:
+    """Decides which stages of a frame run. Frames are enclosed by
+    begin_frame() and end_frame() calls, which count missed deadlines. If
+    set, metrics receives stage durations and shed stage counters"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+            self,
+            budget=None,
+            rates=None,
+            metrics=None,
+            max_shed=DEFAULT_MAX_SHED,
+            clock=time.perf_counter):
+
+        # pylint: disable=too-many-arguments
+
+        self.budget = budget
+        self.rates = dict(rates or {})
+        self.max_shed = max_shed
+
+        self.__metrics = metrics
+        self.__clock = clock
+
+        self.__estimates = {}
+        self.__critical = set()
+        self.__last_frames = {}
+        self.__last_times = {}
+        self.__shed_in_row = collections.Counter()
+
+        self.__frame = 0
+        self.__start = None
+        self.__done = set()
+
+        self.frames = 0
+        self.missed = 0
+        self.runs = collections.Counter()
+        self.deferred = collections.Counter()
+        self.shed = collections.Counter()
+
+
+    def begin_frame(self, start=None):
+        """Starts the deadline of a frame, received at start time, now by
+        default"""
+
+        self.__frame += 1
+        self.__start = self.__clock() if start is None else start
+        self.__done = set()
+
+
+    def remaining(self):
+        """Returns seconds left until the deadline, None without a budget"""
+
+        if self.budget is None:
+            return None
+
+        return self.budget - (self.__clock() - self.__start)
+
+
+    def run(self, name, function, critical=False):
+        """Runs the stage function unless the stage is not due or does not
+        fit into the budget. Returns True if the function has run"""
+
+        if critical:
+            self.__critical.add(name)
+        elif not self.__is_due(name):
+            self.deferred[name] += 1
+            return False
+        elif self.__shed_in_row[name] < self.max_shed and \
+            not self.__fits(name):
+
+            self.__shed_in_row[name] += 1
+            self.shed[name] += 1
+            if self.__metrics is not None:
+                self.__metrics.count('shed_' + name)
+            return False
+
+        start = self.__clock()
+        function()
+        end = self.__clock()
+
+        estimate = self.__estimates.get(name)
+        self.__estimates[name] = end - start if estimate is None else \
+            estimate + ESTIMATE_WEIGHT * (end - start - estimate)
+
+        self.__last_frames[name] = self.__frame
+        self.__last_times[name] = start
+        self.__done.add(name)
+        self.__shed_in_row[name] = 0
+        self.runs[name] += 1
+
+        if self.__metrics is not None:
+            self.__metrics.observe(name, end - start)
+
+        return True
+
+
+    def end_frame(self):
+        """Finishes the frame and returns False if it missed the deadline"""
+
+        self.frames += 1
+
+        remaining = self.remaining()
+        if remaining is None or remaining >= 0:
+            return True
+
+        self.missed += 1
+        if self.__metrics is not None:
+            self.__metrics.count('deadline_missed')
+
+        return False
+
+
+    def report(self):
+        """Returns lines, describing missed deadlines and stage counts"""
+
+        lines = ["Deadlines missed: {} of {} frames".format(
+            self.missed, self.frames)]
+
+        for name in sorted(set(self.runs) | set(self.shed)):
+            lines.append(
+                "  {:<24} run {:>6}, deferred {:>6}, shed {:>6}".format(
+                    name,
+                    self.runs[name],
+                    self.deferred[name],
+                    self.shed[name]))
+
+        return lines
+
+
+    def __is_due(self, name):
+        last_frame = self.__last_frames.get(name)
+        if last_frame is None:
+            return True
+
+        rate = self.rates.get(name, EVERY_FRAME)
+
+        return self.__frame - last_frame >= rate.frames and \
+            self.__clock() - self.__last_times[name] >= rate.seconds
+
+
+    def __fits(self, name):
+        remaining = self.remaining()
+        if remaining is None:
+            return True
+
+        # Time of critical stages, which are still to run in this frame
+        reserve = sum(
+            self.__estimates.get(critical, 0.0)
+            for critical in self.__critical - self.__done)
+
+        return self.__estimates.get(name, 0.0) <= remaining - reserve
+
+
+def main():
+    """Shows results of what the module does if run as a separate application"""
+
+    scheduler = StageScheduler(0.010, parse_rates('slow=3,display=2hz'))
+
+    for _ in range(10):
+        scheduler.begin_frame()
+        scheduler.run('control', lambda: time.sleep(0.004), critical=True)
+        scheduler.run('slow', lambda: time.sleep(0.004))
+        scheduler.run('display', lambda: time.sleep(0.004))
+        scheduler.end_frame()
+
+    print('\n'.join(scheduler.report()))
+
+
+if __name__ == '__main__':
+    main()
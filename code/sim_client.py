@@ -0,0 +1,225 @@
+#!python
+"""Stands in for the simulator: plays recorded frames as telemetry events to
+drive_rover.py over socket.io and measures round trip times of the replies.
+Several concurrent sessions find the throughput, at which the server
+saturates. Start drive_rover.py first"""
+
+import argparse
+import base64
+import threading
+import time
+
+#pylint: disable=import-error
+import numpy as np
+import socketio
+
+import replay
+from images import GROUND_TRUTH
+
+DEFAULT_URL = 'http://localhost:4567'
+
+# Seconds to wait for a reply before counting the frame as lost
+DEFAULT_TIMEOUT = 5.0
+
+
+def sample_positions(count, seed=0):
+    """Returns x and y positions of rock samples, placed on random navigable
+    ground truth pixels, since recorded logs do not keep them"""
+
+    ypos, xpos = np.nonzero(GROUND_TRUTH)
+    picked = np.random.RandomState(seed).choice(len(xpos), count, False)
+
+    return xpos[picked], ypos[picked]
+
+
+def telemetry_data(record, image_string, samples):
+    """Formats a log record as telemetry fields, the way the simulator sends
+    them and update_rover() parses them"""
+
+    samples_xpos, samples_ypos = samples
+
+    return {
+        'speed': str(record.speed),
+        'position': '{};{}'.format(record.xpos, record.ypos),
+        'yaw': str(record.yaw),
+        'pitch': str(record.pitch),
+        'roll': str(record.roll),
+        'throttle': str(record.throttle),
+        'steering_angle': str(record.steer),
+        'brake': str(record.brake),
+        'near_sample': '0',
+        'picking_up': '0',
+        'sample_count': str(len(samples_xpos)),
+        'samples_x': ';'.join(str(pos) for pos in samples_xpos),
+        'samples_y': ';'.join(str(pos) for pos in samples_ypos),
+        'image': image_string}
+
+
+def read_telemetry(log_path, count=None):
+    """Returns telemetry dictionaries of the first count or all records"""
+
+    samples = sample_positions(replay.DEFAULT_SAMPLES_TO_FIND)
+    telemetry = []
+
+    for record in replay.read_log(log_path)[:count]:
+        with open(record.path, 'rb') as frame_file:
+            image_string = base64.b64encode(frame_file.read()).decode()
+
+        telemetry.append(telemetry_data(record, image_string, samples))
+
+    return telemetry
+
+
+class Session:
+    """Simulator connection, which sends the next frame after the reply to
+    the previous one, like the simulator does, at most at the given rate"""
+
+    def __init__(self, url, telemetry, rate=None, timeout=DEFAULT_TIMEOUT):
+        self.__url = url
+        self.__telemetry = telemetry
+        self.__period = 1.0 / rate if rate else 0.0
+        self.__timeout = timeout
+
+        self.__replied = threading.Event()
+        self.__client = socketio.Client(reconnection=False)
+        self.__client.on('data', self.__on_data)
+        self.__client.on('pickup', self.__on_pickup)
+
+        self.round_trips = []
+        self.pickups = 0
+        self.timeouts = 0
+        self.error = None
+
+
+    def __on_data(self, _):
+        self.__replied.set()
+
+
+    def __on_pickup(self, _):
+        self.pickups += 1
+        self.__replied.set()
+
+
+    def run(self):
+        """Plays all the frames and disconnects"""
+
+        try:
+            self.__client.connect(self.__url, transports=['websocket'])
+        except socketio.exceptions.ConnectionError as error:
+            self.error = error
+            return
+
+        start = time.perf_counter()
+
+        for idx, data in enumerate(self.__telemetry):
+            delay = start + idx * self.__period - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            self.__replied.clear()
+            sent = time.perf_counter()
+            self.__client.emit('telemetry', data)
+
+            if self.__replied.wait(self.__timeout):
+                self.round_trips.append(time.perf_counter() - sent)
+            else:
+                self.timeouts += 1
+
+        self.__client.disconnect()
+
+
+def run_sessions(url, telemetry, sessions, rate=None, timeout=DEFAULT_TIMEOUT):
+    """Plays telemetry in concurrent sessions, returning them and elapsed
+    wall time"""
+
+    players = [Session(url, telemetry, rate, timeout) for _ in range(sessions)]
+    threads = [threading.Thread(target=player.run) for player in players]
+
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return players, time.perf_counter() - start
+
+
+def main():
+    """Runs the load test and prints round trip times per session count"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        'log',
+        type=str,
+        nargs='?',
+        default=replay.DEFAULT_LOG,
+        help='Path to the robot_log.csv of the played frames')
+
+    parser.add_argument(
+        '--url',
+        type=str,
+        default=DEFAULT_URL,
+        help='Address of drive_rover.py server')
+
+    parser.add_argument(
+        '--frames',
+        type=int,
+        default=300,
+        help='Number of frames played by each session')
+
+    parser.add_argument(
+        '--sessions',
+        type=str,
+        default='1',
+        help='Comma-separated numbers of concurrent sessions, tried in turn')
+
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=None,
+        help='Frames per second of each session, unlimited by default')
+
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help='Seconds to wait for a reply before counting a frame as lost')
+
+    args = parser.parse_args()
+
+    telemetry = read_telemetry(args.log, args.frames)
+
+    print("{:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+        'sessions', 'replies', 'lost', 'fps', 'p50 ms', 'p95 ms', 'p99 ms'))
+
+    for sessions in [int(count) for count in args.sessions.split(',')]:
+        players, elapsed = run_sessions(
+            args.url,
+            telemetry,
+            sessions,
+            args.rate,
+            args.timeout)
+
+        for player in players:
+            if player.error is not None:
+                raise player.error
+
+        round_trips = 1000.0 * np.concatenate(
+            [player.round_trips for player in players])
+
+        percentiles = np.percentile(round_trips, [50, 95, 99]) \
+            if len(round_trips) else [np.nan] * 3
+
+        print("{:>9} {:>9} {:>9} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+            sessions,
+            len(round_trips),
+            sum(player.timeouts for player in players),
+            len(round_trips) / elapsed,
+            *percentiles))
+
+
+if __name__ == '__main__':
+    main()
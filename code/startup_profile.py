@@ -0,0 +1,93 @@
+#!python
+"""Reports the import time breakdown of the rover brain from a cold start up
+to the moment the server is ready to accept the first connection"""
+
+import argparse
+import importlib
+import sys
+import time
+
+# Imported in the order drive_rover.py pulls them in, so that each row
+# only counts what is not yet loaded by the previous rows
+STARTUP_MODULES = [
+    'numpy',
+    'cv2',
+    'cache',
+    'images',
+    'transformations',
+    'classifiers',
+    'control',
+    'behavior_tree_basic',
+    'behavior_tree_rover',
+    'decision',
+    'perception',
+    'PIL.Image',
+    'supporting_functions',
+    'eventlet',
+    'eventlet.wsgi',
+    'socketio',
+    'flask',
+    'drive_rover',
+]
+
+# Modules only needed for demos or training, which must not be loaded on start
+DEFERRED_MODULES = ['matplotlib', 'sklearn', 'pandas']
+
+
+def profile_startup():
+    """Imports startup modules and creates the server, returning a list of
+    (stage, seconds) pairs"""
+
+    timings = []
+
+    for name in STARTUP_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        timings.append((name, time.perf_counter() - start))
+
+    start = time.perf_counter()
+
+    drive_rover = sys.modules['drive_rover']
+    drive_rover.create_app()
+    listener = sys.modules['eventlet'].listen(('127.0.0.1', 0))
+
+    timings.append(('create_app + listen', time.perf_counter() - start))
+    listener.close()
+
+    return timings
+
+
+def main():
+    """Prints the breakdown and fails if the total exceeds the budget"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--budget',
+        type=float,
+        default=3.0,
+        help='Maximum allowed time from start to listening, in seconds')
+
+    args = parser.parse_args()
+
+    timings = profile_startup()
+    total = sum(seconds for _, seconds in timings)
+
+    for stage, seconds in timings:
+        print("{:<24} {:>8.1f} ms {:>6.1f} %".format(
+            stage, 1000.0 * seconds, 100.0 * seconds / total))
+
+    print("{:<24} {:>8.1f} ms (budget {:.1f} ms)".format(
+        "total", 1000.0 * total, 1000.0 * args.budget))
+
+    loaded = [name for name in DEFERRED_MODULES if name in sys.modules]
+    if loaded:
+        print("Deferred modules loaded on startup: " + ", ".join(loaded))
+
+    if total > args.budget:
+        print("Startup budget exceeded")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
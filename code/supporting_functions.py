@@ -12,7 +12,7 @@ import numpy as np
 # pylint: disable=import-error
 from PIL import Image
 
-from decision import ROOT
+from map_metrics import SampleIndex, map_percentages
 
 
 def convert_to_float(string_to_convert):
@@ -25,10 +25,9 @@ def convert_to_float(string_to_convert):
     return float_value
 
 
-PREV_TRACE = ""
-
 def update_rover(rover, data):
-    """Read received data from simulator and write information into rover"""
+    """Read received data from simulator and write information into rover.
+    The camera frame is decoded into the buffer of the previous frame"""
 
     # Initialize start time and sample positions
     if rover.time.start is None:
@@ -42,6 +41,9 @@ def update_rover(rover, data):
                                 for pos in data["samples_y"].split(';')])
 
         rover.statistics.samples_pos = (samples_xpos, samples_ypos)
+        rover.statistics.samples_index = SampleIndex(
+            rover.statistics.samples_pos,
+            rover.statistics.worldmap)
         rover.statistics.samples_to_find = np.int(data["sample_count"])
     # Or just update elapsed time
     else:
@@ -90,29 +92,35 @@ def update_rover(rover, data):
     #    'samples remaining:', data["sample_count"],
     #    'samples collected:', rover.statistics.samples_collected)
 
-    #pylint: disable=global-statement
-    global PREV_TRACE
+    # Get the current image from the center camera of the rover
+    jpeg_bytes = base64.b64decode(data["image"])
+    rover.perception.img = decode_image(jpeg_bytes)
 
-    cur_trace = ROOT.trace()
-    if PREV_TRACE != cur_trace:
-        print(rover.time.total, cur_trace)
-        PREV_TRACE = cur_trace
+    # Return updated rover and JPEG bytes of the image for optional recording
+    return rover, jpeg_bytes
 
-    # Get the current image from the center camera of the rover
-    img_string = data["image"]
-    image = Image.open(BytesIO(base64.b64decode(img_string)))
-    rover.perception.img = np.asarray(image)
 
-    # Return updated rover and separate image for optional saving
-    return rover, image
+def decode_image(jpeg_bytes):
+    """Decodes a JPEG image into a new RGB array, leaving arrays of previous
+    frames intact"""
+
+    # PIL keeps RGB pixels in 4 bytes and has to pack them on export anyway,
+    # while OpenCV, which could write into a reused buffer, decodes slower.
+    # See decode_comparison() of benchmark.py
+
+    image = Image.open(BytesIO(jpeg_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    return np.asarray(image)
 
 
 def create_output_images(rover):
     """Creates display output given worldmap results"""
 
-    map_add, plotmap, samples_located = create_output_map(rover)
+    map_add, _, samples_located = create_output_map(rover)
 
-    output_statistics(map_add, rover, samples_located, plotmap)
+    output_statistics(map_add, rover, samples_located)
 
     return pack_to_strings(map_add, rover)
 
@@ -120,82 +128,85 @@ def create_output_images(rover):
 def create_output_map(rover):
     """Create a scaled map for plotting and clean up obs/nav pixels a bit"""
 
-    navigable = rover.statistics.worldmap[:, :, 2]
-    obstacle = rover.statistics.worldmap[:, :, 0]
+    plotmap = plot_worldmap(rover.statistics.worldmap)
 
-    likely_nav = navigable >= obstacle
+    # Overlay obstacle and navigable terrain map with ground truth map
+    map_add = cv2.addWeighted(plotmap, 1, rover.statistics.ground_truth, 0.5, 0)
 
-    obstacle[likely_nav] = 0
+    samples_located = mark_located_samples(map_add, rover)
 
-    plotmap = np.zeros_like(rover.statistics.worldmap)
-    plotmap[:, :, 0] = obstacle
-    plotmap[:, :, 2] = navigable
-    plotmap = plotmap.clip(0, 255)
+    # Flip the map for plotting so that the y-axis points upward in the display
+    map_add = np.flipud(map_add).astype(np.float32)
 
-    # Overlay obstacle and navigable terrain map with ground truth map
-    map_add = cv2.addWeighted(plotmap, 1, rover.statistics.ground_truth, 0.5, 0)
+    return map_add, plotmap, samples_located
 
-    # Check whether any rock detections are present in worldmap
-    rock_world_pos = rover.statistics.worldmap[:, :, 1].nonzero()
 
-    # If there are, we'll step through the known sample positions
-    # to confirm whether detections are real
-    samples_located = 0
+def plot_worldmap(worldmap):
+    """Returns obstacles and navigable terrain of the worldmap, clipped for
+    plotting. Pixels, which are at least as navigable as obstacle ones, are
+    plotted navigable"""
 
-    if rock_world_pos[0].any():
-        rock_size = 2
+    navigable = worldmap[:, :, 2]
+    obstacle = worldmap[:, :, 0]
 
-        for idx in range(len(rover.statistics.samples_pos[0])):
-            test_rock_x = rover.statistics.samples_pos[0][idx]
-            test_rock_y = rover.statistics.samples_pos[1][idx]
+    likely_nav = navigable >= obstacle
 
-            rock_sample_dists = np.sqrt(
-                (test_rock_x - rock_world_pos[1]) ** 2 + \
-                (test_rock_y - rock_world_pos[0]) ** 2)
+    plotmap = np.zeros_like(worldmap)
+    plotmap[:, :, 0] = obstacle * ~likely_nav
+    plotmap[:, :, 2] = navigable
+    return plotmap.clip(0, 255)
 
-            # If rocks were detected within 3 meters of known sample positions
-            # consider it a success and plot the location of the known
-            # sample on the map
-            if np.min(rock_sample_dists) < 3:
-                samples_located += 1
 
-                map_add[
-                    test_rock_y - rock_size:test_rock_y + rock_size,
-                    test_rock_x - rock_size:test_rock_x + rock_size,
-                    :] = 255
+def mark_located_samples(map_add, rover):
+    """Marks known sample positions, near which rocks are detected, in the
+    map overlay and returns the number of such samples"""
 
-    # Flip the map for plotting so that the y-axis points upward in the display
-    map_add = np.flipud(map_add).astype(np.float32)
+    samples_index = rover.statistics.samples_index
 
-    return map_add, plotmap, samples_located
+    if samples_index is None:
+        return 0
 
+    # Rocks, detected within 3 meters of known sample positions, are counted
+    # by the index as the worldmap is updated. Plot the locations of such
+    # samples on the map
+    located = samples_index.located()
+    rock_size = 2
+
+    for test_rock_x, test_rock_y in zip(
+            samples_index.samples_pos[0][located],
+            samples_index.samples_pos[1][located]):
+
+        map_add[
+            test_rock_y - rock_size:test_rock_y + rock_size,
+            test_rock_x - rock_size:test_rock_x + rock_size,
+            :] = 255
+
+    return int(np.count_nonzero(located))
 
-def output_statistics(map_add, rover, samples_located, plotmap):
-    """Output some statistics on the map results"""
+
+def map_statistics(plotmap, ground_truth):
+    """Returns mapped percentage and fidelity of the navigable terrain map,
+    recounting all of its pixels. See map_metrics.MapMetrics for the
+    incremental counterpart"""
 
     # Calculate some statistics on the map results
     # First get the total number of pixels in the navigable terrain map
-    tot_nav_pix = np.float(len((plotmap[:, :, 2].nonzero()[0])))
+    tot_nav_pix = np.count_nonzero(plotmap[:, :, 2])
 
     # Next figure out how many of those correspond to ground truth pixels
-    good_nav_pix = np.float(
-        len(((plotmap[:, :, 2] > 0)
-             & (rover.statistics.ground_truth[:, :, 1] > 0)).nonzero()[0]))
+    good_nav_pix = np.count_nonzero(
+        (plotmap[:, :, 2] > 0) & (ground_truth[:, :, 1] > 0))
 
     # Grab the total number of map pixels
-    tot_map_pix = np.float(
-        len((rover.statistics.ground_truth[:, :, 1].nonzero()[0])))
+    tot_map_pix = np.count_nonzero(ground_truth[:, :, 1])
 
-    # Calculate the percentage of ground truth map that has been successfully
-    # #found
-    perc_mapped = round(100 * good_nav_pix / tot_map_pix, 1)
+    return map_percentages(good_nav_pix, tot_nav_pix, tot_map_pix)
 
-    # Calculate the number of good map pixel detections divided by total pixels
-    # found to be navigable terrain
-    if tot_nav_pix > 0:
-        fidelity = round(100 * good_nav_pix / (tot_nav_pix), 1)
-    else:
-        fidelity = 0
+
+def output_statistics(map_add, rover, samples_located):
+    """Output some statistics on the map results"""
+
+    perc_mapped, fidelity = rover.statistics.metrics.statistics()
 
     # Add some text about map and rock sample detection results
     font_params = (
@@ -244,14 +255,144 @@ def output_statistics(map_add, rover, samples_located, plotmap):
 def pack_to_strings(map_add, rover):
     """Convert map and vision image to base64 strings for sending to server"""
 
-    pil_img = Image.fromarray(map_add.astype(np.uint8))
-    buff = BytesIO()
-    pil_img.save(buff, format="JPEG")
-    encoded_string1 = base64.b64encode(buff.getvalue()).decode("utf-8")
+    encoded_string1 = encode_image(map_add)
+    encoded_string2 = encode_image(rover.statistics.vision_image)
+
+    return encoded_string1, encoded_string2
 
-    pil_img = Image.fromarray(rover.statistics.vision_image.astype(np.uint8))
+
+def encode_image(img):
+    """Converts an image to base64 JPEG string"""
+
+    pil_img = Image.fromarray(img.astype(np.uint8))
     buff = BytesIO()
     pil_img.save(buff, format="JPEG")
-    encoded_string2 = base64.b64encode(buff.getvalue()).decode("utf-8")
+    return base64.b64encode(buff.getvalue()).decode("utf-8")
 
-    return encoded_string1, encoded_string2
+
+class InsetCache:
+    """Produces the same inset strings as create_output_images(), but redraws
+    only the dirty region of the worldmap overlay, reuses encoded strings of
+    unchanged insets and refreshes insets at most max_rate times per second.
+    Rendering and encoding durations are accumulated to show their share of
+    the frame budget"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, max_rate=None, clock=time.perf_counter):
+        self.__min_period = 1.0 / max_rate if max_rate else 0.0
+        self.__clock = clock
+        self.__last_refresh = None
+
+        self.__worldmap = None  # Worldmap, the overlay was drawn for
+        self.__plotmap = None
+        self.__overlay = None  # Unflipped map overlay without markers
+        self.__map_key = None  # Text and markers of the encoded map inset
+        self.__vision_image = None  # Vision image of the encoded inset
+        self.__strings = ('', '')
+
+        self.rendered = 0  # Insets, which were drawn and encoded
+        self.reused = 0  # Insets, which strings were reused, being unchanged
+        self.skipped = 0  # Calls, skipped by the rate limit
+        self.render_seconds = 0.0
+        self.encode_seconds = 0.0
+
+
+    def output_images(self, rover):
+        """Returns a pair of inset strings for the current rover state"""
+
+        now = self.__clock()
+
+        if self.__last_refresh is not None and \
+            now - self.__last_refresh < self.__min_period:
+
+            self.skipped += 1
+            return self.__strings
+
+        self.__last_refresh = now
+
+        self.__strings = (
+            self.__map_string(rover),
+            self.__vision_string(rover))
+
+        return self.__strings
+
+
+    def __update_overlay(self, worldmap, ground_truth):
+        """Redraws the overlay in the bounding box of changed worldmap pixels.
+        Returns false if nothing has changed"""
+
+        if self.__worldmap is None:
+            self.__worldmap = worldmap.copy()
+            self.__plotmap = plot_worldmap(worldmap)
+            self.__overlay = cv2.addWeighted(
+                self.__plotmap, 1, ground_truth, 0.5, 0)
+            return True
+
+        changed = np.any(worldmap != self.__worldmap, axis=2)
+        col, row, width, height = cv2.boundingRect(changed.view(np.uint8))
+
+        if width == 0 or height == 0:
+            return False
+
+        dirty = (slice(row, row + height), slice(col, col + width))
+
+        self.__worldmap[dirty] = worldmap[dirty]
+        self.__plotmap[dirty] = plot_worldmap(worldmap[dirty])
+        self.__overlay[dirty] = cv2.addWeighted(
+            self.__plotmap[dirty], 1, ground_truth[dirty], 0.5, 0)
+
+        return True
+
+
+    def __map_string(self, rover):
+        start = self.__clock()
+
+        changed = self.__update_overlay(
+            rover.statistics.worldmap,
+            rover.statistics.ground_truth)
+
+        map_add = self.__overlay.copy()
+        samples_located = mark_located_samples(map_add, rover)
+
+        key = (
+            str(np.round(rover.time.total, 1)),
+            samples_located,
+            rover.statistics.samples_collected)
+
+        if not changed and key == self.__map_key:
+            self.reused += 1
+            return self.__strings[0]
+
+        map_add = np.flipud(map_add).astype(np.float32)
+        output_statistics(map_add, rover, samples_located)
+
+        encode_start = self.__clock()
+        result = encode_image(map_add)
+        end = self.__clock()
+
+        self.__map_key = key
+        self.rendered += 1
+        self.render_seconds += encode_start - start
+        self.encode_seconds += end - encode_start
+
+        return result
+
+
+    def __vision_string(self, rover):
+        vision_image = rover.statistics.vision_image
+
+        if self.__vision_image is not None and \
+            np.array_equal(vision_image, self.__vision_image):
+
+            self.reused += 1
+            return self.__strings[1]
+
+        start = self.__clock()
+        result = encode_image(vision_image)
+
+        self.__vision_image = vision_image.copy()
+        self.rendered += 1
+        self.encode_seconds += self.__clock() - start
+
+        return result
@@ -0,0 +1,44 @@
+#!python
+"""Unit tests for the offline batch mapper"""
+
+import unittest
+
+import numpy as np
+
+import batch_mapper
+import replay
+
+
+class TestBatchMapper(unittest.TestCase):
+    """Test cases to verify that sharded mapping matches sequential one"""
+
+    def test_shards_match_sequential(self):
+        """Composed shard updates give the maps of sequential processing"""
+
+        records, imgs = zip(*replay.FramePrefetcher(
+            replay.read_log(replay.DEFAULT_LOG)[:150]))
+
+        expected = batch_mapper.sequential_maps(records, imgs)
+
+        single = batch_mapper.map_frames(records, imgs, (200, 200))
+        for update, expected_map in zip(single, expected):
+            np.testing.assert_array_equal(
+                expected_map,
+                update.apply(np.zeros((200, 200))))
+
+        shards = [
+            batch_mapper.map_frames(records[start:stop], imgs[start:stop],
+                                    (200, 200))
+            for start, stop in ((0, 40), (40, 95), (95, 150))]
+
+        for idx, expected_map in enumerate(expected):
+            update = shards[0][idx].then(shards[1][idx]).then(shards[2][idx])
+            actual = update.apply(np.zeros((200, 200)))
+
+            np.testing.assert_allclose(expected_map, actual, atol=1e-9)
+            np.testing.assert_array_equal(expected_map > 0, actual > 0)
+            np.testing.assert_array_equal(expected_map < 0, actual < 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
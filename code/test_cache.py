@@ -0,0 +1,83 @@
+#!python
+"""Unit tests for arrays, cached on disk"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import cache
+
+
+class TestCache(unittest.TestCase):
+    """Test cases to verify rebuilding and removal of stale cached arrays"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+
+    def test_stale_files(self):
+        """Arrays are rebuilt when a source changes and only the file of the
+        current key is kept"""
+
+        source = os.path.join(self.folder, 'source.txt')
+        other = os.path.join(self.folder, 'source_scale0.5.txt')
+
+        for path in (source, other):
+            with open(path, 'w') as file:
+                file.write('1')
+
+        cache.cached_arrays(
+            'source_scale0.5',
+            [other],
+            lambda: {'value': np.ones(1)},
+            self.folder)
+
+        for version in range(2, 4):
+            with open(source, 'w') as file:
+                file.write(str(version) * version)
+
+            arrays = cache.cached_arrays(
+                'source',
+                [source],
+                lambda version=version: {'value': np.full(1, version)},
+                self.folder)
+
+            self.assertEqual(version, arrays['value'][0])
+
+        cached = sorted(
+            name for name in os.listdir(self.folder) if name.endswith('.npz'))
+
+        self.assertEqual(
+            ["source_{}.npz".format(cache.sources_key([source])),
+             "source_scale0.5_{}.npz".format(cache.sources_key([other]))],
+            cached)
+
+
+    def test_failed_save(self):
+        """A failing save leaves neither the target nor a temporary file"""
+
+        path = os.path.join(self.folder, 'arrays.npy')
+
+        def save(file):
+            file.write(b'partial')
+            raise IOError('disk full')
+
+        with self.assertRaises(IOError):
+            cache.save_atomically(path, save)
+
+        self.assertEqual([], os.listdir(self.folder))
+
+        cache.save_atomically(path, lambda file: np.save(file, np.ones(3)))
+        np.testing.assert_array_equal(np.ones(3), np.load(path))
+        self.assertEqual(['arrays.npy'], os.listdir(self.folder))
+
+
+if __name__ == '__main__':
+    unittest.main()
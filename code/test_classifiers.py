@@ -1,6 +1,7 @@
 #!python
 """Unit tests for classifiers"""
 
+import tempfile
 import unittest
 import numpy as np
 import classifiers
@@ -44,5 +45,50 @@ class TestClassifiers(unittest.TestCase):
         self.assertGreater(accuracy, 0.9)
 
 
+    def test_classifier_lut(self):
+        """Test that lookup table classifiers agree with the exact ones and
+        are persisted to disk"""
+
+        with tempfile.TemporaryDirectory() as folder:
+            lut = classifiers.ClassifierLut(
+                classifiers.ROCKS_EXACT, "rocks", 6, folder)
+
+            cached = classifiers.ClassifierLut(
+                classifiers.ROCKS_EXACT, "rocks", 6, folder)
+
+        expected = classifiers.ROCKS_EXACT.predict(images.ROCK1)
+        given = lut.predict(images.ROCK1)
+
+        np.testing.assert_array_equal(given, cached.predict(images.ROCK1))
+        self.assertEqual(expected.shape, given.shape)
+        self.assertGreater(np.mean((given > 0) == (expected > 0)), 0.99)
+
+
+    def test_numpy_evaluators(self):
+        """Test that NumPy evaluators of the cached parameters match sklearn
+        classifiers they were exported from"""
+
+        import training
+
+        training_x, training_rocks, training_navi = training.training_set()
+        navi = training.fit_navi(training_x, training_navi)
+        rocks, not_rocks = training.fit_rocks(training_x, training_rocks)
+
+        input_x = images.ROCK1.reshape(-1, 3)
+
+        navi_scores = navi.predict_log_proba(input_x)
+        np.testing.assert_allclose(
+            classifiers.NAVI_EXACT.predict(images.ROCK1).ravel(),
+            navi_scores[:, 1] - navi_scores[:, 0],
+            rtol=1e-6,
+            atol=1e-6)
+
+        np.testing.assert_allclose(
+            classifiers.ROCKS_EXACT.predict(images.ROCK1).ravel(),
+            rocks.score_samples(input_x) - not_rocks.score_samples(input_x),
+            rtol=1e-6,
+            atol=1e-6)
+
+
 if __name__ == '__main__':
     unittest.main()
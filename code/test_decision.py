@@ -0,0 +1,58 @@
+#!python
+"""Unit tests for decision making"""
+
+import unittest
+
+import replay
+from decision import create_behavior_tree, decision_step
+from perception import perception_step
+from rover_state import RoverState
+
+
+def run_frame(rover, tree, record, img):
+    """Runs perception and decision steps on a log frame, returning controls"""
+
+    replay.populate_rover(rover, record, img, 0.0)
+    perception_step(rover)
+    decision_step(rover, tree)
+
+    return (
+        rover.control.throttle,
+        rover.control.brake,
+        rover.control.steer,
+        rover.decision.mode)
+
+
+class TestDecision(unittest.TestCase):
+    """Test cases to verify decisions of several rovers"""
+
+    def test_interleaved_rovers(self):
+        """Rovers with their own trees decide the same, whether they run
+        alone or interleaved with another rover"""
+
+        frames = [
+            (record, img) for record, img in replay.FramePrefetcher(
+                replay.read_log(replay.DEFAULT_LOG))
+            if replay.is_valid_record(record)]
+
+        # Stop and rotate nodes of a shared tree would interfere in these
+        # parts of the run
+        first, second = frames[700:750], frames[200:250]
+
+        rover = RoverState()
+        tree = create_behavior_tree()
+        alone = [run_frame(rover, tree, *frame) for frame in first]
+
+        rovers = [RoverState(), RoverState()]
+        trees = [create_behavior_tree(), create_behavior_tree()]
+        interleaved = []
+
+        for frame, other_frame in zip(first, second):
+            interleaved.append(run_frame(rovers[0], trees[0], *frame))
+            run_frame(rovers[1], trees[1], *other_frame)
+
+        self.assertEqual(alone, interleaved)
+
+
+if __name__ == '__main__':
+    unittest.main()
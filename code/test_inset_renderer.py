@@ -0,0 +1,37 @@
+#!python
+"""Unit tests for background rendering of inset images"""
+
+import copy
+import unittest
+
+import replay
+from inset_renderer import InsetRenderer
+from supporting_functions import create_output_images
+
+
+class TestInsetRenderer(unittest.TestCase):
+    """Test cases to verify background rendering of inset images"""
+
+    def test_renders_snapshot(self):
+        """Background insets match the synchronous ones of the submitted
+        state, even if the rover changes afterwards"""
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:30]
+        rover = replay.run_replay(replay.FramePrefetcher(records[:20])).rover
+
+        renderer = InsetRenderer()
+        self.assertEqual(('', ''), renderer.latest())
+
+        renderer.submit(rover)
+        expected = create_output_images(copy.deepcopy(rover))
+
+        replay.run_replay(replay.FramePrefetcher(records[20:]), rover)
+
+        self.assertTrue(renderer.flush(timeout=10.0))
+        self.assertEqual(expected, renderer.latest())
+
+        renderer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
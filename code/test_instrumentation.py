@@ -0,0 +1,72 @@
+#!python
+"""Unit tests for instrumentation of the telemetry loop"""
+
+import unittest
+import numpy as np
+
+from instrumentation import Instrumentation, RollingHistogram
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Test cases to verify timers, histograms and their export"""
+
+    def test_rolling_histogram(self):
+        """Quantiles are taken from the recent window, totals from all
+        observations"""
+
+        histogram = RollingHistogram(window=100)
+
+        for value in range(200):
+            histogram.observe(float(value))
+
+        self.assertEqual(200, histogram.count)
+        self.assertAlmostEqual(np.sum(np.arange(200)), histogram.total)
+
+        quantiles = histogram.quantiles((0.0, 0.5, 1.0))
+        np.testing.assert_almost_equal([100.0, 149.5, 199.0], quantiles)
+
+
+    def test_prometheus_text(self):
+        """Timers and counters are exported in Prometheus text format"""
+
+        metrics = Instrumentation()
+
+        with metrics.timer('perception_step'):
+            pass
+
+        metrics.count('invalid')
+        metrics.count('invalid')
+        metrics.set_gauge('fps', None)
+
+        text = metrics.prometheus_text()
+
+        self.assertIn('# TYPE rover_stage_seconds summary', text)
+        self.assertIn(
+            'rover_stage_seconds{stage="perception_step",quantile="0.99"}',
+            text)
+        self.assertIn('rover_stage_seconds_count{stage="perception_step"} 1',
+                      text)
+        self.assertIn('rover_frames_total{outcome="invalid"} 2', text)
+        self.assertIn('rover_fps NaN', text)
+
+
+    def test_accessors_copy(self):
+        """Histograms, returned by accessors, do not change with later
+        observations"""
+
+        metrics = Instrumentation()
+        metrics.observe('classify', 1.0)
+        metrics.count('invalid')
+
+        histogram = metrics.histogram('classify')
+        metrics.observe('classify', 3.0)
+
+        self.assertEqual(1, histogram.count)
+        self.assertEqual([1.0], histogram.quantiles((0.5,)))
+        self.assertEqual(2, metrics.histogram('classify').count)
+        self.assertIsNone(metrics.histogram('missing'))
+        self.assertEqual(1, metrics.counter('invalid'))
+
+
+if __name__ == '__main__':
+    unittest.main()
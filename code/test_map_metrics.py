@@ -0,0 +1,106 @@
+#!python
+"""Unit tests for incremental mapped percentage and fidelity"""
+
+import unittest
+import numpy as np
+
+import perception
+import replay
+from images import GROUND_TRUTH_3D
+from map_metrics import MapMetrics, SampleIndex
+from rover_state import RoverState
+from supporting_functions import map_statistics, plot_worldmap
+
+
+class TestMapMetrics(unittest.TestCase):
+    """Test cases to verify incremental counts against the full recount"""
+
+    def test_window_updates(self):
+        """Random window updates, including ones partially outside of the
+        map, give the statistics of the full recount"""
+
+        random = np.random.RandomState(0)
+        metrics = MapMetrics(GROUND_TRUTH_3D, check=True)
+        worldmap = np.zeros(GROUND_TRUTH_3D.shape)
+
+        for _ in range(50):
+            x_0, y_0 = random.randint(-20, 200, 2)
+            width, height = random.randint(1, 60, 2)
+            window = (x_0, y_0, x_0 + width, y_0 + height)
+
+            region = worldmap[
+                max(y_0, 0):max(y_0 + height, 0),
+                max(x_0, 0):max(x_0 + width, 0),
+                2]
+            region[:] = random.choice([0.0, 100.0], region.shape)
+
+            metrics.update(worldmap, window)
+
+        self.assertEqual(
+            map_statistics(plot_worldmap(worldmap), GROUND_TRUTH_3D),
+            metrics.statistics())
+
+        worldmap[:] = 0
+        with self.assertRaises(AssertionError):
+            metrics.verify(worldmap)
+
+
+    def test_sample_index(self):
+        """Samples, near which rocks appear and disappear in random windows,
+        are located like by distances to all the rock pixels"""
+
+        random = np.random.RandomState(1)
+        worldmap = np.zeros((200, 200, 3))
+        worldmap[:, :, 1] = 255 * (random.rand(200, 200) > 0.999)
+
+        samples_pos = (
+            np.array([0, 199, 40, 100, 101, 150]),
+            np.array([0, 100, 199, 100, 101, 30]))
+
+        index = SampleIndex(samples_pos, worldmap)
+
+        for _ in range(200):
+            x_0, y_0 = random.randint(-5, 200, 2)
+            width, height = random.randint(1, 10, 2)
+
+            region = worldmap[
+                max(y_0, 0):max(y_0 + height, 0),
+                max(x_0, 0):max(x_0 + width, 0),
+                1]
+            region[:] = 255 * (random.rand(*region.shape) > 0.9)
+
+            index.update(worldmap, (x_0, y_0, x_0 + width, y_0 + height))
+
+            rock_y, rock_x = worldmap[:, :, 1].nonzero()
+            expected = [
+                np.min(np.hypot(sample_x - rock_x, sample_y - rock_y)) < 3
+                for sample_x, sample_y in zip(*samples_pos)]
+
+            np.testing.assert_array_equal(expected, index.located())
+
+
+    def test_replay(self):
+        """Counts, updated by perception_step(), follow the worldmap, which is
+        composed in the windows of map updates"""
+
+        rover = RoverState()
+        rover.statistics.metrics.check = True
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:100]
+        result = replay.run_replay(replay.FramePrefetcher(records), rover)
+
+        statistics = result.rover.statistics
+        self.assertGreater(statistics.metrics.tot_nav_pix, 0)
+        self.assertEqual(
+            map_statistics(
+                plot_worldmap(statistics.worldmap),
+                statistics.ground_truth),
+            statistics.metrics.statistics())
+
+        worldmap = np.zeros_like(statistics.worldmap)
+        perception.update_worldmap(worldmap, result.rover.map)
+        np.testing.assert_array_equal(worldmap, statistics.worldmap)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!python
+"""Unit tests for the streaming mapping video"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+
+import replay
+import mapping_video
+
+
+class TestMappingVideo(unittest.TestCase):
+    """Test cases to verify streaming of the mapping video"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+
+    def test_streams_valid_frames(self):
+        """The video has a frame of the camera image, top view and worldmap
+        per valid record"""
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:20]
+        path = os.path.join(self.folder, 'mapping.mp4')
+
+        result, stream = mapping_video.write_video(
+            replay.FramePrefetcher(records),
+            path,
+            depth=2)
+
+        valid = len(result.latencies) - result.invalid
+        self.assertEqual(valid, stream.written)
+
+        video = cv2.VideoCapture(path)
+        self.assertEqual(valid, int(video.get(cv2.CAP_PROP_FRAME_COUNT)))
+
+        width, height = mapping_video.frame_size(
+            result.rover.perception.img.shape)
+        self.assertEqual(width, int(video.get(cv2.CAP_PROP_FRAME_WIDTH)))
+        self.assertEqual(height, int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+        video.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+#!python
+"""Unit tests for cost map planners"""
+
+import heapq
+import math
+import unittest
+import numpy as np
+
+import planners
+
+
+def reference_distances(blocked, goals):
+    """Dijkstra search from all goals over 8-connected free cells"""
+
+    height, width = blocked.shape
+    distances = np.full(blocked.shape, np.inf)
+    queue = []
+
+    for row, col in zip(*np.nonzero(goals & ~blocked)):
+        distances[row, col] = 0.0
+        queue.append((0.0, row, col))
+
+    heapq.heapify(queue)
+
+    while queue:
+        distance, row, col = heapq.heappop(queue)
+        if distance > distances[row, col]:
+            continue
+
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                n_row, n_col = row + d_row, col + d_col
+                if (d_row == 0 and d_col == 0) or \
+                    not 0 <= n_row < height or not 0 <= n_col < width or \
+                    blocked[n_row, n_col]:
+                    continue
+
+                step = math.sqrt(2.0) if d_row and d_col else 1.0
+                if distance + step < distances[n_row, n_col]:
+                    distances[n_row, n_col] = distance + step
+                    heapq.heappush(queue, (distance + step, n_row, n_col))
+
+    return distances
+
+
+class Decision:
+    """Stand-in of rover_state.Decision, carrying only the cost map"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, shape):
+        self.cost_map = np.zeros(shape)
+
+
+def expected_costs(distances):
+    """Cost map values of the distances to goals"""
+
+    return np.maximum(
+        planners.MAX_COST * np.power(0.98, distances),
+        planners.MIN_COST)
+
+
+class TestPlanners(unittest.TestCase):
+    """Test cases to verify cost map planners"""
+
+    def test_dstar_lite_repairs(self):
+        """Incrementally repaired distances and cost map match a search from
+        scratch after obstacles and goals change"""
+
+        shape = (40, 50)
+        random = np.random.RandomState(0)
+
+        planner = planners.DStarLitePlanner(shape, budget=None)
+        decision = Decision(shape)
+        navi = np.zeros(shape)
+        goals = np.zeros(shape)
+
+        for _ in range(10):
+            changed = random.rand(*shape) < 0.05
+            navi[changed] = random.choice([-255.0, 255.0], np.sum(changed))
+
+            goals[:] = 0
+            goals[random.randint(shape[0]), random.randint(shape[1])] = 255
+
+            planner.set_goals(decision, goals)
+            planner.update(decision, navi)
+
+            expected = reference_distances(navi <= -1.0, goals >= 128.0)
+            np.testing.assert_allclose(expected, planner.distances())
+
+            # The cost map is refreshed only in cells of changed distances
+            np.testing.assert_allclose(
+                expected_costs(expected),
+                decision.cost_map)
+
+
+    def test_dstar_lite_budget(self):
+        """Repairs and reseeds are spread over updates within the budget and
+        converge to a search from scratch"""
+
+        shape = (30, 40)
+        random = np.random.RandomState(1)
+        navi = np.where(random.rand(*shape) < 0.2, -255.0, 255.0)
+        navi[5, 5] = navi[25, 35] = 255.0
+
+        for reseed_changes in (None, 0):
+            planner = planners.DStarLitePlanner(
+                shape,
+                budget=20,
+                reseed_changes=reseed_changes)
+
+            decision = Decision(shape)
+
+            for goal in ((5, 5), (25, 35)):
+                goals = np.zeros(shape)
+                goals[goal] = 255
+                planner.set_goals(decision, goals)
+
+                updates = 0
+                for _ in range(1000):
+                    expansions = planner.expansions
+                    planner.update(decision, navi)
+                    self.assertLessEqual(planner.expansions - expansions, 20)
+                    updates += planner.expansions > expansions
+
+                self.assertGreater(updates, 5)
+
+                expected = reference_distances(navi <= -1.0, goals >= 128.0)
+                np.testing.assert_allclose(expected, planner.distances())
+                np.testing.assert_allclose(
+                    expected_costs(expected),
+                    decision.cost_map)
+
+
+    def test_dstar_lite_resize(self):
+        """Growing the cost window keeps the planner and its distances, and
+        repairs extend them over the grown cells"""
+
+        decision = Decision((20, 30))
+        decision.cost_window = (0, 0, 30, 20)
+        decision.planner = planners.DStarLitePlanner((20, 30), budget=None)
+        planner = decision.planner
+
+        navi = np.zeros((20, 30))
+        navi[10, 5:25] = -255.0
+        goals = np.zeros((20, 30))
+        goals[3, 4] = 255
+
+        planner.set_goals(decision, goals)
+        planner.update(decision, navi)
+        expansions = planner.expansions
+
+        planners.fit_cost_window(decision, (-10, -5, 30, 20))
+        self.assertIs(planner, decision.planner)
+        self.assertEqual((25, 40), decision.cost_map.shape)
+
+        grown_navi = np.zeros((25, 40))
+        grown_navi[5:, 10:] = navi
+        grown_goals = np.zeros((25, 40))
+        grown_goals[5:, 10:] = goals
+
+        planner.set_goals(decision, grown_goals)
+        planner.update(decision, grown_navi)
+
+        # Only the grown cells are expanded
+        self.assertLessEqual(
+            planner.expansions - expansions,
+            25 * 40 - 20 * 30)
+
+        expected = reference_distances(
+            grown_navi <= -1.0,
+            grown_goals >= 128.0)
+
+        np.testing.assert_allclose(expected, planner.distances())
+        np.testing.assert_allclose(expected_costs(expected), decision.cost_map)
+
+
+    def test_dstar_lite_home_goal(self):
+        """A single goal propagates over the whole free map in one update"""
+
+        shape = (200, 200)
+        planner = planners.DStarLitePlanner(shape, budget=None)
+        decision = Decision(shape)
+
+        goals = np.zeros(shape)
+        goals[87, 98] = 255
+
+        planner.set_goals(decision, goals)
+        planner.update(decision, np.zeros(shape))
+
+        self.assertEqual(255.0, decision.cost_map[87, 98])
+        self.assertGreater(decision.cost_map[0, 0], planners.MIN_COST)
+        self.assertLess(decision.cost_map[0, 0], decision.cost_map[40, 40])
+
+        expansions = planner.expansions
+        planner.update(decision, np.zeros(shape))
+        self.assertEqual(expansions, planner.expansions)
+
+
+    def test_dstar_lite_goal_batches(self):
+        """Removed goal cells are applied in batches, added ones at once"""
+
+        shape = (20, 20)
+        planner = planners.DStarLitePlanner(
+            shape,
+            budget=None,
+            goal_interval=3)
+        decision = Decision(shape)
+        navi = np.zeros(shape)
+
+        goals = np.zeros(shape)
+        goals[:, 15:] = 255
+        planner.set_goals(decision, goals)
+        planner.update(decision, navi)
+
+        for column in (15, 16):
+            goals[:, column] = 0
+            planner.set_goals(decision, goals)
+            planner.update(decision, navi)
+            self.assertEqual(0.0, planner.distances()[0, 15])
+
+        goals[:, 17] = 0
+        planner.set_goals(decision, goals)
+        planner.update(decision, navi)
+        self.assertEqual(3.0, planner.distances()[0, 15])
+
+        goals[0, 0] = 255
+        planner.set_goals(decision, goals)
+        planner.update(decision, navi)
+        self.assertEqual(0.0, planner.distances()[0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
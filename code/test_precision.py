@@ -0,0 +1,59 @@
+#!python
+"""Unit tests for storage precision modes"""
+
+import unittest
+import numpy as np
+
+import perception
+import precision
+import replay
+from rover_state import RoverState
+
+
+class TestPrecision(unittest.TestCase):
+    """Test cases to verify compact precision modes"""
+
+    def test_accumulate_saturates(self):
+        """Integer maps round added values and saturate at the clip bounds"""
+
+        target = np.array([250, -250, 0, 10], np.int16)
+        precision.accumulate(target, np.array([10.0, -10.0, 0.6, -0.4]))
+
+        np.testing.assert_array_equal([255, -255, 1, 10], target)
+
+
+    def test_int16_decay(self):
+        """Rocks decay of integer maps is deferred, but not lost"""
+
+        rover = RoverState(tile_size=32, precision_mode='int16')
+        rover.map.global_conf_rocks.accumulate(
+            np.full((4, 4), 200.0), (0, 0, 4, 4))
+
+        for _ in range(1100):
+            perception.decay_rocks(rover.map)
+
+        expected = 200.0 * perception.ROCKS_DECAY ** 1100
+        self.assertAlmostEqual(
+            expected,
+            rover.map.global_conf_rocks.max_value(),
+            -1)
+
+
+    def test_compact_replay(self):
+        """A short replay in compact modes keeps the map dtypes"""
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:20]
+
+        for precision_mode in ('float32', 'int16'):
+            rover = RoverState(precision_mode=precision_mode)
+            result = replay.run_replay(replay.FramePrefetcher(records), rover)
+
+            self.assertEqual(
+                precision.storage_dtype(precision_mode),
+                result.rover.map.global_conf_navi.dtype)
+
+            self.assertGreater(np.sum(result.rover.statistics.worldmap > 0), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
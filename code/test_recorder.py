@@ -0,0 +1,107 @@
+#!python
+"""Unit tests for the frame recorder"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+import replay
+from recorder import FrameRecorder
+
+
+class TestRecorder(unittest.TestCase):
+    """Test cases to verify recording of runs"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+
+    def test_recorded_run_replays(self):
+        """Recorded frames and their log rows read back like test_dataset"""
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:40]
+        recorder = FrameRecorder(self.folder, batch_size=8)
+
+        for record in records:
+            with open(record.path, 'rb') as frame_file:
+                jpeg_bytes = frame_file.read()
+
+            data = {
+                'steering_angle': str(record.steer),
+                'throttle': str(record.throttle),
+                'brake': str(record.brake),
+                'speed': str(record.speed),
+                'position': '{};{}'.format(record.xpos, record.ypos),
+                'pitch': str(record.pitch),
+                'yaw': str(record.yaw),
+                'roll': str(record.roll)}
+
+            self.assertTrue(recorder.record(
+                jpeg_bytes,
+                data,
+                datetime.fromtimestamp(record.timestamp)))
+
+        recorder.close()
+
+        self.assertEqual(len(records), recorder.written)
+        self.assertEqual(0, recorder.dropped)
+        self.assertGreaterEqual(recorder.batches, len(records) // 8)
+
+        recorded = replay.read_log(os.path.join(self.folder, 'robot_log.csv'))
+        self.assertEqual(len(records), len(recorded))
+
+        for expected, actual in zip(records, recorded):
+            self.assertEqual(expected[1:], actual[1:])
+
+            with open(expected.path, 'rb') as expected_file, \
+                open(actual.path, 'rb') as actual_file:
+
+                self.assertEqual(expected_file.read(), actual_file.read())
+
+
+    def test_failed_frames(self):
+        """Frames of the same millisecond keep their files, telemetry without
+        brake is recorded and a failing frame is dropped alone"""
+
+        record = replay.read_log(replay.DEFAULT_LOG)[0]
+        with open(record.path, 'rb') as frame_file:
+            jpeg_bytes = frame_file.read()
+
+        data = {
+            'steering_angle': '0',
+            'throttle': '0',
+            'speed': '0',
+            'position': '1;2',
+            'pitch': '0',
+            'yaw': '0',
+            'roll': '0'}
+
+        broken = dict(data)
+        del broken['position']
+
+        utc_time = datetime(2017, 5, 25, 12, 0, 0, 500)
+        recorder = FrameRecorder(self.folder, batch_size=8)
+
+        for frame_data in (data, broken, data, data):
+            recorder.record(jpeg_bytes, frame_data, utc_time)
+
+        recorder.close()
+
+        self.assertEqual(3, recorder.written)
+        self.assertEqual(1, recorder.dropped)
+
+        recorded = replay.read_log(os.path.join(self.folder, 'robot_log.csv'))
+        self.assertEqual(3, len(set(record.path for record in recorded)))
+        self.assertEqual(
+            3, len(os.listdir(os.path.join(self.folder, 'IMG'))))
+        self.assertEqual(0.0, recorded[0].brake)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!python
+"""Unit tests for replay of recorded runs"""
+
+import unittest
+import numpy as np
+
+import perception
+import replay
+import transformations
+from rover_state import RoverState
+
+
+class TestReplay(unittest.TestCase):
+    """Test cases to verify reading and replaying robot logs"""
+
+    def test_read_log(self):
+        """Robot log records carry timestamps and tolerate corrupted fields"""
+
+        records = replay.read_log(replay.DEFAULT_LOG)
+
+        self.assertGreater(len(records), 1000)
+
+        timestamps = np.array([record.timestamp for record in records])
+        self.assertTrue(np.all(np.diff(timestamps) >= 0))
+
+        valid = [replay.is_valid_record(record) for record in records]
+        self.assertGreater(np.mean(valid), 0.95)
+
+
+    def test_prefetcher_errors(self):
+        """Frames, which fail to decode, raise errors in the reader"""
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:3]
+        records[1] = records[1]._replace(path=None)
+
+        frames = iter(replay.FramePrefetcher(records))
+        next(frames)
+
+        with self.assertRaises(Exception):
+            next(frames)
+
+
+    def test_run_replay(self):
+        """A short replay updates the worldmap and the decision state"""
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:20]
+        result = replay.run_replay(replay.FramePrefetcher(records))
+
+        self.assertEqual(20, len(result.latencies))
+        self.assertGreater(np.sum(result.rover.statistics.worldmap > 0), 0)
+        self.assertIsNotNone(result.rover.decision.nav_dir)
+
+
+    def test_reduced_scale(self):
+        """A short replay at half perception scale keeps local maps and the
+        vision image at the coarser top view size"""
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:20]
+
+        try:
+            perception.use_scale(0.5)
+            top_shape = (transformations.TOP_HEIGHT, transformations.TOP_WIDTH)
+            result = replay.run_replay(
+                replay.FramePrefetcher(records),
+                RoverState())
+        finally:
+            perception.use_scale(1.0)
+
+        rover = result.rover
+        self.assertEqual((80, 160), top_shape)
+        self.assertEqual(top_shape, rover.map.local_navi.shape)
+        self.assertEqual(top_shape, rover.statistics.vision_image.shape[:2])
+        self.assertGreater(np.sum(rover.statistics.worldmap > 0), 0)
+        self.assertIsNotNone(rover.decision.nav_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
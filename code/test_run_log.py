@@ -0,0 +1,62 @@
+#!python
+"""Unit tests for binary run logs"""
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import replay
+import run_log
+
+
+class TestRunLog(unittest.TestCase):
+    """Test cases to verify conversion and reading of binary run logs"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+
+    def test_converted_frames(self):
+        """Converted run log yields the records and images of the original
+        log and seeks frames by timestamps"""
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:30]
+        run_log.write_run_log(
+            self.folder,
+            replay.FramePrefetcher(records),
+            len(records))
+
+        self.assertTrue(run_log.is_run_log(self.folder))
+
+        log = run_log.RunLog(self.folder)
+        self.assertEqual(len(records), len(log))
+
+        frames = replay.FramePrefetcher(records)
+
+        for (expected, expected_img), (actual, actual_img) in zip(
+                frames, log.frames()):
+
+            self.assertEqual(expected[1:], actual[1:])
+            np.testing.assert_array_equal(expected_img, actual_img)
+
+        self.assertEqual(0, log.seek(records[0].timestamp - 1.0))
+        self.assertEqual(10, log.seek(records[10].timestamp))
+        self.assertEqual(len(records), log.seek(records[-1].timestamp + 1.0))
+        self.assertEqual(5, len(list(log.frames(25, 40))))
+
+
+    def test_empty_run(self):
+        """Runs without frames are rejected"""
+
+        with self.assertRaises(ValueError):
+            run_log.write_run_log(self.folder, [], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
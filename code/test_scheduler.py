@@ -0,0 +1,110 @@
+#!python
+"""Unit tests for the stage scheduler of telemetry frames"""
+
+import unittest
+
+import replay
+import scheduler
+
+
+class FakeClock:
+    """Clock, advanced by stages instead of real time"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self.now = 0.0
+
+
+    def __call__(self):
+        return self.now
+
+
+    def stage(self, seconds):
+        """Returns a stage function, taking the given time"""
+
+        def function():
+            self.now += seconds
+
+        return function
+
+
+class TestScheduler(unittest.TestCase):
+    """Test cases to verify stage rates, shedding and deadlines"""
+
+    def test_parse_rates(self):
+        """Rates are given in frames or in hertz"""
+
+        self.assertEqual(
+            {
+                'update_cost_map': scheduler.Rate(3, 0.0),
+                'create_output_images': scheduler.Rate(1, 0.5)},
+            scheduler.parse_rates(
+                'update_cost_map=3, create_output_images=2hz'))
+
+
+    def test_rates(self):
+        """Stages run every given number of frames or seconds"""
+
+        clock = FakeClock()
+        stages = scheduler.StageScheduler(
+            rates=scheduler.parse_rates('slow=3,display=2hz'),
+            clock=clock)
+
+        for _ in range(12):
+            stages.begin_frame()
+            stages.run('slow', clock.stage(0.0))
+            stages.run('display', clock.stage(0.0))
+            clock.now += 0.1
+            stages.end_frame()
+
+        self.assertEqual(4, stages.runs['slow'])
+        self.assertEqual(8, stages.deferred['slow'])
+        self.assertEqual(3, stages.runs['display'])
+        self.assertEqual(0, stages.missed)
+
+
+    def test_budget(self):
+        """Stages, which do not fit in front of critical ones, are shed, but
+        not in more than max_shed frames in a row"""
+
+        clock = FakeClock()
+        stages = scheduler.StageScheduler(0.010, max_shed=3, clock=clock)
+
+        for _ in range(9):
+            stages.begin_frame()
+            stages.run('classify', clock.stage(0.004), critical=True)
+            stages.run('insets', clock.stage(0.004))
+            stages.run('control', clock.stage(0.004), critical=True)
+            stages.end_frame()
+
+        self.assertEqual(9, stages.runs['classify'])
+        self.assertEqual(9, stages.runs['control'])
+
+        # The first frame measures durations and the guard runs insets in
+        # every fourth frame after that
+        self.assertEqual(3, stages.runs['insets'])
+        self.assertEqual(6, stages.shed['insets'])
+        self.assertEqual(3, stages.missed)
+
+
+    def test_replay(self):
+        """With a budget, too small for any stage, only critical stages run
+        and every frame still chooses a direction"""
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:20]
+        stages = scheduler.StageScheduler(1e-6)
+
+        result = replay.run_replay(
+            replay.FramePrefetcher(records),
+            scheduler=stages)
+
+        self.assertEqual(20, stages.runs['choose_direction'])
+        self.assertEqual(20, stages.runs['decision_step'])
+        self.assertEqual(20, stages.missed)
+        self.assertGreater(stages.shed['update_vision_image'], 0)
+        self.assertIsNotNone(result.rover.decision.nav_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+#!python
+"""Unit tests for the stand-in simulator client"""
+
+import unittest
+
+import numpy as np
+
+import replay
+import sim_client
+from rover_state import RoverState
+from supporting_functions import update_rover
+
+
+class TestSimClient(unittest.TestCase):
+    """Test cases to verify telemetry of the stand-in simulator"""
+
+    def test_telemetry_parses(self):
+        """update_rover() reads the played telemetry like the log record"""
+
+        record = replay.read_log(replay.DEFAULT_LOG)[100]
+        data = sim_client.read_telemetry(replay.DEFAULT_LOG, 101)[100]
+
+        rover, jpeg_bytes = update_rover(RoverState(), data)
+
+        self.assertEqual(record.speed, rover.perception.vel)
+        self.assertEqual([record.xpos, record.ypos], rover.perception.pos)
+        self.assertEqual(record.yaw, rover.perception.yaw_deg)
+        self.assertEqual(record.steer, rover.control.steer)
+
+        with open(record.path, 'rb') as frame_file:
+            self.assertEqual(frame_file.read(), jpeg_bytes)
+
+        np.testing.assert_array_equal(
+            replay.read_frame(record.path),
+            rover.perception.img)
+
+        self.assertEqual(
+            replay.DEFAULT_SAMPLES_TO_FIND,
+            rover.statistics.samples_to_find)
+        self.assertEqual(
+            replay.DEFAULT_SAMPLES_TO_FIND,
+            len(rover.statistics.samples_pos[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
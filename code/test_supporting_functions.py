@@ -0,0 +1,58 @@
+#!python
+"""Unit tests for output routines"""
+
+import copy
+import unittest
+
+import replay
+from supporting_functions import create_output_images, InsetCache
+
+
+class TestSupportingFunctions(unittest.TestCase):
+    """Test cases to verify rendering of inset images"""
+
+    def test_inset_cache_matches(self):
+        """Cached insets, redrawn in dirty regions, are identical to fully
+        rendered ones"""
+
+        cache = InsetCache()
+        mismatches = []
+
+        def on_frame(record, rover):
+            expected = create_output_images(copy.deepcopy(rover))
+            if expected != cache.output_images(rover):
+                mismatches.append(record.path)
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:40]
+        replay.run_replay(replay.FramePrefetcher(records), on_frame=on_frame)
+
+        self.assertEqual([], mismatches)
+        self.assertGreater(cache.encode_seconds, 0.0)
+
+
+    def test_inset_cache_reuse(self):
+        """Unchanged insets and calls within the rate limit period reuse the
+        previous strings"""
+
+        now = [0.0]
+        cache = InsetCache(max_rate=2.0, clock=lambda: now[0])
+
+        records = replay.read_log(replay.DEFAULT_LOG)[:5]
+        rover = replay.run_replay(replay.FramePrefetcher(records)).rover
+
+        strings = cache.output_images(rover)
+        self.assertEqual(2, cache.rendered)
+
+        now[0] = 0.1
+        rover.statistics.vision_image[:] = 0
+        self.assertEqual(strings, cache.output_images(rover))
+        self.assertEqual(1, cache.skipped)
+
+        now[0] = 1.0
+        self.assertEqual(strings[0], cache.output_images(rover)[0])
+        self.assertEqual(3, cache.rendered)
+        self.assertEqual(1, cache.reused)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!python
+"""Unit tests for sparse tiled global maps"""
+
+import unittest
+import numpy as np
+
+import perception
+import planners
+import transformations
+from rover_state import RoverState
+from tiled_map import TiledMap, max_value
+
+
+class TestTiledMap(unittest.TestCase):
+    """Test cases to verify tiled global maps against dense ones"""
+
+    def test_matches_dense_map(self):
+        """Tiled updates and local windows are identical to dense ones inside
+        the dense map bounds"""
+
+        random = np.random.RandomState(0)
+
+        dense = np.zeros((200, 200))
+        tiled = TiledMap(tile_size=32)
+
+        for _ in range(30):
+            local_map = random.uniform(-20.0, 20.0, (
+                transformations.TOP_HEIGHT,
+                transformations.TOP_WIDTH))
+
+            local_map[random.rand(*local_map.shape) < 0.5] = 0.0
+
+            xpos, ypos = random.uniform(40.0, 160.0, 2)
+            yaw = random.uniform(0.0, 360.0)
+
+            loc_2_glob = transformations.local_2_global(xpos, ypos, yaw)
+            glob_2_loc = np.linalg.inv(
+                np.vstack([loc_2_glob, [0.0, 0.0, 1.0]]))[:2, :]
+
+            self.assertEqual(
+                perception.update_global(loc_2_glob, local_map, dense),
+                perception.update_global(loc_2_glob, local_map, tiled))
+
+            np.testing.assert_array_equal(
+                perception.to_local_map(dense, glob_2_loc),
+                perception.to_local_map(tiled, glob_2_loc))
+
+        np.testing.assert_array_equal(dense, tiled.read((0, 0, 200, 200)))
+        self.assertEqual(max_value(dense), max_value(tiled))
+
+
+    def test_allocates_seen_tiles(self):
+        """Only tiles under the local map footprint are allocated, wherever
+        the rover is"""
+
+        tiled = TiledMap(tile_size=64)
+        local_map = np.ones((
+            transformations.TOP_HEIGHT,
+            transformations.TOP_WIDTH))
+
+        for xpos in (-5000.0, 0.0, 100000.0):
+            tiled.update_global(
+                transformations.local_2_global(xpos, 30.0, 0.0),
+                local_map)
+
+        self.assertLessEqual(len(tiled.tiles), 3 * 4)
+        self.assertGreater(tiled.max_value(), 0.0)
+
+        tiled *= 0.5
+        self.assertEqual(0.5, tiled.max_value())
+
+        # Missing tiles do not floor the maximum of allocated ones
+        negative = TiledMap(tile_size=4)
+        negative.accumulate(np.full((4, 4), -3.0), (-4, 8, 0, 12))
+        self.assertEqual(-3.0, negative.max_value())
+        self.assertEqual(0.0, TiledMap().max_value())
+
+
+    def test_cost_window(self):
+        """The cost map grows with explored tiles beyond the simulator world,
+        keeps its costs and is seen from local coordinates at its origin"""
+
+        rover = RoverState(tile_size=64)
+        decision = rover.decision
+
+        decision.cost_map[87, 98] = 200.0
+        rover.map.global_conf_navi.accumulate(
+            np.full((10, 10), 50.0),
+            (-100, 250, -90, 260))
+
+        planners.fit_cost_window(
+            decision,
+            rover.map.global_conf_navi.bounds())
+
+        self.assertEqual((-128, 0, 200, 320), decision.cost_window)
+        self.assertEqual((320, 328), decision.cost_map.shape)
+        self.assertEqual(200.0, decision.cost_map[87, 98 + 128])
+
+        loc_2_glob = transformations.local_2_global(-95.0, 255.0, 0.0)
+        glob_2_loc = np.linalg.inv(
+            np.vstack([loc_2_glob, [0.0, 0.0, 1.0]]))[:2, :]
+
+        decision.cost_map[250:260, 28:38] = 100.0
+        local_cost_map = perception.to_local_map(
+            decision.cost_map,
+            glob_2_loc,
+            decision.cost_window[:2])
+
+        np.testing.assert_array_equal(
+            perception.to_local_map(
+                rover.map.global_conf_navi,
+                glob_2_loc) * 2.0,
+            local_cost_map)
+
+
+if __name__ == '__main__':
+    unittest.main()
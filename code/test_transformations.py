@@ -33,6 +33,83 @@ class TestTransformations(unittest.TestCase):
             [1.0, 1.0, 1.0, 1.0]))
 
 
+    def test_top_source_mask(self):
+        """Pixels outside of the top source mask do not affect the top view"""
+
+        random = np.random.RandomState(0)
+        img = random.uniform(-100.0, 100.0, (images.HEIGHT, images.WIDTH))
+
+        masked = img * transformations.TOP_SOURCE_MASK
+
+        np.testing.assert_array_equal(
+            transformations.perspective_2_top(img),
+            transformations.perspective_2_top(masked))
+
+
+    def test_warp_affine_window(self):
+        """Footprint window of the local map warp is bit-for-bit identical to
+        the full warp, which is zero outside of the window"""
+
+        random = np.random.RandomState(0)
+
+        for _ in range(50):
+            local_map = random.uniform(
+                -300.0, 300.0, (transformations.TOP_HEIGHT,
+                                transformations.TOP_WIDTH))
+
+            local_map[transformations.TOP_CENTER_Y:, :] = 0
+
+            loc_2_glob = transformations.local_2_global(
+                random.uniform(0.0, 200.0),
+                random.uniform(0.0, 200.0),
+                random.uniform(0.0, 360.0))
+
+            full = cv2.warpAffine(local_map, loc_2_glob, (200, 200))
+
+            window = transformations.footprint_window(
+                loc_2_glob, local_map, full.shape)
+
+            x_0, y_0, x_1, y_1 = window
+
+            np.testing.assert_array_equal(
+                full[y_0:y_1, x_0:x_1],
+                transformations.warp_affine_window(
+                    local_map, loc_2_glob, window))
+
+            full[y_0:y_1, x_0:x_1] = 0
+            self.assertFalse(full.any())
+
+
+    def test_polar_index(self):
+        """Polar index bins match np.histogram of pixel angles, and rays of
+        the bins match the direction dot products"""
+
+        dirs = transformations.ROVER_CONF_DIRS
+        angles = np.arctan2(dirs[:, 1], dirs[:, 0])
+
+        weights = np.random.RandomState(0).uniform(0.0, 1.0, len(angles))
+        hist, bin_edges = np.histogram(
+            angles,
+            transformations.ANGLE_BINS,
+            weights=weights)
+
+        np.testing.assert_array_equal(
+            bin_edges,
+            transformations.ANGLE_BIN_EDGES)
+        np.testing.assert_array_equal(hist, np.bincount(
+            transformations.ANGLE_BIN_IDX,
+            weights=weights,
+            minlength=transformations.ANGLE_BINS))
+
+        for bin_idx in (0, 17, 71):
+            angle = 0.5 * (bin_edges[bin_idx] + bin_edges[bin_idx + 1])
+            nav_dir = np.array([np.cos(angle), np.sin(angle)])
+
+            np.testing.assert_array_equal(
+                np.flatnonzero(dirs.dot(nav_dir) > transformations.RAY_COS),
+                transformations.ray_pixels(nav_dir))
+
+
     def test_local_2_global(self):
         """Points are correctly transformed from the local into
         map reference frames"""
@@ -70,6 +147,50 @@ class TestTransformations(unittest.TestCase):
         self.assertGreater(correlation, 0.6)
 
 
+    def test_use_scale(self):
+        """Half scale top view of a downsampled camera image lands on the
+        same global map pixels as the full resolution one, and switching
+        back restores the tables"""
+
+        img = images.ROCK1.astype(np.float32)
+
+        def global_view():
+            top = transformations.perspective_2_top(
+                transformations.scale_camera_image(img))
+
+            return cv2.warpAffine(
+                top,
+                transformations.local_2_global(100.0, 100.0, 30.0),
+                (200, 200))
+
+        expected = global_view()
+        rover_conf_dist = transformations.ROVER_CONF_DIST.copy()
+
+        try:
+            transformations.use_scale(0.5)
+
+            self.assertEqual(
+                (80, 160),
+                (transformations.TOP_HEIGHT, transformations.TOP_WIDTH))
+            self.assertEqual(80 * 160, len(transformations.ROVER_CONF_DIST))
+            self.assertEqual(15, transformations.NEAR_DISTANCE)
+
+            actual = global_view()
+        finally:
+            transformations.use_scale(1.0)
+
+        correlation = cv2.matchTemplate(
+            actual,
+            expected,
+            cv2.TM_CCORR_NORMED)[0][0]
+
+        self.assertGreater(correlation, 0.95)
+
+        np.testing.assert_array_equal(
+            rover_conf_dist,
+            transformations.ROVER_CONF_DIST)
+
+
     def test_warp_angle180(self):
         """Test angle warping algorithms"""
 
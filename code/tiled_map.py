@@ -0,0 +1,225 @@
+#!python
+"""Sparse global confidence map, made of square tiles, which are allocated
+only when the rover sees them. Memory and per-frame cost scale with the
+explored area rather than the world size"""
+
+import numpy as np
+
+import precision
+import transformations
+
+DEFAULT_TILE_SIZE = 64
+
+
+class TiledMap:
+    """Unbounded 2D map of lazily allocated tiles. Missing tiles read as
+    zeros. Map coordinates may be negative"""
+
+    def __init__(self, tile_size=DEFAULT_TILE_SIZE, dtype=np.float64):
+        self.tile_size = tile_size
+        self.dtype = dtype
+        self.tiles = {}  # (tile row, tile column) -> tile array
+
+
+    def __tile_ranges(self, window):
+        """Yields tile keys and the window slices of tiles, intersecting the
+        window (x0, y0, x1, y1), together with the slices of the tiles"""
+
+        x_0, y_0, x_1, y_1 = window
+        size = self.tile_size
+
+        for tile_row in range(y_0 // size, (y_1 - 1) // size + 1):
+            top = max(y_0, tile_row * size)
+            bottom = min(y_1, (tile_row + 1) * size)
+
+            for tile_col in range(x_0 // size, (x_1 - 1) // size + 1):
+                left = max(x_0, tile_col * size)
+                right = min(x_1, (tile_col + 1) * size)
+
+                yield (
+                    (tile_row, tile_col),
+                    (slice(top - y_0, bottom - y_0),
+                     slice(left - x_0, right - x_0)),
+                    (slice(top - tile_row * size, bottom - tile_row * size),
+                     slice(left - tile_col * size, right - tile_col * size)))
+
+
+    def read(self, window):
+        """Returns a dense copy of the window (x0, y0, x1, y1)"""
+
+        x_0, y_0, x_1, y_1 = window
+        result = np.zeros((y_1 - y_0, x_1 - x_0), self.dtype)
+
+        for key, window_part, tile_part in self.__tile_ranges(window):
+            tile = self.tiles.get(key)
+            if tile is not None:
+                result[window_part] = tile[tile_part]
+
+        return result
+
+
+    def accumulate(self, values, window, low=-255.0, high=255.0):
+        """Adds dense values of the window (x0, y0, x1, y1) to the map and
+        clips the sums. Tiles, which would receive only zeros, are not
+        allocated"""
+
+        # pylint: disable=too-many-arguments
+
+        for key, window_part, tile_part in self.__tile_ranges(window):
+            part = values[window_part]
+            tile = self.tiles.get(key)
+
+            if tile is None:
+                if not part.any():
+                    continue
+
+                tile = np.zeros((self.tile_size, self.tile_size), self.dtype)
+                self.tiles[key] = tile
+
+            precision.accumulate(tile[tile_part], part, low, high)
+
+
+    def update_global(self, loc_2_glob, local_map):
+        """Tile-aware counterpart of perception.update_global(): warps only
+        the footprint of local_map and accumulates it into the tiles. Returns
+        the window (x0, y0, x1, y1) or None if nothing has changed"""
+
+        window = transformations.footprint_window(loc_2_glob, local_map)
+
+        if window is None:
+            return None
+
+        self.accumulate(
+            transformations.warp_affine_window(local_map, loc_2_glob, window),
+            window)
+
+        return window
+
+
+    def to_local(self, glob_2_loc, width, height):
+        """Tile-aware counterpart of perception.to_local_map(): reads only the
+        window of tiles under the local map and warps it. Within the bounds of
+        a dense map, the result is identical to warping the dense map"""
+
+        loc_2_glob = transformations.invert_affine(glob_2_loc)
+
+        corners = np.array([
+            [0.0, width, width, 0.0],
+            [0.0, 0.0, height, height],
+            [1.0, 1.0, 1.0, 1.0]])
+
+        warped = np.reshape(loc_2_glob, (2, 3)).dot(corners)
+
+        # Bilinear interpolation reads one more pixel to the right and bottom,
+        # one more pixel covers rounding of fixed point coordinates
+        x_0 = int(np.floor(np.min(warped[0]))) - 1
+        y_0 = int(np.floor(np.min(warped[1]))) - 1
+        x_1 = int(np.ceil(np.max(warped[0]))) + 2
+        y_1 = int(np.ceil(np.max(warped[1]))) + 2
+
+        return transformations.warp_affine_window(
+            self.read((x_0, y_0, x_1, y_1)),
+            glob_2_loc,
+            (0, 0, width, height),
+            origin=(x_0, y_0))
+
+
+    def __imul__(self, factor):
+        for tile in self.tiles.values():
+            precision.scale(tile, factor)
+
+        return self
+
+
+    def max_value(self):
+        """Returns the maximum value of allocated tiles or 0.0, which missing
+        tiles read as, if no tiles are allocated"""
+
+        if not self.tiles:
+            return 0.0
+
+        return max(float(tile.max()) for tile in self.tiles.values())
+
+
+    def bounds(self):
+        """Returns the window (x0, y0, x1, y1), covering allocated tiles, or
+        None if no tiles are allocated"""
+
+        if not self.tiles:
+            return None
+
+        rows, cols = zip(*self.tiles)
+        size = self.tile_size
+
+        return (
+            min(cols) * size,
+            min(rows) * size,
+            (max(cols) + 1) * size,
+            (max(rows) + 1) * size)
+
+
+    def copy(self):
+        """Returns a deep copy of the map"""
+
+        result = TiledMap(self.tile_size, self.dtype)
+        result.tiles = {key: tile.copy() for key, tile in self.tiles.items()}
+        return result
+
+
+    @property
+    def nbytes(self):
+        """Returns the memory, occupied by allocated tiles"""
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+
+def read_window(global_map, window):
+    """Returns the window (x0, y0, x1, y1) of the map, either dense or tiled,
+    as a dense array. Dense maps return a view if the window lies inside"""
+
+    if isinstance(global_map, TiledMap):
+        return global_map.read(window)
+
+    x_0, y_0, x_1, y_1 = window
+    height, width = global_map.shape[:2]
+
+    if x_0 >= 0 and y_0 >= 0 and x_1 <= width and y_1 <= height:
+        return global_map[y_0:y_1, x_0:x_1]
+
+    result = np.zeros((y_1 - y_0, x_1 - x_0), global_map.dtype)
+
+    left, top = max(x_0, 0), max(y_0, 0)
+    right, bottom = min(x_1, width), min(y_1, height)
+
+    if left < right and top < bottom:
+        result[top - y_0:bottom - y_0, left - x_0:right - x_0] = \
+            global_map[top:bottom, left:right]
+
+    return result
+
+
+def max_value(global_map):
+    """Returns the maximum value of the map, either dense or tiled"""
+
+    if isinstance(global_map, TiledMap):
+        return global_map.max_value()
+
+    return float(np.max(global_map))
+
+
+def main():
+    """Shows results of what the module does if run as a separate application"""
+
+    tiled = TiledMap()
+    patch = np.ones((100, 100))
+
+    for xpos in range(0, 2000, 250):
+        loc_2_glob = transformations.local_2_global(xpos, 1000.0, 45.0)
+        tiled.update_global(loc_2_glob, patch)
+
+    print("Tiles: {}, memory: {} KB".format(
+        len(tiled.tiles),
+        tiled.nbytes // 1024))
+
+
+if __name__ == '__main__':
+    main()
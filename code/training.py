@@ -0,0 +1,111 @@
+#!python
+"""Trains sklearn color classifiers on calibration images and exports their
+fitted parameters for the NumPy evaluators of classifiers module"""
+
+import numpy as np
+
+# pylint: disable=import-error
+import matplotlib.image as mpimg
+
+from sklearn.utils import shuffle
+from sklearn.naive_bayes import GaussianNB
+from sklearn.mixture import GaussianMixture
+
+import images
+
+
+def training_samples():
+    """Load all available training samples"""
+
+    result = []
+    for img_path, mask in images.calibration_files():
+        img = mpimg.imread(img_path)
+        label_img = mpimg.imread(mask)
+
+        result.append((img, label_img))
+
+    return result
+
+
+def training_set():
+    """Returns shuffled colors of labelled pixels with rocks and navigatable
+    flags"""
+
+    samples = training_samples()
+
+    non_empty = np.concatenate([
+        np.logical_or(
+            y[:, :, 0] != 0,
+            np.logical_or(
+                y[:, :, 1] != 0,
+                y[:, :, 2] != 0)).ravel() for _, y in samples])
+
+    training_x = np.concatenate([
+        x.reshape(-1, 3) for x, _ in samples])
+
+    training_rocks = np.concatenate([
+        (y[:, :, 0] != 0).reshape(-1) for _, y in samples])
+
+    training_navi = np.concatenate([
+        (y[:, :, 1] != 0).reshape(-1) for _, y in samples])
+
+    return shuffle(
+        training_x[non_empty],
+        training_rocks[non_empty],
+        training_navi[non_empty],
+        random_state=0)
+
+
+def fit_navi(training_x, training_navi):
+    """Fits naive Bayesian classifier of navigatable pixels"""
+
+    cls = GaussianNB()
+    cls.fit(training_x, training_navi)
+    return cls
+
+
+def fit_rocks(training_x, training_rocks):
+    """Fits Gaussian mixtures of rock and not rock pixel colors"""
+
+    cls = GaussianMixture(random_state=0).fit(training_x[training_rocks])
+
+    means_init = np.array([[0.0, 0.0, 0.0], [255.0, 255.0, 255.0]])
+
+    not_cls = GaussianMixture(
+        2,
+        random_state=0,
+        means_init=means_init)
+
+    not_cls.fit(training_x[~training_rocks])
+
+    return cls, not_cls
+
+
+def mixture_parameters(prefix, mixture):
+    """Exports parameters of a fitted GaussianMixture with keys, starting with
+    prefix"""
+
+    return {
+        prefix + "_weights": mixture.weights_,
+        prefix + "_means": mixture.means_,
+        prefix + "_precisions_cholesky": mixture.precisions_cholesky_}
+
+
+def fit_parameters():
+    """Trains all classifiers and returns their parameters as a dictionary of
+    arrays"""
+
+    training_x, training_rocks, training_navi = training_set()
+
+    navi = fit_navi(training_x, training_navi)
+    rocks, not_rocks = fit_rocks(training_x, training_rocks)
+
+    params = {
+        "navi_theta": navi.theta_,
+        "navi_var": navi.var_,
+        "navi_class_prior": navi.class_prior_}
+
+    params.update(mixture_parameters("rocks", rocks))
+    params.update(mixture_parameters("not_rocks", not_rocks))
+
+    return params
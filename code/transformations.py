@@ -4,43 +4,110 @@
 import numpy as np
 
 # pylint: disable=import-error
-import matplotlib.pyplot as plt
 import cv2
 
-from images import WIDTH, HEIGHT, GRID
+import cache
+import images
+from images import WIDTH, HEIGHT
 
-PIXELS_PER_METER = 10.0
-BOTTOM_OFFSET = 6
+# Resolution of perception relative to the simulator camera, see use_scale().
+# Camera images are downsampled and the local top view is made coarser by it
+SCALE = 1.0
 
-POINTS_PERSPECTIVE = np.float32([
+CAMERA_WIDTH = WIDTH
+CAMERA_HEIGHT = HEIGHT
+
+FULL_PIXELS_PER_METER = 10.0
+FULL_BOTTOM_OFFSET = 6
+
+PIXELS_PER_METER = FULL_PIXELS_PER_METER
+BOTTOM_OFFSET = FULL_BOTTOM_OFFSET
+
+FULL_POINTS_PERSPECTIVE = np.float32([
     [14, 140],
     [301, 140],
     [200, 96],
     [118, 96]
 ])
 
-TOP_WIDTH = WIDTH
-TOP_HEIGHT = HEIGHT
+POINTS_PERSPECTIVE = FULL_POINTS_PERSPECTIVE
+
+TOP_WIDTH = CAMERA_WIDTH
+TOP_HEIGHT = CAMERA_HEIGHT
 TOP_CENTER_X = TOP_WIDTH // 2
 TOP_CENTER_Y = TOP_HEIGHT // 2
 
-POINTS_TOP = np.float32([
-    [TOP_CENTER_X - 0.5 * PIXELS_PER_METER,
-     TOP_CENTER_Y + 0.5 * PIXELS_PER_METER - BOTTOM_OFFSET],
 
-    [TOP_CENTER_X + 0.5 * PIXELS_PER_METER,
-     TOP_CENTER_Y + 0.5 * PIXELS_PER_METER - BOTTOM_OFFSET],
+def prepare_points_top():
+    """Returns top view points of the square meter, which POINTS_PERSPECTIVE
+    mark in the camera image"""
 
-    [TOP_CENTER_X + 0.5 * PIXELS_PER_METER,
-     TOP_CENTER_Y - 0.5 * PIXELS_PER_METER - BOTTOM_OFFSET],
+    return np.float32([
+        [TOP_CENTER_X - 0.5 * PIXELS_PER_METER,
+         TOP_CENTER_Y + 0.5 * PIXELS_PER_METER - BOTTOM_OFFSET],
 
-    [TOP_CENTER_X - 0.5 * PIXELS_PER_METER,
-     TOP_CENTER_Y - 0.5 * PIXELS_PER_METER - BOTTOM_OFFSET],
-])
+        [TOP_CENTER_X + 0.5 * PIXELS_PER_METER,
+         TOP_CENTER_Y + 0.5 * PIXELS_PER_METER - BOTTOM_OFFSET],
+
+        [TOP_CENTER_X + 0.5 * PIXELS_PER_METER,
+         TOP_CENTER_Y - 0.5 * PIXELS_PER_METER - BOTTOM_OFFSET],
+
+        [TOP_CENTER_X - 0.5 * PIXELS_PER_METER,
+         TOP_CENTER_Y - 0.5 * PIXELS_PER_METER - BOTTOM_OFFSET],
+    ])
+
+
+POINTS_TOP = prepare_points_top()
 
 PERSPECTIVE_2_TOP = cv2.getPerspectiveTransform(POINTS_PERSPECTIVE, POINTS_TOP)
 
 
+def prepare_top_source_mask():
+    """Marks perspective view pixels, which can affect the retained half of
+    the top view through bilinear interpolation of cv2.warpPerspective()"""
+
+    top_rows, top_cols = np.indices((TOP_CENTER_Y, TOP_WIDTH))
+
+    top_points = np.vstack([
+        top_cols.ravel(),
+        top_rows.ravel(),
+        np.ones(top_rows.size)])
+
+    src_points = np.linalg.inv(PERSPECTIVE_2_TOP).dot(top_points)
+    src_cols = np.floor(src_points[0] / src_points[2]).astype(np.int64)
+    src_rows = np.floor(src_points[1] / src_points[2]).astype(np.int64)
+
+    mask = np.zeros((CAMERA_HEIGHT, CAMERA_WIDTH), np.bool_)
+
+    # Bilinear interpolation reads a 2x2 neighbourhood. One more pixel on
+    # each side covers the rounding of OpenCV fixed point coordinates
+    for row_offset in range(-1, 3):
+        for col_offset in range(-1, 3):
+            rows = src_rows + row_offset
+            cols = src_cols + col_offset
+            inside = (rows >= 0) & (rows < CAMERA_HEIGHT) & \
+                (cols >= 0) & (cols < CAMERA_WIDTH)
+            mask[rows[inside], cols[inside]] = True
+
+    return mask
+
+
+TOP_SOURCE_MASK = prepare_top_source_mask()
+TOP_SOURCE_IDX = np.flatnonzero(TOP_SOURCE_MASK)
+
+
+def scale_camera_image(img):
+    """Returns the camera image, downsampled to the perception scale"""
+
+    if img.shape[:2] == (CAMERA_HEIGHT, CAMERA_WIDTH):
+        return img
+
+    return cv2.resize(
+        img,
+        (CAMERA_WIDTH, CAMERA_HEIGHT),
+        interpolation=cv2.INTER_AREA)
+
+
 def perspective_2_top(img):
     """Transforms from perspective view of the rover into the top view"""
 
@@ -54,9 +121,16 @@ def perspective_2_top(img):
     return warped
 
 
-LOCAL_2_ROVER = np.array([
-    [0.0, -1.0, TOP_CENTER_Y],
-    [-1.0, 0.0, TOP_CENTER_X]], np.float32)
+def prepare_local_2_rover():
+    """Returns 2x3 affine transformation from local confidence map pixels
+    into the rover reference frame in the same pixel units"""
+
+    return np.array([
+        [0.0, -1.0, TOP_CENTER_Y],
+        [-1.0, 0.0, TOP_CENTER_X]], np.float32)
+
+
+LOCAL_2_ROVER = prepare_local_2_rover()
 
 
 def local_2_global(xpos, ypos, yaw_deg):
@@ -76,24 +150,313 @@ def local_2_global(xpos, ypos, yaw_deg):
     return rover_2_global.dot(local_2_rover_3x3)
 
 
-IMG_ROWS, IMG_COLS = np.indices((TOP_HEIGHT, TOP_WIDTH))
-IMG_ROWS = IMG_ROWS.ravel()
-IMG_COLS = IMG_COLS.ravel()
-IMG_ONES = np.ones_like(IMG_COLS)
+def prepare_rover_conf():
+    """Calculates rover reference frame coordinates and directions of all the
+    local confidence map pixels"""
+
+    img_rows, img_cols = np.indices((TOP_HEIGHT, TOP_WIDTH))
+    img_rows = img_rows.ravel()
+    img_cols = img_cols.ravel()
+    img_ones = np.ones_like(img_cols)
+
+    local_conf_points = np.vstack([
+        img_cols,
+        img_rows,
+        img_ones]).astype(np.float32).T
+
+    rover_conf_points = LOCAL_2_ROVER.dot(local_conf_points.T).T
+
+    with np.errstate(all='ignore'):
+        rover_conf_dirs = rover_conf_points / np.linalg.norm(
+            rover_conf_points,
+            axis=1).reshape(-1, 1)
+
+    np.nan_to_num(rover_conf_dirs, False)
+
+    return {
+        'rover_conf_points': rover_conf_points,
+        'rover_conf_dirs': rover_conf_dirs}
+
+
+def scale_cache_name(name):
+    """Returns the cache name of arrays, precomputed for the current scale"""
+    return name if SCALE == 1.0 else "{}_scale{:g}".format(name, SCALE)
+
+
+ROVER_CONF = cache.cached_arrays(
+    scale_cache_name('transformations'),
+    [__file__, images.GRID_PATH],
+    prepare_rover_conf)
+
+ROVER_CONF_POINTS = ROVER_CONF['rover_conf_points']
+ROVER_CONF_DIRS = ROVER_CONF['rover_conf_dirs']
+
+# Steering histogram bins of the local confidence map pixel angles
+ANGLE_BINS = 72
+
+# Pixels, which direction cosine with a steering direction exceeds the
+# threshold, lie along that direction
+RAY_COS = 0.8
+
+# Obstacles on the way to rocks are only checked closer than the distance
+FULL_NEAR_DISTANCE = 30
+NEAR_DISTANCE = FULL_NEAR_DISTANCE
+
+
+def bin_direction(angle):
+    """Returns the unit direction of the steering angle"""
+    return np.array([np.cos(angle), np.sin(angle)])
+
+
+def prepare_polar_index():
+    """Calculates range and steering histogram bin of each local confidence
+    map pixel, pixels along the direction of each bin and pixels near the
+    rover"""
+
+    distances = np.linalg.norm(ROVER_CONF_POINTS, axis=1)
+    angles = np.arctan2(ROVER_CONF_DIRS[:, 1], ROVER_CONF_DIRS[:, 0])
+
+    # The same bins and pixel assignment as np.histogram(angles, ANGLE_BINS)
+    bin_edges = np.histogram_bin_edges(angles, ANGLE_BINS)
+    angle_bins = np.searchsorted(bin_edges, angles, side='right') - 1
+    np.minimum(angle_bins, ANGLE_BINS - 1, out=angle_bins)
+
+    ray_pixels = []
+    ray_offsets = [0]
+
+    for bin_idx in range(ANGLE_BINS):
+        angle = 0.5 * (bin_edges[bin_idx] + bin_edges[bin_idx + 1])
+        pixels = np.flatnonzero(
+            ROVER_CONF_DIRS.dot(bin_direction(angle)) > RAY_COS)
+
+        ray_pixels.append(pixels)
+        ray_offsets.append(ray_offsets[-1] + len(pixels))
+
+    return {
+        'rover_conf_dist': distances,
+        'angle_bins': angle_bins,
+        'angle_bin_edges': bin_edges,
+        'ray_pixels': np.concatenate(ray_pixels).astype(np.int32),
+        'ray_offsets': np.array(ray_offsets),
+        'near_idx': np.flatnonzero(distances < NEAR_DISTANCE)}
+
+
+POLAR_INDEX = cache.cached_arrays(
+    scale_cache_name('polar_index'),
+    [__file__, images.GRID_PATH],
+    prepare_polar_index)
+
+ROVER_CONF_DIST = POLAR_INDEX['rover_conf_dist']
+ANGLE_BIN_IDX = POLAR_INDEX['angle_bins']
+ANGLE_BIN_EDGES = POLAR_INDEX['angle_bin_edges']
+NEAR_IDX = POLAR_INDEX['near_idx']
+
+
+def prepare_bin_directions():
+    """Returns bin directions of the steering histogram, looked up by the
+    exact direction components"""
 
-LOCAL_CONF_POINTS = np.vstack([
-    IMG_COLS,
-    IMG_ROWS,
-    IMG_ONES]).astype(np.float32).T
+    return {
+        tuple(bin_direction(
+            0.5 * (ANGLE_BIN_EDGES[bin_idx] + ANGLE_BIN_EDGES[bin_idx + 1]))):
+        bin_idx
+        for bin_idx in range(ANGLE_BINS)}
 
-ROVER_CONF_POINTS = LOCAL_2_ROVER.dot(LOCAL_CONF_POINTS.T).T
 
-with np.errstate(all='ignore'):
-    ROVER_CONF_DIRS = ROVER_CONF_POINTS / np.linalg.norm(
-        ROVER_CONF_POINTS,
-        axis=1).reshape(-1, 1)
+BIN_DIRECTIONS = prepare_bin_directions()
 
-np.nan_to_num(ROVER_CONF_DIRS, False)
+
+def scaled_pixels(count, dimensions=2):
+    """Returns the number of local top view pixels at the current scale,
+    which corresponds to count pixels of the full resolution. Lengths have
+    one dimension and areas have two"""
+
+    return count * SCALE ** dimensions
+
+
+def use_scale(scale=1.0):
+    """Switches camera images and the local top view to the scale relative
+    to the simulator camera, regenerating the geometry and the precomputed
+    tables. Global maps keep their resolution of a pixel per meter. See also
+    perception.use_scale(), which regenerates its tables as well"""
+
+    # pylint: disable=global-statement, invalid-name
+    global SCALE, CAMERA_WIDTH, CAMERA_HEIGHT, PIXELS_PER_METER, \
+        BOTTOM_OFFSET, POINTS_PERSPECTIVE, TOP_WIDTH, TOP_HEIGHT, \
+        TOP_CENTER_X, TOP_CENTER_Y, POINTS_TOP, PERSPECTIVE_2_TOP, \
+        TOP_SOURCE_MASK, TOP_SOURCE_IDX, LOCAL_2_ROVER, ROVER_CONF, \
+        ROVER_CONF_POINTS, ROVER_CONF_DIRS, NEAR_DISTANCE, POLAR_INDEX, \
+        ROVER_CONF_DIST, ANGLE_BIN_IDX, ANGLE_BIN_EDGES, NEAR_IDX, \
+        BIN_DIRECTIONS
+
+    SCALE = float(scale)
+
+    CAMERA_WIDTH = int(round(WIDTH * SCALE))
+    CAMERA_HEIGHT = int(round(HEIGHT * SCALE))
+
+    PIXELS_PER_METER = FULL_PIXELS_PER_METER * SCALE
+    BOTTOM_OFFSET = FULL_BOTTOM_OFFSET * SCALE
+
+    # Pixel centers of the full resolution image in the scaled one
+    POINTS_PERSPECTIVE = np.float32(
+        (FULL_POINTS_PERSPECTIVE + 0.5) * SCALE - 0.5)
+
+    TOP_WIDTH = CAMERA_WIDTH
+    TOP_HEIGHT = CAMERA_HEIGHT
+    TOP_CENTER_X = TOP_WIDTH // 2
+    TOP_CENTER_Y = TOP_HEIGHT // 2
+
+    POINTS_TOP = prepare_points_top()
+    PERSPECTIVE_2_TOP = cv2.getPerspectiveTransform(
+        POINTS_PERSPECTIVE,
+        POINTS_TOP)
+
+    TOP_SOURCE_MASK = prepare_top_source_mask()
+    TOP_SOURCE_IDX = np.flatnonzero(TOP_SOURCE_MASK)
+
+    LOCAL_2_ROVER = prepare_local_2_rover()
+
+    ROVER_CONF = cache.cached_arrays(
+        scale_cache_name('transformations'),
+        [__file__, images.GRID_PATH],
+        prepare_rover_conf)
+
+    ROVER_CONF_POINTS = ROVER_CONF['rover_conf_points']
+    ROVER_CONF_DIRS = ROVER_CONF['rover_conf_dirs']
+
+    NEAR_DISTANCE = scaled_pixels(FULL_NEAR_DISTANCE, 1)
+
+    POLAR_INDEX = cache.cached_arrays(
+        scale_cache_name('polar_index'),
+        [__file__, images.GRID_PATH],
+        prepare_polar_index)
+
+    ROVER_CONF_DIST = POLAR_INDEX['rover_conf_dist']
+    ANGLE_BIN_IDX = POLAR_INDEX['angle_bins']
+    ANGLE_BIN_EDGES = POLAR_INDEX['angle_bin_edges']
+    NEAR_IDX = POLAR_INDEX['near_idx']
+
+    BIN_DIRECTIONS = prepare_bin_directions()
+
+
+def ray_pixels(nav_dir, min_cos=RAY_COS):
+    """Returns indices of local confidence map pixels, which direction cosine
+    with nav_dir exceeds min_cos. Directions of steering histogram bins are
+    looked up in the polar index"""
+
+    bin_idx = BIN_DIRECTIONS.get(tuple(nav_dir))
+
+    if bin_idx is None or min_cos != RAY_COS:
+        return np.flatnonzero(ROVER_CONF_DIRS.dot(nav_dir) > min_cos)
+
+    offsets = POLAR_INDEX['ray_offsets']
+    return POLAR_INDEX['ray_pixels'][offsets[bin_idx]:offsets[bin_idx + 1]]
+
+
+# Fixed point parameters of cv2.warpAffine() with bilinear interpolation
+INTER_BITS = 5
+INTER_TAB_SIZE = 1 << INTER_BITS
+AB_BITS = 10
+AB_SCALE = 1 << AB_BITS
+
+
+def invert_affine(matrix):
+    """Inverts 2x3 affine matrix with the same floating point operations as
+    cv2.warpAffine() does"""
+
+    m_00, m_01, m_02 = matrix[0]
+    m_10, m_11, m_12 = matrix[1]
+
+    det = m_00 * m_11 - m_01 * m_10
+    det = 1.0 / det if det != 0 else 0.0
+
+    a_00 = m_11 * det
+    a_01 = m_01 * -det
+    a_10 = m_10 * -det
+    a_11 = m_00 * det
+
+    return (
+        a_00, a_01, -a_00 * m_02 - a_01 * m_12,
+        a_10, a_11, -a_10 * m_02 - a_11 * m_12)
+
+
+def warp_affine_window(src, matrix, window, origin=(0, 0)):
+    """Returns the window (x0, y0, x1, y1) of cv2.warpAffine(src, matrix, ...)
+    output without warping the rest of it. The fixed point source coordinates
+    are calculated exactly like cv2.warpAffine() does, so the result is
+    bit-for-bit identical to the corresponding part of the full warp. If src
+    is only a patch of the source image, origin is its top left corner"""
+
+    x_0, y_0, x_1, y_1 = window
+    m_00, m_01, m_02, m_10, m_11, m_12 = invert_affine(matrix)
+
+    cols = np.arange(x_0, x_1, dtype=np.float64)
+    rows = np.arange(y_0, y_1, dtype=np.float64)
+
+    round_delta = AB_SCALE // INTER_TAB_SIZE // 2
+    shift = AB_BITS - INTER_BITS
+
+    x_delta = np.rint(m_00 * cols * AB_SCALE).astype(np.int32)
+    y_delta = np.rint(m_10 * cols * AB_SCALE).astype(np.int32)
+
+    x_row = np.rint((m_01 * rows + m_02) * AB_SCALE).astype(np.int32)
+    y_row = np.rint((m_11 * rows + m_12) * AB_SCALE).astype(np.int32)
+
+    x_fixed = (x_row[:, np.newaxis] + round_delta + x_delta) >> shift
+    y_fixed = (y_row[:, np.newaxis] + round_delta + y_delta) >> shift
+
+    x_src = np.clip((x_fixed >> INTER_BITS) - origin[0], -32768, 32767)
+    y_src = np.clip((y_fixed >> INTER_BITS) - origin[1], -32768, 32767)
+    coords = np.dstack((x_src, y_src)).astype(np.int16)
+
+    alpha = (
+        (y_fixed & (INTER_TAB_SIZE - 1)) * INTER_TAB_SIZE
+        + (x_fixed & (INTER_TAB_SIZE - 1))).astype(np.uint16)
+
+    return cv2.remap(
+        src,
+        coords,
+        alpha,
+        cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_CONSTANT)
+
+
+def footprint_window(matrix, local_map, shape=None):
+    """Returns the window (x0, y0, x1, y1) of the map of the given shape,
+    which bounds all non-zero pixels of local_map warped by matrix, or None if
+    there are no such pixels. If shape is None, the map is unbounded"""
+
+    col, row, width, height = cv2.boundingRect(
+        (local_map != 0).view(np.uint8))
+
+    if width == 0 or height == 0:
+        return None
+
+    # Bilinear interpolation spreads each pixel by one pixel around it
+    left, top = col - 1, row - 1
+    right, bottom = col + width, row + height
+
+    corners = np.array([
+        [left, right, right, left],
+        [top, top, bottom, bottom],
+        [1.0, 1.0, 1.0, 1.0]])
+
+    warped = np.asarray(matrix).dot(corners)
+
+    # One more pixel covers rounding of fixed point coordinates
+    x_0 = int(np.floor(np.min(warped[0]))) - 1
+    y_0 = int(np.floor(np.min(warped[1]))) - 1
+    x_1 = int(np.ceil(np.max(warped[0]))) + 2
+    y_1 = int(np.ceil(np.max(warped[1]))) + 2
+
+    if shape is not None:
+        x_0, y_0 = max(x_0, 0), max(y_0, 0)
+        x_1, y_1 = min(x_1, shape[1]), min(y_1, shape[0])
+
+    if x_0 >= x_1 or y_0 >= y_1:
+        return None
+
+    return x_0, y_0, x_1, y_1
 
 
 def warp_angle180(angle_deg):
@@ -113,12 +476,15 @@ def warp_angle180(angle_deg):
 def main():
     """Shows results of what the module does if run as a separate application"""
 
+    # pylint: disable=import-error
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(6, 9))
 
     plt.subplot(311)
-    plt.imshow(GRID)
+    plt.imshow(images.GRID)
 
-    top_view = perspective_2_top(GRID)
+    top_view = perspective_2_top(images.GRID)
     plt.subplot(312)
     plt.imshow(top_view)
 